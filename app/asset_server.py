@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import mimetypes
+import mmap
+import zlib
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .settings import settings
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+# Precompressed siblings looked up next to each asset, in preference order.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+@dataclass
+class Variant:
+    path: Path
+    size: int
+    etag: str
+    data: Optional[mmap.mmap] = None
+
+@dataclass
+class Asset:
+    file_id: str
+    filename: str
+    media_type: str
+    last_modified: str
+    mtime: float
+    crc32: int
+    sha256: str
+    identity: Variant
+    encoded: Dict[str, Variant] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return self.identity.size
+
+    @property
+    def etag(self) -> str:
+        return self.identity.etag
+
+def _digest(path: Path) -> Tuple[str, int]:
+    h = hashlib.sha256()
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return h.hexdigest(), crc
+
+def _variant(path: Path, etag: str) -> Variant:
+    v = Variant(path=path, size=path.stat().st_size, etag=etag)
+    if 0 < v.size <= settings.ASSET_MMAP_MAX_BYTES:
+        with open(path, "rb") as f:
+            v.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return v
+
+def load_asset(file_id: str, path: Path, filename: str) -> Asset:
+    sha, crc = _digest(path)
+    st = path.stat()
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    asset = Asset(
+        file_id=file_id,
+        filename=filename,
+        media_type=media_type,
+        last_modified=formatdate(st.st_mtime, usegmt=True),
+        mtime=st.st_mtime,
+        crc32=crc,
+        sha256=sha,
+        identity=_variant(path, f'"{sha[:32]}"'),
+    )
+    for encoding, suffix in ENCODINGS:
+        p = path.with_name(path.name + suffix)
+        if p.is_file():
+            asset.encoded[encoding] = _variant(p, f'"{sha[:32]}-{encoding}"')
+    return asset
+
+def iter_chunks(variant: Variant) -> Iterator[bytes]:
+    """The variant's bytes in CHUNK_SIZE pieces, from its mmap or from disk (blocking)."""
+    if variant.data is not None:
+        for offset in range(0, variant.size, CHUNK_SIZE):
+            yield variant.data[offset:offset + CHUNK_SIZE]
+        return
+    with open(variant.path, "rb") as f:
+        yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+class AssetIndex:
+    """Size, mtime, ETag and CRC of every served file, computed once at startup."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.assets: Dict[str, Asset] = {}
+
+    def load(self, files: Dict[str, Dict[str, str]]) -> None:
+        assets: Dict[str, Asset] = {}
+        for file_id, meta in files.items():
+            path = self.root / meta["filename"]
+            if not path.is_file():
+                log.warning("premium asset %s missing: %s", file_id, path)
+                continue
+            assets[file_id] = load_asset(file_id, path, meta["filename"])
+        # Old maps are not closed here: a response may still be reading one.
+        # Each closes when its last reference goes.
+        self.assets = assets
+
+    def get(self, file_id: str) -> Optional[Asset]:
+        return self.assets.get(file_id)
+
+def etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison.
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the inclusive (start, end) of a single byte range, or None to ignore the header.
+
+    Multi-range requests are answered with the full body, which RFC 9110 allows.
+    """
+    unit, _, spec = header.partition("=")
+    first, sep, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not sep or not (first or last):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise RangeNotSatisfiable()
+        return start, min(int(last), size - 1) if last else size - 1
+    n = int(last)
+    if n == 0 or size == 0:
+        raise RangeNotSatisfiable()
+    return max(0, size - n), size - 1
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+class AssetResponse(Response):
+    """Serve an Asset honouring conditional GET, Range and precompressed variants.
+
+    Small files are sent from their memory map; large files use the ASGI
+    zero-copy sendfile extension when the server offers it and fall back to
+    chunked reads otherwise.
+    """
+
+    def __init__(self, request: Request, asset: Asset):
+        self.asset = asset
+        self.variant = asset.identity
+        self.range: Optional[Tuple[int, int]] = None
+        headers = {
+            "accept-ranges": "bytes",
+            "last-modified": asset.last_modified,
+            "cache-control": "private, no-cache",
+            "content-disposition": self._disposition(asset.filename),
+        }
+        if asset.encoded:
+            headers["vary"] = "Accept-Encoding"
+        super().__init__(status_code=200, headers=headers, media_type=asset.media_type)
+
+        inm = request.headers.get("if-none-match")
+        rng = request.headers.get("range")
+        if not rng:
+            accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+            for encoding, _ in ENCODINGS:
+                if encoding in asset.encoded and accepted.get(encoding, 0) > 0:
+                    self.variant = asset.encoded[encoding]
+                    self.headers["content-encoding"] = encoding
+                    break
+        self.headers["etag"] = self.variant.etag
+
+        if inm and etag_matches(inm, self.variant.etag):
+            self.status_code = 304
+            del self.headers["content-length"]
+            return
+        if rng and self._if_range_ok(request.headers.get("if-range")):
+            try:
+                self.range = _parse_range(rng, asset.size)
+            except RangeNotSatisfiable:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{asset.size}"
+                self.headers["content-length"] = "0"
+                return
+        if self.range is not None:
+            start, end = self.range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{asset.size}"
+            self.headers["content-length"] = str(end - start + 1)
+        else:
+            self.headers["content-length"] = str(self.variant.size)
+
+    @staticmethod
+    def _disposition(filename: str) -> str:
+        quoted = quote(filename)
+        if quoted != filename:
+            return f"attachment; filename*=utf-8''{quoted}"
+        return f'attachment; filename="{filename}"'
+
+    def _if_range_ok(self, if_range: Optional[str]) -> bool:
+        # If-Range requires a strong match; otherwise send the full entity.
+        if not if_range:
+            return True
+        return if_range.strip() in (self.asset.etag, self.asset.last_modified)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.status_code in (304, 416):
+            await send({"type": "http.response.body", "body": b""})
+            return
+        start, end = self.range if self.range is not None else (0, self.variant.size - 1)
+        count = end - start + 1
+        if self.variant.data is not None:
+            data = self.variant.data
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                stop = min(offset + CHUNK_SIZE, end + 1)
+                await send({"type": "http.response.body", "body": data[offset:stop], "more_body": stop <= end})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.variant.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(),
+                            "offset": start, "count": count, "more_body": False})
+            return
+        async with await anyio.open_file(self.variant.path, "rb") as f:
+            await f.seek(start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0 or count == 0:
+                await send({"type": "http.response.body", "body": b""})
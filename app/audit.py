@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .settings import settings
+from .db_sqlite import transaction
+from .workers import BackgroundWorker
+
+log = logging.getLogger(__name__)
+
+Row = Tuple[int, str, str]
+
+STOP_FLUSH_ATTEMPTS = 3  # failed flushes at shutdown before the rest of the buffer is dropped
+
+class AuditWriter(BackgroundWorker):
+    """Group-commit writer for premium_downloads.
+
+    record() appends to a bounded in-memory buffer; the worker thread writes
+    the buffer in one executemany transaction every AUDIT_FLUSH_MS or as soon
+    as AUDIT_BATCH_ROWS rows are waiting. When the buffer is full, record()
+    blocks for up to AUDIT_BLOCK_MS and then drops the row.
+
+    The same transaction folds the batch into download_rollups and the
+    per-file and per-user totals, so they always match the raw rows.
+    """
+
+    name = "audit-writer"
+
+    def __init__(self):
+        super().__init__(settings.AUDIT_FLUSH_MS / 1000)
+        self._buf: Deque[Row] = deque()
+        self._cond = threading.Condition()
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def record(self, user_id: int, file_id: str) -> bool:
+        return self.record_many(user_id, [file_id])
+
+    def record_many(self, user_id: int, file_ids: List[str]) -> bool:
+        """Buffer one row per file, all or none: they reach the same flush."""
+        created_at = datetime.now(timezone.utc).isoformat()
+        rows = [(user_id, file_id, created_at) for file_id in file_ids]
+        room = max(0, settings.AUDIT_BUFFER_ROWS - len(rows))
+        deadline = time.monotonic() + settings.AUDIT_BLOCK_MS / 1000
+        with self._cond:
+            while self._buf and len(self._buf) > room:
+                self.wake()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if self._buf and len(self._buf) > room:
+                        self.dropped += len(rows)
+                        log.warning("audit buffer full, dropped %s download(s) by user %s", len(rows), user_id)
+                        return False
+            self._buf.extend(rows)
+            if len(self._buf) >= settings.AUDIT_BATCH_ROWS:
+                self.wake()
+        return True
+
+    @property
+    def full(self) -> bool:
+        return len(self._buf) >= settings.AUDIT_BUFFER_ROWS
+
+    def has_room(self, rows: int) -> bool:
+        return not self._buf or len(self._buf) + rows <= settings.AUDIT_BUFFER_ROWS
+
+    def _flush(self, limit: int) -> int:
+        with self._cond:
+            batch: List[Row] = [self._buf.popleft() for _ in range(min(limit, len(self._buf)))]
+            # Never split a record_many() group (same user and timestamp) across transactions.
+            while batch and self._buf and self._buf[0][0::2] == batch[-1][0::2]:
+                batch.append(self._buf.popleft())
+        if not batch:
+            return 0
+        try:
+            with transaction() as conn:
+                conn.executemany("INSERT INTO premium_downloads(user_id,file_id,created_at) VALUES (?,?,?)", batch)
+                _update_rollups(conn, batch)
+        except Exception:
+            # Keep the rows (in order) for the next attempt.
+            with self._cond:
+                self._buf.extendleft(reversed(batch))
+            self.failed_flushes += 1
+            raise
+        with self._cond:
+            self.flushed += len(batch)
+            self._cond.notify_all()
+        return len(batch)
+
+    def run_once(self) -> bool:
+        n = self._flush(settings.AUDIT_BATCH_ROWS)
+        return n == settings.AUDIT_BATCH_ROWS and len(self._buf) >= settings.AUDIT_BATCH_ROWS
+
+    def on_stop(self) -> None:
+        # Clean shutdown: everything still buffered goes to disk, unless the
+        # database keeps failing; then the rest is dropped so shutdown ends.
+        failures = 0
+        while self._buf:
+            try:
+                self._flush(settings.AUDIT_BATCH_ROWS)
+            except Exception:
+                failures += 1
+                log.exception("audit writer: flush at shutdown failed (%s/%s)", failures, STOP_FLUSH_ATTEMPTS)
+                if failures >= STOP_FLUSH_ATTEMPTS:
+                    break
+                time.sleep(0.1 * failures)
+        with self._cond:
+            lost = len(self._buf)
+            self._buf.clear()
+            self.dropped += lost
+            self._cond.notify_all()
+        if lost:
+            log.error("audit writer: dropped %s buffered download(s) at shutdown", lost)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buf),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+def _update_rollups(conn, batch: List[Row]) -> None:
+    per_day = Counter((file_id, created_at[:10]) for _, file_id, created_at in batch)
+    per_file = Counter(file_id for _, file_id, _ in batch)
+    per_user: Dict[int, List[Any]] = {}
+    for user_id, _, created_at in batch:
+        total = per_user.setdefault(user_id, [0, created_at])
+        total[0] += 1
+        total[1] = max(total[1], created_at)
+    conn.executemany(
+        "INSERT INTO download_rollups(file_id,day,downloads) VALUES (?,?,?) "
+        "ON CONFLICT(file_id,day) DO UPDATE SET downloads=downloads+excluded.downloads",
+        [(file_id, day, n) for (file_id, day), n in per_day.items()],
+    )
+    conn.executemany(
+        "INSERT INTO download_file_totals(file_id,downloads) VALUES (?,?) "
+        "ON CONFLICT(file_id) DO UPDATE SET downloads=downloads+excluded.downloads",
+        list(per_file.items()),
+    )
+    conn.executemany(
+        "INSERT INTO download_user_totals(user_id,downloads,last_download_at) VALUES (?,?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET downloads=downloads+excluded.downloads, "
+        "last_download_at=max(last_download_at, excluded.last_download_at)",
+        [(user_id, n, last) for user_id, (n, last) in per_user.items()],
+    )
+
+_writer = AuditWriter()
+
+def record_download(user_id: int, file_id: str) -> bool:
+    return _writer.record(user_id, file_id)
+
+async def arecord_download(user_id: int, file_id: str) -> bool:
+    """record_download() for async routes: only a full buffer's wait leaves the event loop."""
+    if _writer.full:
+        return await run_in_threadpool(_writer.record, user_id, file_id)
+    return _writer.record(user_id, file_id)
+
+def record_downloads(user_id: int, file_ids: List[str]) -> bool:
+    return _writer.record_many(user_id, file_ids)
+
+async def arecord_downloads(user_id: int, file_ids: List[str]) -> bool:
+    if not _writer.has_room(len(file_ids)):
+        return await run_in_threadpool(_writer.record_many, user_id, file_ids)
+    return _writer.record_many(user_id, file_ids)
+
+def start_audit() -> None:
+    _writer.start()
+
+def stop_audit() -> None:
+    _writer.stop()
+
+def audit_stats() -> Dict[str, Any]:
+    return _writer.stats()
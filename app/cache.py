@@ -0,0 +1,416 @@
+"""Caches, per process or shared by the uvicorn workers of one host.
+
+TTLCache lives in one process. make_cache() returns one, or, with
+CACHE_BACKEND=sqlite, a SharedCache: entries live in a small SQLite file
+next to the database (CACHE_SQLITE_PATH), so every worker sees the same
+values, and each worker keeps a TTLCache in front of it for repeat reads.
+
+Every SharedCache write appends to `cache_events` in the same transaction.
+A listener thread in each worker checks the file's data_version every
+CACHE_POLL_MS and drops its local copies of the keys other workers
+changed, so an invalidation reaches every worker within milliseconds.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .settings import settings
+from . import db_sqlite
+from .workers import BackgroundWorker
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class Cache(ABC):
+    """get/set/delete/incr with a TTL, whatever the backend.
+
+    The a* variants are for async callers; in-process caches never block,
+    so they just call the plain methods.
+    """
+
+    @abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: Hashable) -> Any:
+        ...
+
+    @abstractmethod
+    def incr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    async def adelete(self, key: Hashable) -> Any:
+        return self.delete(key)
+
+    async def aincr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        return self.incr(key, delta, ttl)
+
+class TTLCache(Cache):
+    """Bounded LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def incr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        """Add `delta` to a counter; a missing or expired one starts from 0 with a fresh TTL."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                item = (now + (self.ttl if ttl is None else ttl), 0)
+            value = item[1] + delta
+            self._data[key] = (item[0], value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+# --- Shared backend -----------------------------------------------------------
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS cache (
+        ns TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (ns, key)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at)",
+    """CREATE TABLE IF NOT EXISTS cache_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        ns TEXT NOT NULL,
+        key TEXT,
+        origin TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_cache_events_created ON cache_events(created_at)",
+]
+
+# Another worker that has not seen an event for this long has restarted anyway.
+_EVENT_RETENTION_SEC = 60.0
+
+def cache_path() -> Path:
+    if settings.CACHE_SQLITE_PATH:
+        return Path(settings.CACHE_SQLITE_PATH)
+    db = Path(db_sqlite.DB_PATH)
+    return db.with_name(f"{db.stem}-cache{db.suffix}")
+
+def _decode(value: Any) -> Any:
+    # incr() leaves an SQLite integer behind; everything else is JSON text.
+    return value if isinstance(value, (int, float)) else json.loads(value)
+
+class SharedStore(BackgroundWorker):
+    """The cache file: per-thread connections, and the invalidation listener."""
+
+    name = "cache-listener"
+
+    def __init__(self):
+        super().__init__(settings.CACHE_POLL_MS / 1000)
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.caches: Dict[str, "SharedCache"] = {}
+        self.seq = 0  # last cache_events row applied
+        self.received = 0
+        self._path: Optional[Path] = None
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        self._swept = time.monotonic()
+
+    @property
+    def listening(self) -> bool:
+        return self._thread is not None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                if self._path is None:
+                    path = cache_path()
+                    setup = db_sqlite.connect(path)
+                    try:
+                        for statement in _SCHEMA:
+                            setup.execute(statement)
+                        self.seq = setup.execute("SELECT COALESCE(MAX(seq), 0) FROM cache_events").fetchone()[0]
+                    finally:
+                        setup.close()
+                    self._path = path
+            conn = self._local.conn = db_sqlite.connect(self._path)
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    @contextmanager
+    def _write(self, ns: str, key: Optional[str]) -> Iterator[sqlite3.Connection]:
+        """A write transaction that also publishes an invalidation of `key` (None: all of `ns`)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("INSERT INTO cache_events(ns,key,origin,created_at) VALUES (?,?,?,?)",
+                         (ns, key, self.origin, time.time()))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, ns: str, key: str) -> Optional[Tuple[Any, float]]:
+        row = self._conn().execute("SELECT value, expires_at FROM cache WHERE ns=? AND key=? AND expires_at>?",
+                                   (ns, key, time.time())).fetchone()
+        return (_decode(row[0]), row[1]) if row else None
+
+    def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        with self._write(ns, key) as conn:
+            conn.execute(
+                "INSERT INTO cache(ns,key,value,expires_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(ns,key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at",
+                (ns, key, json.dumps(value), time.time() + ttl),
+            )
+
+    def delete(self, ns: str, key: str) -> Any:
+        with self._write(ns, key) as conn:
+            row = conn.execute("DELETE FROM cache WHERE ns=? AND key=? RETURNING value, expires_at",
+                               (ns, key)).fetchone()
+        return _decode(row[0]) if row and row[1] > time.time() else None
+
+    def incr(self, ns: str, key: str, delta: int, ttl: float) -> int:
+        now = time.time()
+        with self._write(ns, key) as conn:
+            return conn.execute(
+                "INSERT INTO cache(ns,key,value,expires_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(ns,key) DO UPDATE SET "
+                "value=CASE WHEN cache.expires_at>? THEN cache.value+excluded.value ELSE excluded.value END, "
+                "expires_at=CASE WHEN cache.expires_at>? THEN cache.expires_at ELSE excluded.expires_at END "
+                "RETURNING value",
+                (ns, key, int(delta), now + ttl, now, now),
+            ).fetchone()[0]
+
+    def clear(self, ns: str) -> None:
+        with self._write(ns, None) as conn:
+            conn.execute("DELETE FROM cache WHERE ns=?", (ns,))
+
+    def run_once(self) -> bool:
+        conn = self._conn()
+        if time.monotonic() - self._swept >= settings.CACHE_SWEEP_SEC:
+            self._sweep(conn)
+        # data_version changes when another connection commits: checking it
+        # reads the WAL index in shared memory, not the file.
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        rows = conn.execute("SELECT seq, ns, key, origin FROM cache_events WHERE seq>? ORDER BY seq LIMIT 1000",
+                            (self.seq,)).fetchall()
+        for seq, ns, key, origin in rows:
+            cache = self.caches.get(ns)
+            if cache is not None and origin != self.origin:
+                cache.drop_local(key)
+                self.received += 1
+            self.seq = seq
+        if len(rows) == 1000:
+            self._data_version = None  # more to read
+            return True
+        return False
+
+    def _sweep(self, conn: sqlite3.Connection) -> None:
+        self._swept = time.monotonic()
+        now = time.time()
+        conn.execute("DELETE FROM cache WHERE expires_at<=?", (now,))
+        conn.execute("DELETE FROM cache_events WHERE created_at<?", (now - _EVENT_RETENTION_SEC,))
+
+    def on_stop(self) -> None:
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conns.clear()
+        self._local = threading.local()
+        self._data_version = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": str(self._path) if self._path else None, "listening": self.listening,
+                "seq": self.seq, "invalidations_received": self.received}
+
+_store = SharedStore()
+
+class SharedCache(Cache):
+    """A cache in the shared SQLite file, under namespace `name`, with a local copy in front.
+
+    Values must be JSON-serializable; tuple keys are stored as lists. The
+    local copy is only used while this worker's listener runs, otherwise
+    every read goes to the file. A read is one indexed SELECT that never
+    waits for writers (WAL), so get() runs inline even on the event loop;
+    writes take the file's write lock, so async callers use aset() and co.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, store: SharedStore = _store):
+        self.name = name
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl)
+        self._store = store
+        self.shared_hits = 0
+        self.misses = 0
+        store.caches[name] = self
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        k = self._key(key)
+        listening = self._store.listening
+        if listening:
+            value = self.local.get(k, _MISSING)
+            if value is not _MISSING:
+                return value
+        seq = self._store.seq
+        found = self._store.get(self.name, k)
+        if found is None:
+            self.misses += 1
+            return default
+        value, expires_at = found
+        self.shared_hits += 1
+        # Keep a local copy unless an invalidation was applied meanwhile: it
+        # may have been for this key, and the value read would be stale.
+        if listening and self._store.seq == seq:
+            self.local.set(k, value, max(0.0, min(self.ttl, expires_at - time.time())))
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        k = self._key(key)
+        ttl = self.ttl if ttl is None else ttl
+        self._store.set(self.name, k, value, ttl)
+        if self._store.listening:
+            self.local.set(k, value, ttl)
+
+    def delete(self, key: Hashable) -> Any:
+        k = self._key(key)
+        local = self.local.delete(k)
+        shared = self._store.delete(self.name, k)
+        return shared if shared is not None else local
+
+    def incr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomic across workers; a missing or expired counter starts from 0 with a fresh TTL."""
+        k = self._key(key)
+        self.local.delete(k)
+        return self._store.incr(self.name, k, delta, self.ttl if ttl is None else ttl)
+
+    def clear(self) -> None:
+        self.local.clear()
+        self._store.clear(self.name)
+
+    def drop_local(self, key: Optional[str]) -> None:
+        if key is None:
+            self.local.clear()
+        else:
+            self.local.delete(key)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        await run_in_threadpool(self.set, key, value, ttl)
+
+    async def adelete(self, key: Hashable) -> Any:
+        return await run_in_threadpool(self.delete, key)
+
+    async def aincr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        return await run_in_threadpool(self.incr, key, delta, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local.stats()
+        total = local["hits"] + self.shared_hits + self.misses
+        return {
+            "size": local["size"],
+            "hits": local["hits"],
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": ((local["hits"] + self.shared_hits) / total) if total else 0.0,
+        }
+
+def make_cache(name: str, maxsize: int, ttl: float) -> Cache:
+    """The cache `name` on the configured CACHE_BACKEND."""
+    if settings.CACHE_BACKEND == "sqlite":
+        return SharedCache(name, maxsize, ttl)
+    return TTLCache(maxsize, ttl)
+
+def start_cache() -> None:
+    if _store.caches and settings.CACHE_BACKEND == "sqlite":
+        _store.start()
+
+def stop_cache() -> None:
+    _store.stop()
+
+def shared_cache_stats() -> Dict[str, Any]:
+    return {"backend": settings.CACHE_BACKEND, **_store.stats()}
@@ -0,0 +1,230 @@
+"""The premium catalog and its manifest, served by GET /premium/resources.
+
+The manifest lists every PREMIUM_FILES entry with its size, checksum, page
+count and availability on local disk and in S3. It is built at startup and
+rebuilt by a background worker: every CATALOG_POLL_SEC it stats the asset
+files and rebuilds on a change, and every CATALOG_S3_CHECK_SEC it HEADs the
+objects in S3. The listing is kept serialized and gzipped with its ETag,
+so a request costs no I/O and no encoding.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .settings import settings
+from . import storage
+from .asset_server import ENCODINGS, Asset, AssetIndex, accepted_encodings, etag_matches
+from .workers import BackgroundWorker
+
+log = logging.getLogger(__name__)
+
+ASSETS_DIR = Path(__file__).resolve().parent / "assets" / "premium"
+
+# Catalog of premium-protected files
+PREMIUM_FILES = {
+    "tmpl-cv-quebec": {"filename": "modele_cv_quebec.docx", "title": "Modèle de CV (Québec)", "type": "docx"},
+    "plan-tecfee-30j": {"filename": "plan_tecfee_30j.pdf", "title": "Plan TECFÉE — 30 jours", "type": "pdf"},
+    "lettre-css": {"filename": "lettre_css.docx", "title": "Lettre — candidature CSS", "type": "docx"},
+    "checklist-dossier": {"filename": "checklist_dossier.pdf", "title": "Checklist dossier", "type": "pdf"},
+    # TECFÉE PDFs
+    "tecfee-compo": {"filename": "COMPO.pdf", "title": "COMPO — Grille / feuille de test", "type": "pdf"},
+    "tecfee-doc-1": {"filename": "DOC-1.pdf", "title": "DOC-1 — Exercices préparatoires TECFÉE (Partie 1)", "type": "pdf"},
+    "tecfee-doc-2": {"filename": "DOC-2.pdf", "title": "DOC-2 — Exercices préparatoires TECFÉE (Partie 2)", "type": "pdf"},
+    "tecfee-doc-3": {"filename": "DOC-3.pdf", "title": "DOC-3 — Exercices préparatoires TECFÉE (Partie 3)", "type": "pdf"},
+    "tecfee-doc-4": {"filename": "DOC-4.pdf", "title": "DOC-4 — Exercices préparatoires TECFÉE (Partie 4)", "type": "pdf"},
+    "tecfee-doc-5": {"filename": "DOC-5.pdf", "title": "DOC-5 — Exercices préparatoires TECFÉE (Partie 5)", "type": "pdf"},
+    "tecfee-doc-6": {"filename": "DOC-6.pdf", "title": "DOC-6 — Exercices préparatoires TECFÉE (Partie 6)", "type": "pdf"},
+    "tecfee-doc-7": {"filename": "DOC-7.pdf", "title": "DOC-7 — Exercices préparatoires TECFÉE (Partie 7)", "type": "pdf"},
+    "tecfee-doc-8": {"filename": "DOC-8.pdf", "title": "DOC-8 — Exercices préparatoires TECFÉE (Partie 8)", "type": "pdf"},
+}
+
+assets = AssetIndex(ASSETS_DIR)
+
+def s3_key(filename: str) -> str:
+    prefix = storage.get_cfg().prefix
+    return f"{prefix}{filename}" if prefix else filename
+
+# --- Page counts --------------------------------------------------------------
+
+_PDF_PAGES_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+_PDF_OBJSTM = re.compile(rb"/Type\s*/ObjStm\b.*?stream\r?\n", re.S)
+
+def _pdf_pages(data: bytes) -> Optional[int]:
+    # The root /Pages node's /Count is the largest one; PDF 1.5+ files keep
+    # it in compressed object streams, which are inflated to look for it.
+    texts = [data]
+    for m in _PDF_OBJSTM.finditer(data):
+        try:
+            texts.append(zlib.decompressobj().decompress(data[m.end():m.end() + 16 * 1024 * 1024]))
+        except zlib.error:
+            continue
+    counts = [int(a or b) for text in texts for a, b in _PDF_PAGES_COUNT.findall(text)]
+    if counts:
+        return max(counts)
+    pages = sum(len(_PDF_PAGE.findall(text)) for text in texts)
+    return pages or None
+
+def _docx_pages(path: Path) -> Optional[int]:
+    # Word saves its last pagination in docProps/app.xml.
+    try:
+        with zipfile.ZipFile(path) as z:
+            m = re.search(rb"<Pages>(\d+)</Pages>", z.read("docProps/app.xml"))
+    except (zipfile.BadZipFile, KeyError):
+        return None
+    return int(m.group(1)) if m else None
+
+def page_count(asset: Asset) -> Optional[int]:
+    path = asset.identity.path
+    if path.suffix.lower() == ".pdf":
+        data = asset.identity.data if asset.identity.data is not None else path.read_bytes()
+        return _pdf_pages(data)
+    if path.suffix.lower() == ".docx":
+        return _docx_pages(path)
+    return None
+
+# --- Manifest -----------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Listing:
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+def _listing(items: List[Dict[str, Any]]) -> Listing:
+    body = json.dumps({"items": items}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return Listing(body=body, gzipped=gzip.compress(body, 9, mtime=0),
+                   etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+class Catalog(BackgroundWorker):
+    name = "catalog"
+
+    def __init__(self):
+        super().__init__(settings.CATALOG_POLL_SEC)
+        self.listing = _listing([])
+        self.builds = 0
+        self.s3_checked_at: Optional[float] = None
+        self._stamp: Optional[Tuple] = None
+        self._s3: Dict[str, Optional[bool]] = {}
+        self._pages: Dict[str, Optional[int]] = {}  # by sha256
+        self._lock = threading.Lock()
+
+    def _current_stamp(self) -> Tuple:
+        stamp = []
+        for meta in PREMIUM_FILES.values():
+            path = ASSETS_DIR / meta["filename"]
+            for p in (path, *(path.with_name(path.name + suffix) for _, suffix in ENCODINGS)):
+                try:
+                    st = p.stat()
+                    stamp.append((st.st_size, st.st_mtime_ns))
+                except OSError:
+                    stamp.append(None)
+        return tuple(stamp)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the assets and rebuild the listing if a file changed; True if it did."""
+        with self._lock:
+            stamp = self._current_stamp()
+            if stamp == self._stamp and not force:
+                return False
+            if self._stamp is not None:
+                log.info("catalog: premium assets changed, reloading")
+            assets.load(PREMIUM_FILES)
+            self._stamp = stamp
+            self._build()
+            return True
+
+    def check_s3(self) -> None:
+        """HEAD every catalog object; with S3 unconfigured, availability stays null."""
+        if not storage.is_configured():
+            return
+        found = dict(self._s3)
+        for file_id, meta in PREMIUM_FILES.items():
+            if self.stopping:
+                return
+            try:
+                found[file_id] = storage.head_object(s3_key(meta["filename"])) is not None
+            except Exception as exc:
+                # Storage unreachable: keep the last known values until the next round.
+                log.warning("catalog: HEAD %s failed: %r", meta["filename"], exc)
+                break
+        with self._lock:
+            self._s3 = found
+            self.s3_checked_at = time.time()
+            self._build()
+
+    def _build(self) -> None:
+        items = []
+        for file_id, meta in PREMIUM_FILES.items():
+            asset = assets.get(file_id)
+            if asset is not None and asset.sha256 not in self._pages:
+                self._pages[asset.sha256] = page_count(asset)
+            items.append({
+                "id": file_id,
+                "title": meta["title"],
+                "type": meta["type"],
+                "filename": meta["filename"],
+                "size": asset.size if asset else None,
+                "sha256": asset.sha256 if asset else None,
+                "pages": self._pages[asset.sha256] if asset else None,
+                "updated_at": asset.last_modified if asset else None,
+                "available": {"local": asset is not None, "s3": self._s3.get(file_id)},
+            })
+        listing = _listing(items)
+        if listing.etag != self.listing.etag:
+            self.listing = listing
+            self.builds += 1
+
+    def run_once(self) -> bool:
+        self.refresh()
+        due = self.s3_checked_at is None or time.time() - self.s3_checked_at >= settings.CATALOG_S3_CHECK_SEC
+        if due and storage.is_configured():
+            self.check_s3()
+        return False
+
+    def response(self, request: Request) -> Response:
+        listing = self.listing
+        headers = {"etag": listing.etag, "vary": "Accept-Encoding", "cache-control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match", ""), listing.etag):
+            return Response(status_code=304, headers=headers)
+        if accepted_encodings(request.headers.get("accept-encoding", "")).get("gzip", 0) > 0:
+            headers["content-encoding"] = "gzip"
+            return Response(listing.gzipped, media_type="application/json", headers=headers)
+        return Response(listing.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(PREMIUM_FILES),
+            "local": sum(assets.get(file_id) is not None for file_id in PREMIUM_FILES),
+            "s3": sum(bool(v) for v in self._s3.values()),
+            "s3_checked_at": self.s3_checked_at,
+            "builds": self.builds,
+            "etag": self.listing.etag,
+            "bytes": len(self.listing.body),
+            "gzip_bytes": len(self.listing.gzipped),
+        }
+
+catalog = Catalog()
+
+def start_catalog() -> None:
+    # Local files are indexed before the first request; S3 is checked in the background.
+    catalog.refresh(force=True)
+    catalog.start()
+
+def stop_catalog() -> None:
+    catalog.stop()
+
+def catalog_stats() -> Dict[str, Any]:
+    return catalog.stats()
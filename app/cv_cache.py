@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .settings import settings
+from .cv_export import TEMPLATE_VERSION
+
+log = logging.getLogger(__name__)
+
+DEFAULT_DIR = Path(__file__).resolve().parent.parent / "cv_cache"
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+def cache_key(payload: Dict[str, Any], fmt: str) -> str:
+    """Content address of a rendered CV: payload, format and template version."""
+    canonical = json.dumps(_normalize(payload), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{TEMPLATE_VERSION}\n{fmt}\n{canonical}".encode("utf-8")).hexdigest()
+
+def etag_for(key: str) -> str:
+    return f'"{key[:32]}"'
+
+class CVCache:
+    """Two-tier cache of rendered documents: in-memory LRU over a size-capped directory.
+
+    Disk entries live under <dir>/<TEMPLATE_VERSION>/, so bumping the
+    template version orphans the old tree, which is removed at startup.
+    """
+
+    def __init__(self, root: Path, memory_max_bytes: int, disk_max_bytes: int):
+        self.root = root
+        self.dir = root / f"v{TEMPLATE_VERSION}"
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def open(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Only older template trees: CV_CACHE_DIR may be shared with other files.
+        for old in self.root.glob("v*"):
+            if old.is_dir() and old != self.dir:
+                shutil.rmtree(old, ignore_errors=True)
+        self._disk_bytes = sum(p.stat().st_size for p in self.dir.rglob("*") if p.is_file())
+
+    def _path(self, key: str, fmt: str) -> Path:
+        return self.dir / key[:2] / f"{key}.{fmt}"
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_bytes -= len(old)
+            self._mem[key] = data
+            self._mem_bytes += len(data)
+            while self._mem_bytes > self.memory_max_bytes:
+                _, evicted = self._mem.popitem(last=False)
+                self._mem_bytes -= len(evicted)
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.memory_hits += 1
+                self.bytes_saved += len(data)
+        return data
+
+    def get_disk(self, key: str, fmt: str) -> Optional[bytes]:
+        path = self._path(key, fmt)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mtime doubles as last-access time for eviction
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self.bytes_saved += len(data)
+        self._remember(key, data)
+        return data
+
+    def put(self, key: str, fmt: str, data: bytes) -> None:
+        self._remember(key, data)
+        if len(data) > self.disk_max_bytes:
+            return
+        path = self._path(key, fmt)
+        try:
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = 0
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            log.exception("could not write CV cache entry %s", path)
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        # Evict least recently used files down to 90% of the cap.
+        files = []
+        for p in self.dir.rglob("*"):
+            try:
+                if p.is_file():
+                    st = p.stat()
+                    files.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        for _, size, p in sorted(files):
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (hits / total) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "memory_bytes": self._mem_bytes,
+            "disk_bytes": self._disk_bytes,
+        }
+
+cv_cache = CVCache(
+    Path(settings.CV_CACHE_DIR) if settings.CV_CACHE_DIR else DEFAULT_DIR,
+    settings.CV_CACHE_MEMORY_MAX_BYTES,
+    settings.CV_CACHE_DISK_MAX_BYTES,
+)
+
+def start_cv_cache() -> None:
+    cv_cache.open()
@@ -0,0 +1,187 @@
+import re
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from .settings import settings
+from .procpool import BoundedProcessPool
+
+# Bump whenever the rendered output changes (layout, styles, labels).
+TEMPLATE_VERSION = "1"
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+Block = Tuple[str, str]
+
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _clean(text: Any) -> str:
+    return _INVALID_XML.sub("", str(text or "")).strip()
+
+def _lines(text: Any) -> List[str]:
+    return [l for l in (_clean(x) for x in str(text or "").splitlines()) if l]
+
+def cv_blocks(cv: Dict[str, Any]) -> Iterator[Block]:
+    """Format-neutral layout of a CV: (kind, text) pairs rendered by each template."""
+    yield "title", _clean(cv.get("full_name")) or "Curriculum vitae"
+    if _clean(cv.get("title")):
+        yield "subtitle", _clean(cv.get("title"))
+    contact = " · ".join(x for x in (_clean(cv.get(k)) for k in ("email", "phone", "city")) if x)
+    if contact:
+        yield "meta", contact
+    summary = _lines(cv.get("summary"))
+    if summary:
+        yield "heading", "Profil"
+        for line in summary:
+            yield "para", line
+    experiences = cv.get("experiences") or []
+    if experiences:
+        yield "heading", "Expérience professionnelle"
+        for exp in experiences:
+            head = " — ".join(x for x in (_clean(exp.get("role")), _clean(exp.get("company"))) if x)
+            if head:
+                yield "item", head
+            if _clean(exp.get("period")):
+                yield "meta", _clean(exp.get("period"))
+            for detail in exp.get("details") or []:
+                if _clean(detail):
+                    yield "bullet", _clean(detail)
+    education = cv.get("education") or []
+    if education:
+        yield "heading", "Formation"
+        for edu in education:
+            head = " — ".join(x for x in (_clean(edu.get("degree")), _clean(edu.get("school"))) if x)
+            if head:
+                yield "item", head
+            if _clean(edu.get("period")):
+                yield "meta", _clean(edu.get("period"))
+    for key, label in (("skills", "Compétences"), ("languages", "Langues")):
+        values = [_clean(v) for v in cv.get(key) or [] if _clean(v)]
+        if values:
+            yield "heading", label
+            for v in values:
+                yield "bullet", v
+
+class DocxTemplate:
+    """python-docx template compiled once into a prebuilt zip.
+
+    Every part except word/document.xml is compressed once here; a render
+    only appends a freshly generated document.xml to a copy of that zip.
+    """
+
+    STYLES = {"title": "Title", "subtitle": "Subtitle", "meta": "NoSpacing", "heading": "Heading1",
+              "item": "Heading2", "para": "Normal", "bullet": "ListBullet"}
+    SENTINEL = "@@CV_BODY@@"
+
+    def __init__(self):
+        from docx import Document
+        from docx.shared import Inches, Pt
+
+        doc = Document()
+        doc.styles["Normal"].font.name = "Calibri"
+        doc.styles["Normal"].font.size = Pt(10.5)
+        for section in doc.sections:
+            section.left_margin = section.right_margin = Inches(0.8)
+            section.top_margin = section.bottom_margin = Inches(0.7)
+        doc.add_paragraph(self.SENTINEL)
+        buf = BytesIO()
+        doc.save(buf)
+        with ZipFile(buf) as src:
+            parts = {name: src.read(name) for name in src.namelist()}
+        xml = parts.pop("word/document.xml").decode("utf-8")
+        self.head, self.tail = xml.split(f"<w:p><w:r><w:t>{self.SENTINEL}</w:t></w:r></w:p>")
+        static = BytesIO()
+        with ZipFile(static, "w", ZIP_DEFLATED) as out:
+            for name, data in parts.items():
+                out.writestr(name, data)
+        self.static_zip = static.getvalue()
+        self.paragraph = ('<w:p><w:pPr><w:pStyle w:val="{}"/></w:pPr>'
+                          '<w:r><w:t xml:space="preserve">{}</w:t></w:r></w:p>')
+
+    def render(self, cv: Dict[str, Any]) -> bytes:
+        body = "".join(self.paragraph.format(self.STYLES[kind], escape(text)) for kind, text in cv_blocks(cv))
+        buf = BytesIO(self.static_zip)
+        with ZipFile(buf, "a", ZIP_DEFLATED) as out:
+            out.writestr("word/document.xml", self.head + body + self.tail)
+        return buf.getvalue()
+
+class PdfTemplate:
+    """reportlab styles and page decorations, built once."""
+
+    def __init__(self):
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import LETTER
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+        self._Paragraph, self._Spacer, self._Doc = Paragraph, Spacer, SimpleDocTemplate
+        self.pagesize = LETTER
+        self.margin = 0.8 * inch
+        accent = colors.HexColor("#1F4E79")
+        base = ParagraphStyle("base", fontName="Helvetica", fontSize=10.5, leading=14)
+        self.styles = {
+            "title": ParagraphStyle("title", parent=base, fontName="Helvetica-Bold", fontSize=22, leading=26,
+                                    textColor=accent),
+            "subtitle": ParagraphStyle("subtitle", parent=base, fontSize=13, leading=17, spaceAfter=2),
+            "meta": ParagraphStyle("meta", parent=base, fontSize=9.5, textColor=colors.HexColor("#555555")),
+            "heading": ParagraphStyle("heading", parent=base, fontName="Helvetica-Bold", fontSize=12.5,
+                                      textColor=accent, spaceBefore=12, spaceAfter=4),
+            "item": ParagraphStyle("item", parent=base, fontName="Helvetica-Bold", spaceBefore=6),
+            "para": ParagraphStyle("para", parent=base, spaceAfter=4),
+            "bullet": ParagraphStyle("bullet", parent=base, leftIndent=12, bulletIndent=2),
+        }
+        self.rule_color = accent
+
+    def _decorate(self, canvas, doc) -> None:
+        width, height = self.pagesize
+        canvas.saveState()
+        canvas.setStrokeColor(self.rule_color)
+        canvas.setLineWidth(2)
+        canvas.line(self.margin, height - self.margin / 2, width - self.margin, height - self.margin / 2)
+        canvas.setFont("Helvetica", 8)
+        canvas.drawRightString(width - self.margin, self.margin / 2, str(doc.page))
+        canvas.restoreState()
+
+    def render(self, cv: Dict[str, Any]) -> bytes:
+        story = []
+        for kind, text in cv_blocks(cv):
+            bullet = "•" if kind == "bullet" else None
+            story.append(self._Paragraph(escape(text), self.styles[kind], bulletText=bullet))
+            if kind == "meta":
+                story.append(self._Spacer(1, 4))
+        buf = BytesIO()
+        doc = self._Doc(buf, pagesize=self.pagesize, leftMargin=self.margin, rightMargin=self.margin,
+                        topMargin=self.margin, bottomMargin=self.margin,
+                        title=_clean(cv.get("full_name")) or "CV", author="EduQuébec")
+        doc.build(story, onFirstPage=self._decorate, onLaterPages=self._decorate)
+        return buf.getvalue()
+
+_templates: Optional[Dict[str, Any]] = None
+
+def load_templates() -> Dict[str, Any]:
+    global _templates
+    if _templates is None:
+        _templates = {"docx": DocxTemplate(), "pdf": PdfTemplate()}
+    return _templates
+
+def render(fmt: str, cv: Dict[str, Any]) -> bytes:
+    return load_templates()[fmt].render(cv)
+
+# Rendering is CPU-bound: it runs in worker processes that compile the
+# templates once, when they start.
+_pool = BoundedProcessPool("cv_export", settings.CV_EXPORT_WORKERS, settings.CV_EXPORT_QUEUE_MAX,
+                           initializer=load_templates)
+
+async def render_async(fmt: str, cv: Dict[str, Any]) -> bytes:
+    return await _pool.run(render, fmt, cv)
+
+def export_stats() -> Dict[str, Any]:
+    return _pool.stats()
+
+def shutdown_export() -> None:
+    _pool.shutdown()
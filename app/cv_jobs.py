@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from .settings import settings
+from . import db_async
+from .cv_export import render_async
+from .cv_cache import cv_cache, cache_key
+from .zipstream import ZipStream
+
+log = logging.getLogger(__name__)
+
+DEFAULT_DIR = Path(__file__).resolve().parent.parent / "cv_jobs"
+
+# 'partial': some items failed; 'failed': all of them, or the job itself.
+FINISHED = ("done", "partial", "failed")
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def jobs_dir() -> Path:
+    return Path(settings.CV_JOBS_DIR) if settings.CV_JOBS_DIR else DEFAULT_DIR
+
+def _item_filename(idx: int, cv: Dict[str, Any], fmt: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", str(cv.get("full_name", "")).lower()).strip("_")
+    return f"{idx + 1:04d}_{slug or 'cv'}.{fmt}"
+
+async def create_job(user_id: int, fmt: str, items: List[Dict[str, Any]]) -> str:
+    job_id = uuid.uuid4().hex
+    now = _now().isoformat()
+    rows = [(job_id, i, json.dumps(cv, ensure_ascii=False), _item_filename(i, cv, fmt), "queued")
+            for i, cv in enumerate(items)]
+
+    def insert(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "INSERT INTO cv_jobs(id,user_id,fmt,status,total,done,failed,created_at,updated_at) VALUES (?,?,?,?,?,?,?,?,?)",
+            (job_id, user_id, fmt, "queued", len(items), 0, 0, now, now),
+        )
+        conn.executemany("INSERT INTO cv_job_items(job_id,idx,payload,filename,status) VALUES (?,?,?,?,?)", rows)
+    await db_async.write(insert)
+    runner.wake()
+    return job_id
+
+async def get_job(job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+    return await db_async.fetch_one(
+        "SELECT id,fmt,status,total,done,failed,created_at,updated_at FROM cv_jobs WHERE id=? AND user_id=?",
+        (job_id, user_id),
+    )
+
+def _claim(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+    # Runs in the db_async writer's transaction: pick the oldest runnable job and lease it.
+    now = _now()
+    lease = (now + timedelta(seconds=settings.CV_JOB_LEASE_SEC)).isoformat()
+    row = conn.execute(
+        "SELECT id,user_id,fmt FROM cv_jobs j "
+        "WHERE (status='queued' OR (status='running' AND lease_until<?)) "
+        "AND (SELECT COUNT(*) FROM cv_jobs r WHERE r.user_id=j.user_id AND r.status='running' "
+        "     AND r.lease_until>=?) < ? "
+        "ORDER BY created_at LIMIT 1",
+        (now.isoformat(), now.isoformat(), settings.CV_JOB_PER_USER),
+    ).fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE cv_jobs SET status='running', lease_until=?, updated_at=? WHERE id=?",
+                 (lease, now.isoformat(), row["id"]))
+    return dict(row)
+
+class JobRunner:
+    """Runs queued cv_jobs on the event loop, rendering through the CV process pool.
+
+    Jobs are claimed with a lease that is renewed while they run, so a job
+    left 'running' by a crashed or restarted worker is picked up again once
+    its lease expires; items already rendered are not redone. Database
+    work goes through db_async, so the loop never waits on SQLite.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._render_slots: Optional[asyncio.Semaphore] = None
+        self._running: Dict[asyncio.Task, str] = {}
+
+    def start(self) -> None:
+        jobs_dir().mkdir(parents=True, exist_ok=True)
+        self._wake = asyncio.Event()
+        self._render_slots = asyncio.Semaphore(settings.CV_JOB_RENDER_CONCURRENCY)
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        job_ids = list(self._running.values())
+        tasks = [t for t in (self._task, *self._running) if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        if not job_ids:
+            return
+        # Hand unfinished jobs back right away instead of waiting for the lease.
+        await db_async.write(lambda conn: conn.executemany(
+            "UPDATE cv_jobs SET status='queued', lease_until=NULL WHERE id=? AND status='running'",
+            [(job_id,) for job_id in job_ids],
+        ))
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                while len(self._running) < settings.CV_JOB_MAX_RUNNING:
+                    job = await db_async.write(_claim)
+                    if job is None:
+                        break
+                    task = asyncio.create_task(self._run_job(job))
+                    self._running[task] = job["id"]
+                    task.add_done_callback(self._job_finished)
+            except Exception:
+                log.exception("cv job runner: claim failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.CV_JOB_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _job_finished(self, task: asyncio.Task) -> None:
+        self._running.pop(task, None)
+        self.wake()
+
+    async def _render(self, fmt: str, cv: Dict[str, Any]) -> bytes:
+        key = cache_key(cv, fmt)
+        data = cv_cache.get_memory(key) or await run_in_threadpool(cv_cache.get_disk, key, fmt)
+        if data is not None:
+            return data
+        while True:
+            try:
+                data = await render_async(fmt, cv)
+                break
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                await asyncio.sleep(0.5)  # pool saturated by interactive exports
+        await run_in_threadpool(cv_cache.put, key, fmt, data)
+        return data
+
+    async def _run_item(self, job: Dict[str, Any], item: Dict[str, Any]) -> None:
+        async with self._render_slots:
+            try:
+                data = await self._render(job["fmt"], json.loads(item["payload"]))
+                path = jobs_dir() / job["id"] / item["filename"]
+                await run_in_threadpool(_write_file, path, data)
+            except Exception as e:
+                log.warning("cv job %s item %s failed: %r", job["id"], item["idx"], e)
+                status, error = "failed", repr(e)[:500]
+            else:
+                status, error = "done", None
+        lease = (_now() + timedelta(seconds=settings.CV_JOB_LEASE_SEC)).isoformat()
+        column = "done" if status == "done" else "failed"
+
+        def record(conn: sqlite3.Connection) -> None:
+            conn.execute("UPDATE cv_job_items SET status=?, error=? WHERE job_id=? AND idx=?",
+                         (status, error, job["id"], item["idx"]))
+            conn.execute(f"UPDATE cv_jobs SET {column}={column}+1, lease_until=?, updated_at=? WHERE id=?",
+                         (lease, _now().isoformat(), job["id"]))
+        await db_async.write(record)
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        items = await db_async.fetch_all("SELECT idx,payload,filename FROM cv_job_items WHERE job_id=? AND status='queued' ORDER BY idx",
+                                         (job["id"],))
+        try:
+            await asyncio.gather(*(self._run_item(job, item) for item in items))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.exception("cv job %s failed", job["id"])
+            await db_async.execute("UPDATE cv_jobs SET status='failed', error=?, updated_at=? WHERE id=?",
+                                   (repr(e)[:500], _now().isoformat(), job["id"]))
+            return
+        # Items fail one by one without failing the job; the outcome says how many made it.
+        await db_async.execute(
+            "UPDATE cv_jobs SET status=CASE WHEN failed>=total THEN 'failed' WHEN failed>0 THEN 'partial' ELSE 'done' END, "
+            "updated_at=? WHERE id=?", (_now().isoformat(), job["id"]))
+
+def _write_file(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+async def stream_job_zip(job_id: str) -> AsyncIterator[bytes]:
+    """Yield the job's ZIP, adding each document as soon as it is rendered."""
+    zs = ZipStream()
+    sent: Set[int] = set()
+    while True:
+        job = await db_async.fetch_one("SELECT status FROM cv_jobs WHERE id=?", (job_id,))
+        rows = await db_async.fetch_all(
+            "SELECT idx,filename FROM cv_job_items WHERE job_id=? AND status='done' ORDER BY idx", (job_id,))
+        for row in rows:
+            if row["idx"] in sent:
+                continue
+            sent.add(row["idx"])
+            data = await run_in_threadpool((jobs_dir() / job_id / row["filename"]).read_bytes)
+            yield zs.add(row["filename"], data)
+        if job is None or job["status"] in FINISHED:
+            break
+        await asyncio.sleep(settings.CV_JOB_STREAM_POLL_SEC)
+    yield zs.close()
+
+runner = JobRunner()
+
+def start_cv_jobs() -> None:
+    runner.start()
+
+async def stop_cv_jobs() -> None:
+    await runner.stop()
@@ -0,0 +1,232 @@
+"""Async access to SQLite for async routes.
+
+Reads run on SQLITE_READERS dedicated threads, each holding its own
+read-only (query_only) WAL connection, so they never take a slot in the
+threadpool that sync routes share and never wait for a writer.
+
+Writes are queued to a single writer thread. It takes everything queued
+(up to SQLITE_WRITE_BATCH_MAX) and commits it in one transaction, each
+write inside its own savepoint: a failing write is rolled back alone, and
+concurrent requests share one fsync instead of fighting for the write
+lock. A write's future resolves after the commit, so a request can read
+its own writes.
+
+Background workers (audit, outbox, Stripe events) keep using db_sqlite
+from their own threads.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from .settings import settings
+from . import db_sqlite
+from .metrics import observe_query
+from .workers import BackgroundWorker
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --- Reads --------------------------------------------------------------------
+
+class _Readers:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.size, thread_name_prefix="sqlite-reader")
+            return self._executor
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = db_sqlite.connect(db_sqlite.DB_PATH, read_only=True)
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def _call(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return fn(self._conn())
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._call, fn)
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conns.clear()
+        self._local = threading.local()
+
+_readers = _Readers(settings.SQLITE_READERS)
+
+def _timed(conn: sqlite3.Connection, query: str, params: Tuple) -> sqlite3.Cursor:
+    start = time.perf_counter()
+    cur = conn.execute(query, params)
+    observe_query(query, time.perf_counter() - start)
+    return cur
+
+async def fetch_one(query: str, params: Tuple = ()) -> Optional[Dict[str, Any]]:
+    def run(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        row = _timed(conn, query, params).fetchone()
+        return dict(row) if row else None
+    return await _readers.run(run)
+
+async def fetch_all(query: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+    def run(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        return [dict(r) for r in _timed(conn, query, params).fetchall()]
+    return await _readers.run(run)
+
+# --- Writes -------------------------------------------------------------------
+
+_Op = Tuple[Callable[[sqlite3.Connection], Any], asyncio.Future, asyncio.AbstractEventLoop]
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]) -> None:
+    if future.done():  # the request was cancelled meanwhile
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class SQLiteWriter(BackgroundWorker):
+    """The one thread that writes on behalf of async routes."""
+
+    name = "sqlite-writer"
+
+    def __init__(self):
+        super().__init__(1.0)
+        self._queue: Deque[_Op] = deque()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.rejected = 0
+        self.largest_batch = 0
+
+    def submit(self, fn: Callable[[sqlite3.Connection], T]) -> "asyncio.Future[T]":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if len(self._queue) >= settings.SQLITE_WRITE_QUEUE_MAX:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Serveur occupé, réessayez dans un instant.",
+                                    headers={"Retry-After": "1"})
+            self._queue.append((fn, future, loop))
+        self.start()
+        self.wake()
+        return future
+
+    def _take(self) -> List[_Op]:
+        with self._lock:
+            n = min(len(self._queue), settings.SQLITE_WRITE_BATCH_MAX)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _commit(self, batch: List[_Op]) -> List[Tuple[Any, Optional[BaseException]]]:
+        if self._conn is None:
+            self._conn = db_sqlite.connect(db_sqlite.DB_PATH)
+        conn = self._conn
+        outcomes: List[Tuple[Any, Optional[BaseException]]] = []
+        with db_sqlite.joined(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for fn, _, _ in batch:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        outcomes.append((fn(conn), None))
+                    except Exception as exc:
+                        conn.execute("ROLLBACK TO write")
+                        outcomes.append((None, exc))
+                    conn.execute("RELEASE write")
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return outcomes
+
+    def run_once(self) -> bool:
+        batch = self._take()
+        if not batch:
+            return False
+        try:
+            outcomes = self._commit(batch)
+        except Exception as exc:
+            log.exception("sqlite writer: batch of %s writes failed", len(batch))
+            outcomes = [(None, exc)] * len(batch)
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future, loop), (result, error) in zip(batch, outcomes):
+            if error is not None:
+                self.failed += 1
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:  # that event loop is closed
+                pass
+        return bool(self._queue)
+
+    def on_stop(self) -> None:
+        # Clean shutdown: whatever is still queued is written.
+        while self._queue:
+            self.run_once()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": (self.writes / self.batches) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+_writer = SQLiteWriter()
+
+async def write(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run `fn(conn)` in the writer's transaction; return its result once committed.
+
+    db_sqlite helpers called from `fn` (execute, transaction(), ...) join
+    the same transaction.
+    """
+    return await _writer.submit(fn)
+
+async def execute(query: str, params: Tuple = ()) -> int:
+    return await write(lambda conn: _timed(conn, query, params).lastrowid)
+
+# --- Lifecycle ----------------------------------------------------------------
+
+def start_db_async() -> None:
+    _writer.start()
+
+def stop_db_async() -> None:
+    _writer.stop()
+    _readers.close()
+
+def db_async_stats() -> Dict[str, Any]:
+    return {"readers": _readers.size, "writer": _writer.stats()}
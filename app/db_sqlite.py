@@ -1,8 +1,15 @@
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from queue import LifoQueue, Empty
+from typing import Optional, Dict, Any, List, Tuple, Iterator
 
-DB_PATH = Path(__file__).resolve().parent.parent / "data.sqlite3"
+from .settings import settings
+from .metrics import observe_query
+
+DB_PATH = Path(settings.SQLITE_PATH) if settings.SQLITE_PATH else Path(__file__).resolve().parent.parent / "data.sqlite3"
 
 SCHEMA = [
     """CREATE TABLE IF NOT EXISTS users (
@@ -40,68 +47,196 @@ SCHEMA = [
     );""",
 ]
 
-def _conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+def connect(path: Path, read_only: bool = False) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,  # autocommit; transactions are explicit
+        check_same_thread=False,
+        cached_statements=settings.SQLITE_STATEMENT_CACHE,
+    )
     conn.row_factory = sqlite3.Row
+    # Only takes effect on a new, empty file, and must precede the switch to
+    # WAL; existing databases are converted with scripts.maintenance.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
     return conn
 
-def _ensure_columns() -> None:
-    # Lightweight migration for older DBs
-    cols_needed = {
-        "is_active": "INTEGER NOT NULL DEFAULT 0",
-        "email_verified": "INTEGER NOT NULL DEFAULT 0",
-        "verify_token": "TEXT",
-        "verify_token_expires_at": "TEXT",
-    }
-    conn = _conn()
+class PoolExhausted(sqlite3.OperationalError):
+    """Every pooled connection stayed checked out for SQLITE_BUSY_TIMEOUT_MS."""
+
+class _Pool:
+    """Bounded pool of WAL-mode connections.
+
+    A thread checks a connection out for the duration of one call (or one
+    `transaction()` block) and returns it afterwards; at most `size`
+    connections are ever open. Each connection keeps its own prepared
+    statement cache (`cached_statements`), so hot queries are compiled once.
+    """
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = max(1, size)
+        self._idle: "LifoQueue[sqlite3.Connection]" = LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._all: List[sqlite3.Connection] = []
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    conn = connect(self.path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        except Empty:
+            raise PoolExhausted(f"connection pool exhausted ({self.size} connections in use)") from None
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all.clear()
+            self._opened = 0
+            self._idle = LifoQueue()
+
+_pool: Optional[_Pool] = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+def _get_pool() -> _Pool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _Pool(DB_PATH, settings.SQLITE_POOL_SIZE)
+    return _pool
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def _conn() -> Iterator[sqlite3.Connection]:
+    # Inside transaction() the thread already holds a connection: share it.
+    held = getattr(_local, "conn", None)
+    if held is not None:
+        yield held
+        return
+    pool = _get_pool()
+    conn = pool.acquire()
     try:
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        existing = {r["name"] for r in cur.fetchall()}
-        for name, ddl in cols_needed.items():
-            if name not in existing:
-                cur.execute(f"ALTER TABLE users ADD COLUMN {name} {ddl}")
-        conn.commit()
+        yield conn
     finally:
-        conn.close()
+        pool.release(conn)
 
-def init_db() -> None:
-    conn = _conn()
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run several fetch_one/fetch_all/execute calls on one connection and one commit.
+
+    Nested blocks join the outermost transaction.
+    """
+    if getattr(_local, "conn", None) is not None:
+        yield _local.conn
+        return
+    pool = _get_pool()
+    conn = pool.acquire()
+    _local.conn = conn
     try:
-        cur = conn.cursor()
-        for stmt in SCHEMA:
-            cur.execute(stmt)
-        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
     finally:
-        conn.close()
-    _ensure_columns()
+        _local.conn = None
+        pool.release(conn)
 
-def fetch_one(query: str, params: Tuple = ()) -> Optional[Dict[str, Any]]:
-    conn = _conn()
+@contextmanager
+def joined(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Make this thread's fetch_one/fetch_all/execute/transaction() calls use `conn`.
+
+    For code that already holds a connection in an open transaction (the
+    db_async writer) and calls helpers written against this module.
+    """
+    _local.conn = conn
     try:
-        cur = conn.cursor()
-        cur.execute(query, params)
-        row = cur.fetchone()
-        return dict(row) if row else None
+        yield conn
     finally:
-        conn.close()
+        _local.conn = None
+
+def init_db() -> None:
+    from .migrations import migrate
+    migrate()
+
+def fetch_one(query: str, params: Tuple = ()) -> Optional[Dict[str, Any]]:
+    with _conn() as conn:
+        start = time.perf_counter()
+        row = conn.execute(query, params).fetchone()
+        observe_query(query, time.perf_counter() - start)
+        return dict(row) if row else None
 
 def fetch_all(query: str, params: Tuple = ()) -> List[Dict[str, Any]]:
-    conn = _conn()
-    try:
-        cur = conn.cursor()
-        cur.execute(query, params)
-        rows = cur.fetchall()
+    with _conn() as conn:
+        start = time.perf_counter()
+        rows = conn.execute(query, params).fetchall()
+        observe_query(query, time.perf_counter() - start)
         return [dict(r) for r in rows]
-    finally:
-        conn.close()
+
+def iter_rows(query: str, params: Tuple = (), chunk_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yield rows one at a time, fetching `chunk_size` (SQLITE_FETCH_CHUNK_ROWS) per step.
+
+    Memory stays flat whatever the result size. The pooled connection is held
+    until the generator is exhausted or closed.
+    """
+    size = chunk_size or settings.SQLITE_FETCH_CHUNK_ROWS
+    with _conn() as conn:
+        start = time.perf_counter()
+        cur = conn.execute(query, params)
+        observe_query(query, time.perf_counter() - start)
+        try:
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cur.close()  # ends the statement's read snapshot before the connection goes back
 
 def execute(query: str, params: Tuple = ()) -> int:
-    conn = _conn()
-    try:
-        cur = conn.cursor()
-        cur.execute(query, params)
-        conn.commit()
+    with _conn() as conn:
+        start = time.perf_counter()
+        cur = conn.execute(query, params)
+        observe_query(query, time.perf_counter() - start)
         return cur.lastrowid
-    finally:
-        conn.close()
@@ -1,10 +1,70 @@
 from fastapi import Header, HTTPException, Depends
 import jwt
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, FrozenSet
 from .settings import settings
-from .db_sqlite import fetch_one
+from .db_async import fetch_one
+from .cache import make_cache
+from .token_versions import token_versions
 
-def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+# User rows are cached under ("email", email) and ("id", user_id); premium
+# status under the user id. Writers must call the invalidate_* helpers (the
+# ainvalidate_* ones from the event loop); with CACHE_BACKEND=sqlite that
+# invalidates every worker's copy.
+_users = make_cache("users", settings.USER_CACHE_MAX_ENTRIES, settings.USER_CACHE_TTL_SEC)
+_premium = make_cache("premium", settings.USER_CACHE_MAX_ENTRIES, settings.USER_CACHE_TTL_SEC)
+
+async def _load_user(email: str) -> Optional[Dict[str, Any]]:
+    user = _users.get(("email", email))
+    if user is None:
+        user = await fetch_one("SELECT id,email,created_at FROM users WHERE email=?", (email,))
+        if user:
+            await _users.aset(("email", email), user)
+            await _users.aset(("id", user["id"]), user)
+    return user
+
+async def _load_premium_status(user_id: int) -> str:
+    status = _premium.get(user_id)
+    if status is None:
+        sub = await fetch_one("SELECT status FROM subscriptions WHERE user_id=?", (user_id,))
+        status = sub["status"] if sub else "inactive"
+        await _premium.aset(user_id, status)
+    return status
+
+def invalidate_user(email: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    if email:
+        row = _users.delete(("email", email.lower().strip()))
+        if row:
+            user_id = user_id or row["id"]
+    if user_id is not None:
+        row = _users.delete(("id", user_id))
+        if row:
+            _users.delete(("email", row["email"]))
+        _premium.delete(user_id)
+
+def invalidate_premium(user_id: int) -> None:
+    _premium.delete(user_id)
+
+async def ainvalidate_user(email: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    if email:
+        row = await _users.adelete(("email", email.lower().strip()))
+        if row:
+            user_id = user_id or row["id"]
+    if user_id is not None:
+        row = await _users.adelete(("id", user_id))
+        if row:
+            await _users.adelete(("email", row["email"]))
+        await _premium.adelete(user_id)
+
+async def ainvalidate_premium(user_id: int) -> None:
+    await _premium.adelete(user_id)
+
+def cache_stats() -> Dict[str, Any]:
+    return {"users": _users.stats(), "premium": _premium.stats(), "token_versions": len(token_versions)}
+
+# Dependencies are async: they run on the event loop instead of taking a
+# threadpool slot, and their rare database reads go through db_async.
+async def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dict[str, Any]:
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Non authentifié.")
     token = authorization.split(" ", 1)[1].strip()
@@ -15,13 +75,34 @@ def get_current_user(authorization: Optional[str] = Header(default=None)) -> Dic
     email = payload.get("sub")
     if not email:
         raise HTTPException(status_code=401, detail="Token invalide.")
-    user = fetch_one("SELECT id,email,created_at FROM users WHERE email=?", (email.lower().strip(),))
-    if not user:
-        raise HTTPException(status_code=401, detail="Utilisateur introuvable.")
-    return user
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Issued before tokens carried claims: look the user up.
+        user = await _load_user(email.lower().strip())
+        if not user:
+            raise HTTPException(status_code=401, detail="Utilisateur introuvable.")
+        return {"id": user["id"], "email": user["email"], "premium": None}
+    version, min_version = await token_versions.aget(user_id)
+    issued_version = payload.get("tv", 0)
+    if issued_version < min_version:
+        raise HTTPException(status_code=401, detail="Session expirée, reconnectez-vous.")
+    # premium is None when entitlements changed since the token was issued.
+    premium = bool(payload.get("prem")) if issued_version >= version else None
+    return {"id": user_id, "email": email, "premium": premium}
 
-def require_premium(user=Depends(get_current_user)) -> Dict[str, Any]:
-    sub = fetch_one("SELECT status FROM subscriptions WHERE user_id=?", (user["id"],))
-    if not sub or sub["status"] != "active":
+async def require_premium(user=Depends(get_current_user)) -> Dict[str, Any]:
+    premium = user["premium"]
+    if premium is None:
+        premium = await _load_premium_status(user["id"]) == "active"
+    if not premium:
         raise HTTPException(status_code=403, detail="Accès premium requis.")
     return user
+
+@lru_cache(maxsize=4)
+def _admin_emails(setting: str) -> FrozenSet[str]:
+    return frozenset(e.strip().lower() for e in setting.split(",") if e.strip())
+
+async def require_admin(user=Depends(get_current_user)) -> Dict[str, Any]:
+    if user["email"].lower() not in _admin_emails(settings.ADMIN_EMAILS):
+        raise HTTPException(status_code=403, detail="Accès administrateur requis.")
+    return user
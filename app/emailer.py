@@ -1,18 +1,22 @@
+import logging
+import random
 import smtplib
+import time
+from datetime import datetime, timedelta, timezone
 from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+
 from .settings import settings
+from .db_sqlite import execute, fetch_one, transaction
+from . import db_async
+from .workers import BackgroundWorker
+from .metrics import spans
+
+log = logging.getLogger(__name__)
 
-def send_email(to_email: str, subject: str, html: str, text: str = "") -> None:
-    """Send an email using SMTP settings. In dev, if SMTP is not configured, it prints to console."""
-    if not settings.SMTP_HOST:
-        # Dev fallback
-        print("=== EMAIL (dev fallback) ===")
-        print("To:", to_email)
-        print("Subject:", subject)
-        print(text or html)
-        print("============================")
-        return
+_outbox_span = spans.labels("emailer.outbox_send")
 
+def _build_message(to_email: str, subject: str, html: str, text: str = "") -> EmailMessage:
     msg = EmailMessage()
     msg["From"] = settings.SMTP_FROM
     msg["To"] = to_email
@@ -22,15 +26,157 @@ def send_email(to_email: str, subject: str, html: str, text: str = "") -> None:
     else:
         msg.set_content("Votre client email ne supporte pas le HTML.")
     msg.add_alternative(html, subtype="html")
+    return msg
+
+def _print_email(to_email: str, subject: str, html: str, text: str = "") -> None:
+    # Dev fallback
+    print("=== EMAIL (dev fallback) ===")
+    print("To:", to_email)
+    print("Subject:", subject)
+    print(text or html)
+    print("============================")
 
+def _open_smtp() -> smtplib.SMTP:
     if settings.SMTP_USE_TLS:
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
-            s.starttls()
-            if settings.SMTP_USER:
-                s.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            s.send_message(msg)
+        s = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SEC)
+        s.starttls()
     else:
-        with smtplib.SMTP_SSL(settings.SMTP_HOST, settings.SMTP_PORT) as s:
-            if settings.SMTP_USER:
-                s.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            s.send_message(msg)
+        s = smtplib.SMTP_SSL(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SEC)
+    if settings.SMTP_USER:
+        s.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    return s
+
+# --- Outbox ---------------------------------------------------------------
+# Request handlers only insert into email_outbox; OutboxSender drains it in
+# batches over one long-lived SMTP connection.
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def aenqueue_email(to_email: str, subject: str, html: str, text: str = "") -> int:
+    """Queue an email in the outbox through the db_async writer; return its id."""
+    now = _now().isoformat()
+    outbox_id = await db_async.execute(
+        "INSERT INTO email_outbox(to_email,subject,html,text,status,attempts,next_attempt_at,created_at) VALUES (?,?,?,?,?,?,?,?)",
+        (to_email, subject, html, text, "pending", 0, now, now),
+    )
+    _sender.wake()
+    return outbox_id
+
+def _claim_batch(limit: int) -> List[Dict[str, Any]]:
+    # Rows stuck in 'sending' (worker crashed mid-batch) become claimable
+    # again once their lease runs out.
+    now = _now()
+    lease = (now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SEC)).isoformat()
+    with transaction() as conn:
+        rows = conn.execute(
+            "SELECT id,to_email,subject,html,text,attempts FROM email_outbox "
+            "WHERE status IN ('pending','sending') AND next_attempt_at<=? ORDER BY id LIMIT ?",
+            (now.isoformat(), limit),
+        ).fetchall()
+        conn.executemany("UPDATE email_outbox SET status='sending', next_attempt_at=? WHERE id=?",
+                         [(lease, r["id"]) for r in rows])
+    return [dict(r) for r in rows]
+
+def _backoff_sec(attempts: int) -> float:
+    delay = min(settings.EMAIL_RETRY_BASE_SEC * (2 ** (attempts - 1)), settings.EMAIL_RETRY_MAX_SEC)
+    return delay * random.uniform(0.8, 1.2)
+
+class OutboxSender(BackgroundWorker):
+    name = "email-outbox"
+
+    def __init__(self):
+        super().__init__(settings.EMAIL_OUTBOX_POLL_SEC)
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+            except (smtplib.SMTPException, OSError):
+                self._close()
+        if self._smtp is None:
+            self._smtp = _open_smtp()
+        return self._smtp
+
+    def _close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _deliver(self, row: Dict[str, Any]) -> None:
+        if not settings.SMTP_HOST:
+            _print_email(row["to_email"], row["subject"], row["html"], row["text"])
+            return
+        try:
+            with _outbox_span.time():
+                self._connection().send_message(_build_message(row["to_email"], row["subject"], row["html"], row["text"]))
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The server answered (4xx/5xx): the session is still usable.
+            raise
+        except OSError:
+            # Disconnected or network error (SMTPException is an OSError too):
+            # drop the session; the next attempt reconnects.
+            self._close()
+            raise
+        self._last_used = time.monotonic()
+
+    def _fail(self, row: Dict[str, Any], err: Exception) -> None:
+        attempts = row["attempts"] + 1
+        permanent = isinstance(err, smtplib.SMTPRecipientsRefused)
+        if permanent or attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            self.dead += 1
+            log.warning("email %s dead-lettered after %s attempts: %s", row["id"], attempts, err)
+            execute("UPDATE email_outbox SET status='dead', attempts=?, last_error=? WHERE id=?",
+                    (attempts, repr(err)[:500], row["id"]))
+            return
+        self.retried += 1
+        retry_at = (_now() + timedelta(seconds=_backoff_sec(attempts))).isoformat()
+        execute("UPDATE email_outbox SET status='pending', attempts=?, next_attempt_at=?, last_error=? WHERE id=?",
+                (attempts, retry_at, repr(err)[:500], row["id"]))
+
+    def run_once(self) -> bool:
+        batch = _claim_batch(settings.EMAIL_OUTBOX_BATCH)
+        if not batch:
+            if self._smtp is not None and time.monotonic() - self._last_used > settings.SMTP_IDLE_SEC:
+                self._close()
+            return False
+        for row in batch:
+            try:
+                self._deliver(row)
+            except Exception as e:
+                self._fail(row, e)
+                continue
+            self.sent += 1
+            execute("UPDATE email_outbox SET status='sent', attempts=?, sent_at=?, last_error=NULL WHERE id=?",
+                    (row["attempts"] + 1, _now().isoformat(), row["id"]))
+        return True
+
+    def on_stop(self) -> None:
+        self._close()
+
+_sender = OutboxSender()
+
+def start_outbox() -> None:
+    _sender.start()
+
+def stop_outbox() -> None:
+    _sender.stop()
+
+def outbox_stats() -> Dict[str, Any]:
+    queued = fetch_one("SELECT COUNT(*) AS n FROM email_outbox WHERE status IN ('pending','sending')")
+    dead = fetch_one("SELECT COUNT(*) AS n FROM email_outbox WHERE status='dead'")
+    return {
+        "queued": queued["n"],
+        "dead_total": dead["n"],
+        "sent": _sender.sent,
+        "retried": _sender.retried,
+        "dead_lettered": _sender.dead,
+    }
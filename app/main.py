@@ -1,16 +1,44 @@
 from fastapi import FastAPI, Body, HTTPException, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone
 
-from .routers import auth, cv, payments, webhooks, premium
-from .db_sqlite import init_db, execute
-from .deps import get_current_user
+from .routers import auth, cv, payments, webhooks, premium, orders, admin
+from .db_sqlite import PoolExhausted, init_db, close_pool
+from .db_async import execute, start_db_async, stop_db_async, db_async_stats
+from .deps import get_current_user, cache_stats
+from .security import hashing_stats, shutdown_hashing
+from .emailer import start_outbox, stop_outbox, outbox_stats
+from .storage import storage_stats
+from .audit import start_audit, stop_audit, audit_stats
+from .cv_export import export_stats, shutdown_export
+from .cv_cache import cv_cache, start_cv_cache
+from .cv_jobs import start_cv_jobs, stop_cv_jobs
+from .stripe_events import start_processor, stop_processor, event_stats
+from .metrics import MetricsMiddleware, render as render_metrics
+from .ratelimit import per_ip, start_sweeper, stop_sweeper, ratelimit_stats
+from .warmup import start_warmup
+from .maintenance import start_maintenance, stop_maintenance, maintenance_stats
+from .catalog import start_catalog, stop_catalog, catalog_stats
+from .cache import start_cache, stop_cache, shared_cache_stats
 
 app = FastAPI(title="EduQuébec API", version="0.3.0")
 
+# Async hooks: the CV job runner lives on the event loop.
 @app.on_event("startup")
-def _startup():
+async def _startup():
     init_db()
+    start_cache()
+    start_db_async()
+    start_cv_cache()
+    start_cv_jobs()
+    start_outbox()
+    start_audit()
+    start_processor()
+    start_sweeper()
+    start_maintenance()
+    start_catalog()
+    start_warmup()
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,25 +47,71 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so the histogram covers CORS and error handling too.
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(cv.router, prefix="/cv", tags=["cv"])
 app.include_router(payments.router, prefix="/payments", tags=["payments"])
 app.include_router(webhooks.router, prefix="/webhooks", tags=["webhooks"])
 app.include_router(premium.router, prefix="/premium", tags=["premium"])
+app.include_router(orders.router, prefix="/orders", tags=["orders"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
+@app.on_event("shutdown")
+async def _shutdown():
+    # First: it hands unfinished jobs back through the db_async writer.
+    await stop_cv_jobs()
+    stop_outbox()
+    stop_audit()
+    stop_processor()
+    stop_sweeper()
+    stop_maintenance()
+    stop_catalog()
+    stop_cache()
+    shutdown_hashing()
+    shutdown_export()
+    stop_db_async()
+    close_pool()
+
+@app.exception_handler(PoolExhausted)
+def _pool_exhausted(request, exc):
+    return JSONResponse({"detail": "Serveur occupé, réessayez dans un instant."}, status_code=503,
+                        headers={"Retry-After": "1"})
 
 @app.get("/health")
 def health():
     return {"ok": True, "ts": datetime.now(timezone.utc).isoformat()}
 
-@app.post("/contact")
-def contact(payload: dict = Body(...)):
+@app.get("/health/stats")
+def health_stats():
+    return {
+        "hashing": hashing_stats(),
+        "cv_export": export_stats(),
+        "cv_cache": cv_cache.stats(),
+        "cache": {**cache_stats(), "shared": shared_cache_stats()},
+        "email_outbox": outbox_stats(),
+        "storage": storage_stats(),
+        "audit": audit_stats(),
+        "stripe_events": event_stats(),
+        "rate_limit": ratelimit_stats(),
+        "db_async": db_async_stats(),
+        "maintenance": maintenance_stats(),
+        "catalog": catalog_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(health_stats()), media_type="text/plain; version=0.0.4")
+
+@app.post("/contact", dependencies=[Depends(per_ip("contact_ip"))])
+async def contact(payload: dict = Body(...)):
     name = str(payload.get("name","")).strip() or str(payload.get("cName","")).strip()
     email = str(payload.get("email","")).strip() or str(payload.get("cEmail","")).strip()
     message = str(payload.get("message","")).strip() or str(payload.get("cMsg","")).strip()
     if not name or not email or not message:
         raise HTTPException(status_code=400, detail="Champs requis: name, email, message.")
     now = datetime.now(timezone.utc).isoformat()
-    execute("INSERT INTO contact_messages(name,email,message,created_at) VALUES (?,?,?,?)",
+    await execute("INSERT INTO contact_messages(name,email,message,created_at) VALUES (?,?,?,?)",
             (name, email, message, now))
     return {"ok": True}
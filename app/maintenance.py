@@ -0,0 +1,311 @@
+"""Periodic SQLite housekeeping, run by one worker at a time.
+
+Every MAINTENANCE_TICK_SEC each worker tries to take or renew the
+`maintenance` lease in the `leases` table; the holder runs the jobs that
+are due. If it dies, another worker takes over once the lease expires.
+The last run of each job is kept in `maintenance_runs`, so the schedule
+survives restarts and leader changes and every worker can report it.
+
+Deletes and moves go in batches of MAINTENANCE_BATCH_ROWS, each in its own
+short transaction, so request writes never wait long for the lock.
+"""
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .settings import settings
+from . import db_sqlite
+from .cv_jobs import jobs_dir
+from .workers import BackgroundWorker
+
+log = logging.getLogger(__name__)
+
+LEASE = "maintenance"
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+@contextmanager
+def _write(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _batches(step: Callable[[int], int]) -> int:
+    """Call `step(limit)` until it handles fewer than `limit` rows; return the total."""
+    total = 0
+    for _ in range(settings.MAINTENANCE_MAX_BATCHES):
+        n = step(settings.MAINTENANCE_BATCH_ROWS)
+        total += n
+        if n < settings.MAINTENANCE_BATCH_ROWS or _scheduler.stopping:
+            break
+        time.sleep(settings.MAINTENANCE_BATCH_PAUSE_MS / 1000)
+    return total
+
+# --- Jobs ---------------------------------------------------------------------
+# Each job gets the scheduler's own autocommit connection and returns the
+# number of rows (or pages, or WAL frames) it handled.
+
+def purge_verify_tokens(conn: sqlite3.Connection) -> int:
+    """Clear verification tokens past their expiry: /auth/verify rejects them anyway."""
+    now = _now().isoformat()
+
+    def step(limit: int) -> int:
+        with _write(conn):
+            return conn.execute(
+                "UPDATE users SET verify_token=NULL, verify_token_expires_at=NULL WHERE id IN "
+                "(SELECT id FROM users WHERE verify_token IS NOT NULL AND verify_token_expires_at<? LIMIT ?)",
+                (now, limit),
+            ).rowcount
+    return _batches(step)
+
+def purge_unverified_users(conn: sqlite3.Connection) -> int:
+    """Delete accounts left unverified for MAINTENANCE_UNVERIFIED_DAYS.
+
+    Accounts with a verification link still valid (a recent re-registration),
+    a subscription or an order are kept.
+    """
+    now = _now()
+    cutoff = (now - timedelta(days=settings.MAINTENANCE_UNVERIFIED_DAYS)).isoformat()
+
+    def step(limit: int) -> int:
+        with _write(conn):
+            return conn.execute(
+                "DELETE FROM users WHERE id IN (SELECT u.id FROM users u WHERE u.email_verified=0 AND u.created_at<? "
+                "AND (u.verify_token_expires_at IS NULL OR u.verify_token_expires_at<?) "
+                "AND NOT EXISTS (SELECT 1 FROM subscriptions s WHERE s.user_id=u.id) "
+                "AND NOT EXISTS (SELECT 1 FROM orders o WHERE o.user_id=u.id) LIMIT ?)",
+                (cutoff, now.isoformat(), limit),
+            ).rowcount
+    return _batches(step)
+
+def expire_cv_jobs(conn: sqlite3.Connection) -> int:
+    """Delete finished CV export jobs after CV_JOB_RETENTION_HOURS: their files, items and row.
+
+    Files go first, so a crash in between leaves rows the next run deletes,
+    never files nothing points to.
+    """
+    cutoff = (_now() - timedelta(hours=settings.CV_JOB_RETENTION_HOURS)).isoformat()
+
+    def step(limit: int) -> int:
+        ids = [row["id"] for row in conn.execute(
+            "SELECT id FROM cv_jobs WHERE status IN ('done','partial','failed') AND updated_at<? LIMIT ?", (cutoff, limit),
+        )]
+        for job_id in ids:
+            shutil.rmtree(jobs_dir() / job_id, ignore_errors=True)
+        with _write(conn):
+            conn.executemany("DELETE FROM cv_job_items WHERE job_id=?", [(job_id,) for job_id in ids])
+            conn.executemany("DELETE FROM cv_jobs WHERE id=?", [(job_id,) for job_id in ids])
+        return len(ids)
+    return _batches(step)
+
+def archive_path() -> Path:
+    if settings.MAINTENANCE_ARCHIVE_PATH:
+        return Path(settings.MAINTENANCE_ARCHIVE_PATH)
+    db = Path(db_sqlite.DB_PATH)
+    return db.with_name(f"{db.stem}-archive{db.suffix}")
+
+def archive_downloads(conn: sqlite3.Connection) -> int:
+    """Move premium_downloads rows older than the retention period to the archive database.
+
+    Rows are committed to the archive before they are deleted here, so a
+    crash in between leaves copies that the next run skips, never lost rows.
+    download_rollups and the per-file and per-user totals keep counting them.
+    """
+    if settings.MAINTENANCE_DOWNLOAD_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = (_now() - timedelta(days=settings.MAINTENANCE_DOWNLOAD_RETENTION_DAYS)).isoformat()
+    archive = db_sqlite.connect(archive_path())
+    try:
+        archive.execute("""CREATE TABLE IF NOT EXISTS premium_downloads (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )""")
+
+        def step(limit: int) -> int:
+            rows = conn.execute(
+                "SELECT id,user_id,file_id,created_at FROM premium_downloads WHERE created_at<? "
+                "ORDER BY created_at LIMIT ?", (cutoff, limit),
+            ).fetchall()
+            if not rows:
+                return 0
+            archived_at = _now().isoformat()
+            with _write(archive):
+                archive.executemany(
+                    "INSERT OR IGNORE INTO premium_downloads(id,user_id,file_id,created_at,archived_at) VALUES (?,?,?,?,?)",
+                    [(r["id"], r["user_id"], r["file_id"], r["created_at"], archived_at) for r in rows],
+                )
+            with _write(conn):
+                conn.executemany("DELETE FROM premium_downloads WHERE id=?", [(r["id"],) for r in rows])
+            return len(rows)
+        return _batches(step)
+    finally:
+        archive.close()
+
+def optimize(conn: sqlite3.Connection) -> int:
+    """Refresh the query planner's statistics, sampling at most 1000 rows per index."""
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    return conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0]
+
+def wal_checkpoint(conn: sqlite3.Connection) -> int:
+    """Copy committed WAL frames into the database file.
+
+    PASSIVE never waits for readers or writers; frames still in use are
+    copied on a later run.
+    """
+    # (busy, frames in the WAL, frames checkpointed); -1s when not in WAL mode.
+    return max(0, conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()[2])
+
+def incremental_vacuum(conn: sqlite3.Connection) -> int:
+    """Return up to MAINTENANCE_VACUUM_PAGES free pages to the filesystem.
+
+    Needs auto_vacuum=INCREMENTAL: the default for new databases, and
+    `python -m scripts.maintenance --enable-incremental-vacuum` for older ones.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # executescript steps the pragma to completion; execute() frees one page.
+    conn.executescript(f"PRAGMA incremental_vacuum({int(settings.MAINTENANCE_VACUUM_PAGES)});")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    run: Callable[[sqlite3.Connection], int]
+    interval_setting: str
+
+    @property
+    def interval(self) -> float:
+        return getattr(settings, self.interval_setting)
+
+JOBS: List[Job] = [
+    Job("purge_verify_tokens", purge_verify_tokens, "MAINTENANCE_PURGE_SEC"),
+    Job("purge_unverified_users", purge_unverified_users, "MAINTENANCE_PURGE_SEC"),
+    Job("expire_cv_jobs", expire_cv_jobs, "MAINTENANCE_PURGE_SEC"),
+    Job("archive_downloads", archive_downloads, "MAINTENANCE_ARCHIVE_SEC"),
+    Job("optimize", optimize, "MAINTENANCE_OPTIMIZE_SEC"),
+    Job("wal_checkpoint", wal_checkpoint, "MAINTENANCE_CHECKPOINT_SEC"),
+    Job("incremental_vacuum", incremental_vacuum, "MAINTENANCE_VACUUM_SEC"),
+]
+
+def run_job(conn: sqlite3.Connection, job: Job) -> Dict[str, Any]:
+    """Run `job` now and record the outcome in maintenance_runs."""
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        rows, status, error = job.run(conn), "ok", None
+    except Exception as exc:
+        log.exception("maintenance: %s failed", job.name)
+        rows, status, error = 0, "error", repr(exc)[:500]
+    duration_ms = (time.perf_counter() - start) * 1000
+    with _write(conn):
+        conn.execute(
+            "INSERT INTO maintenance_runs(job,started_at,duration_ms,rows,status,error) VALUES (?,?,?,?,?,?) "
+            "ON CONFLICT(job) DO UPDATE SET started_at=excluded.started_at, duration_ms=excluded.duration_ms, "
+            "rows=excluded.rows, status=excluded.status, error=excluded.error",
+            (job.name, started_at, duration_ms, rows, status, error),
+        )
+    log.info("maintenance: %s %s, %s rows in %.0f ms", job.name, status, rows, duration_ms)
+    return {"job": job.name, "rows": rows, "status": status, "duration_ms": duration_ms}
+
+class MaintenanceScheduler(BackgroundWorker):
+    name = "maintenance"
+
+    def __init__(self):
+        super().__init__(settings.MAINTENANCE_TICK_SEC)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leader = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._armed = False
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = db_sqlite.connect(db_sqlite.DB_PATH)
+        return self._conn
+
+    def _renew(self, conn: sqlite3.Connection) -> bool:
+        now = time.time()
+        with _write(conn):
+            cur = conn.execute(
+                "INSERT INTO leases(name,holder,expires_at) VALUES (?,?,?) "
+                "ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at "
+                "WHERE leases.holder=excluded.holder OR leases.expires_at<?",
+                (LEASE, self.holder, now + settings.MAINTENANCE_LEASE_SEC, now),
+            )
+        return cur.rowcount == 1
+
+    def run_once(self) -> bool:
+        if not self._armed:
+            # First tick one interval after startup, not during it.
+            self._armed = True
+            return False
+        conn = self._connection()
+        leader = self._renew(conn)
+        if leader != self.leader:
+            log.info("maintenance: %s the lease (%s)", "took" if leader else "lost", self.holder)
+        self.leader = leader
+        if not leader:
+            return False
+        last = {row["job"]: row["started_at"] for row in conn.execute("SELECT job, started_at FROM maintenance_runs")}
+        for job in JOBS:
+            if self.stopping:
+                break
+            if time.time() - last.get(job.name, 0.0) < job.interval:
+                continue
+            run_job(conn, job)
+            if not self._renew(conn):
+                self.leader = False
+                break
+        return False
+
+    def on_stop(self) -> None:
+        if self._conn is None:
+            return
+        if self.leader:
+            with _write(self._conn):
+                self._conn.execute("DELETE FROM leases WHERE name=? AND holder=?", (LEASE, self.holder))
+            self.leader = False
+        self._conn.close()
+        self._conn = None
+        self._armed = False
+
+_scheduler = MaintenanceScheduler()
+
+def start_maintenance() -> None:
+    if settings.MAINTENANCE_ENABLED:
+        _scheduler.start()
+
+def stop_maintenance() -> None:
+    _scheduler.stop()
+
+def maintenance_stats() -> Dict[str, Any]:
+    jobs = {}
+    for row in db_sqlite.fetch_all("SELECT job,started_at,duration_ms,rows,status,error FROM maintenance_runs"):
+        jobs[row["job"]] = {
+            "last_run_at": datetime.fromtimestamp(row["started_at"], timezone.utc).isoformat(),
+            "last_run_ts": row["started_at"],
+            "duration_ms": row["duration_ms"],
+            "rows": row["rows"],
+            "status": row["status"],
+            "error": row["error"],
+        }
+    return {"leader": _scheduler.leader, "holder": _scheduler.holder, "jobs": jobs}
@@ -0,0 +1,233 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in order, inside the same transaction that
+records it in `schema_version`. `db_sqlite.SCHEMA` is the frozen baseline
+(version 1); later schema changes are appended here as new versions.
+"""
+import sqlite3
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple, Union
+
+from .db_sqlite import SCHEMA, transaction
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+def _legacy_user_columns(conn: sqlite3.Connection) -> None:
+    # Databases created before email verification lack these columns.
+    cols_needed = {
+        "is_active": "INTEGER NOT NULL DEFAULT 0",
+        "email_verified": "INTEGER NOT NULL DEFAULT 0",
+        "verify_token": "TEXT",
+        "verify_token_expires_at": "TEXT",
+    }
+    existing = {r["name"] for r in conn.execute("PRAGMA table_info(users)").fetchall()}
+    for name, ddl in cols_needed.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {name} {ddl}")
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "baseline schema", [*SCHEMA, _legacy_user_columns]),
+    (2, "lookup indexes and one subscription per user", [
+        "CREATE INDEX IF NOT EXISTS idx_users_verify_token ON users(verify_token) WHERE verify_token IS NOT NULL",
+        # Keep one row per user (the active one if any, else the latest)
+        # before enforcing uniqueness; the webhook now upserts.
+        """DELETE FROM subscriptions WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id ORDER BY status='active' DESC, id DESC
+                ) AS rn FROM subscriptions
+            ) WHERE rn=1
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_premium_downloads_user ON premium_downloads(user_id, created_at)",
+    ]),
+    (3, "stripe event inbox", [
+        """CREATE TABLE IF NOT EXISTS stripe_events (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            created INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            received_at TEXT NOT NULL,
+            processed_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_stripe_events_status ON stripe_events(status, created)",
+    ]),
+    (4, "shared rate limit buckets", [
+        """CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL,
+            full_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_rate_limits_full_at ON rate_limits(full_at)",
+    ]),
+    (5, "token versions", [
+        "ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN token_min_version INTEGER NOT NULL DEFAULT 0",
+        """CREATE TABLE IF NOT EXISTS token_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_version INTEGER NOT NULL,
+            min_version INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_token_events_created ON token_events(created_at)",
+    ]),
+    (6, "orders, download history index and download rollups", [
+        """CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,
+            provider_ref TEXT NOT NULL UNIQUE,
+            product TEXT NOT NULL,
+            amount_total INTEGER,
+            currency TEXT,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id, id)",
+        # Checkouts already applied through the event inbox, then any older
+        # subscription that predates it.
+        """INSERT OR IGNORE INTO orders(user_id,provider,provider_ref,product,amount_total,currency,status,created_at)
+            SELECT u.id, 'stripe', json_extract(e.payload, '$.data.object.id'), 'premium',
+                   json_extract(e.payload, '$.data.object.amount_total'), json_extract(e.payload, '$.data.object.currency'),
+                   'paid', strftime('%Y-%m-%dT%H:%M:%S+00:00', e.created, 'unixepoch')
+            FROM stripe_events e
+            JOIN users u ON u.email = lower(trim(json_extract(e.payload, '$.data.object.metadata.email')))
+            WHERE e.type='checkout.session.completed' AND e.status='processed'
+              AND json_extract(e.payload, '$.data.object.id') IS NOT NULL
+            ORDER BY e.created""",
+        """INSERT OR IGNORE INTO orders(user_id,provider,provider_ref,product,status,created_at)
+            SELECT user_id, provider, provider_ref, 'premium', 'paid', updated_at FROM subscriptions
+            WHERE provider='stripe' AND provider_ref IS NOT NULL""",
+        # Covers the history query, so pages are read from the index alone.
+        "CREATE INDEX IF NOT EXISTS idx_premium_downloads_history ON premium_downloads(user_id, id, file_id, created_at)",
+        "DROP INDEX IF EXISTS idx_premium_downloads_user",
+        """CREATE TABLE IF NOT EXISTS download_rollups (
+            file_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            downloads INTEGER NOT NULL,
+            PRIMARY KEY(file_id, day)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_download_rollups_day ON download_rollups(day, file_id, downloads)",
+        """CREATE TABLE IF NOT EXISTS download_file_totals (
+            file_id TEXT PRIMARY KEY,
+            downloads INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_download_file_totals_downloads ON download_file_totals(downloads DESC, file_id)",
+        """CREATE TABLE IF NOT EXISTS download_user_totals (
+            user_id INTEGER PRIMARY KEY,
+            downloads INTEGER NOT NULL,
+            last_download_at TEXT NOT NULL
+        )""",
+        """INSERT INTO download_rollups(file_id,day,downloads)
+            SELECT file_id, substr(created_at, 1, 10), COUNT(*) FROM premium_downloads GROUP BY 1, 2""",
+        """INSERT INTO download_file_totals(file_id,downloads)
+            SELECT file_id, COUNT(*) FROM premium_downloads GROUP BY file_id""",
+        """INSERT INTO download_user_totals(user_id,downloads,last_download_at)
+            SELECT user_id, COUNT(*), MAX(created_at) FROM premium_downloads GROUP BY user_id""",
+    ]),
+    (7, "created_at indexes for exports", [
+        "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_contact_messages_created ON contact_messages(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_premium_downloads_created ON premium_downloads(created_at)",
+    ]),
+    (8, "maintenance scheduler", [
+        """CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS maintenance_runs (
+            job TEXT PRIMARY KEY,
+            started_at REAL NOT NULL,
+            duration_ms REAL NOT NULL,
+            rows INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_users_verify_expires ON users(verify_token_expires_at) WHERE verify_token IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_users_unverified ON users(created_at) WHERE email_verified=0",
+    ]),
+    # Shared rate limit buckets now live in their own file (ratelimit.buckets_path).
+    (9, "drop rate_limits", [
+        "DROP TABLE IF EXISTS rate_limits",
+    ]),
+    # Databases created before these tables had a migration of their own
+    # may already have them.
+    (10, "email outbox", [
+        """CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            text TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)",
+    ]),
+    (11, "cv export jobs", [
+        """CREATE TABLE IF NOT EXISTS cv_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            fmt TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            total INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            lease_until TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_cv_jobs_status ON cv_jobs(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_cv_jobs_user ON cv_jobs(user_id, status)",
+        """CREATE TABLE IF NOT EXISTS cv_job_items (
+            job_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            error TEXT,
+            PRIMARY KEY(job_id, idx),
+            FOREIGN KEY(job_id) REFERENCES cv_jobs(id)
+        )""",
+    ]),
+]
+
+def current_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) AS v FROM schema_version").fetchone()
+    return row["v"] or 0
+
+def migrate() -> int:
+    """Apply pending migrations; return the resulting schema version."""
+    with transaction() as conn:
+        conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )""")
+        version = current_version(conn)
+        for number, name, steps in MIGRATIONS:
+            if number <= version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute("INSERT INTO schema_version(version,name,applied_at) VALUES (?,?,?)",
+                         (number, name, datetime.now(timezone.utc).isoformat()))
+            version = number
+    return version
@@ -0,0 +1,35 @@
+"""Keyset (cursor) pagination over descending integer ids.
+
+A page is `WHERE ... AND id<? ORDER BY id DESC LIMIT limit+1`: the cost
+does not grow with the page number the way OFFSET does, and rows inserted
+meanwhile do not shift later pages.
+"""
+import base64
+import binascii
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+START = 2 ** 63 - 1  # above any rowid
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Id to continue below; no cursor starts at the newest row."""
+    if not cursor:
+        return START
+    try:
+        last_id = int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        last_id = 0
+    # Out of range ids would fail as SQLite parameters (a 500), not match nothing.
+    if not 0 < last_id <= START:
+        raise HTTPException(status_code=400, detail="Curseur invalide.")
+    return last_id
+
+def page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Shape `limit + 1` fetched rows into a page and the cursor of the next one."""
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]["id"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
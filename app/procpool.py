@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+log = logging.getLogger(__name__)
+
+class BoundedProcessPool:
+    """Lazily started process pool for CPU-bound work called from async handlers.
+
+    At most `queue_max` calls may be in flight; further calls are rejected
+    with 503 instead of queueing without limit. A pool broken by a dead worker
+    (OOM kill, crash in a C extension) is replaced and the call retried once.
+    Per-call latency is kept for the last 1024 calls.
+    """
+
+    def __init__(self, name: str, workers: int, queue_max: int,
+                 initializer: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_max = queue_max
+        self.initializer = initializer
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._done = 0
+        self._restarts = 0
+        self._total_sec = 0.0
+        self._recent: Deque[float] = deque(maxlen=1024)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                )
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is not pool:  # another caller already replaced it
+                return
+            self._pool = None
+            self._restarts += 1
+        log.warning("%s process pool broken, starting a new one", self.name)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        pool = self._get_pool()
+        try:
+            return await asyncio.wrap_future(pool.submit(fn, *args))
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.queue_max:
+                self._rejected += 1
+                raise HTTPException(status_code=503, detail="Serveur occupé, réessayez dans un instant.",
+                                    headers={"Retry-After": "1"})
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            try:
+                return await self._submit(fn, *args)
+            except BrokenProcessPool:
+                pass
+            try:
+                return await self._submit(fn, *args)
+            except BrokenProcessPool:
+                raise HTTPException(status_code=503, detail="Serveur occupé, réessayez dans un instant.",
+                                    headers={"Retry-After": "1"})
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                self._done += 1
+                self._total_sec += elapsed
+                self._recent.append(elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            stats = {
+                "workers": self.workers,
+                "in_flight": self._pending,
+                "queue_depth": max(0, self._pending - self.workers),
+                "queue_max": self.queue_max,
+                "completed": self._done,
+                "rejected": self._rejected,
+                "restarts": self._restarts,
+                "avg_ms": (self._total_sec / self._done * 1000) if self._done else 0.0,
+            }
+        if recent:
+            stats["p50_ms"] = recent[len(recent) // 2] * 1000
+            stats["p95_ms"] = recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,305 @@
+"""Token-bucket rate limits per client IP and per email.
+
+Buckets live in memory, spread over lock-striped shards so concurrent
+requests rarely contend, and full (idle) buckets are swept periodically.
+With RATE_LIMIT_BACKEND=sqlite the buckets are kept in a small SQLite file
+next to the database instead (RATE_LIMIT_SQLITE_PATH), so limits hold
+across uvicorn workers without taking the main database's write lock;
+each worker still remembers which keys it saw rejected, so repeat
+offenders are turned away without touching the file.
+
+Checks run before any hashing, email or database work in the routes.
+"""
+import logging
+import math
+import threading
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from .settings import settings
+from . import db_sqlite
+from .workers import BackgroundWorker
+
+log = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    capacity: float  # burst size
+    rate: float  # tokens refilled per second
+
+@lru_cache(maxsize=None)
+def _parse(name: str, spec: str) -> Rule:
+    # "10/60": 10 requests, refilled over 60 seconds.
+    count, _, period = spec.partition("/")
+    return Rule(name, float(count), float(count) / float(period or 1))
+
+def rule(name: str) -> Rule:
+    return _parse(name, getattr(settings, f"RATE_LIMIT_{name.upper()}"))
+
+def _refill(tokens: float, updated: float, now: float, r: Rule) -> float:
+    return min(r.capacity, tokens + (now - updated) * r.rate)
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, List[float]] = {}  # key -> [tokens, updated]
+
+class MemoryBuckets:
+    def __init__(self, shards: int):
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def take(self, r: Rule, key: str) -> float:
+        """Spend one token; return 0, or the seconds until one is available."""
+        now = time.monotonic()
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [r.capacity, now]
+            tokens = _refill(bucket[0], bucket[1], now, r)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / r.rate
+
+    def sweep(self, rules: Dict[str, Rule]) -> int:
+        """Drop buckets that have refilled completely: they are equivalent to no bucket."""
+        now = time.monotonic()
+        dropped = 0
+        for shard in self._shards:
+            with shard.lock:
+                idle = []
+                for key, (tokens, updated) in shard.buckets.items():
+                    r = rules.get(key.partition(":")[0])
+                    if r is None or _refill(tokens, updated, now, r) >= r.capacity:
+                        idle.append(key)
+                for key in idle:
+                    del shard.buckets[key]
+            dropped += len(idle)
+        return dropped
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL,
+        full_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_rate_limits_full_at ON rate_limits(full_at)",
+]
+
+def buckets_path() -> Path:
+    if settings.RATE_LIMIT_SQLITE_PATH:
+        return Path(settings.RATE_LIMIT_SQLITE_PATH)
+    db = Path(db_sqlite.DB_PATH)
+    return db.with_name(f"{db.stem}-ratelimit{db.suffix}")
+
+class SQLiteBuckets:
+    """Buckets in their own file, one connection per thread."""
+
+    def __init__(self):
+        self._path: Optional[Path] = None
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                if self._path is None:
+                    path = buckets_path()
+                    setup = db_sqlite.connect(path)
+                    try:
+                        for statement in _SCHEMA:
+                            setup.execute(statement)
+                    finally:
+                        setup.close()
+                    self._path = path
+            conn = self._local.conn = db_sqlite.connect(self._path)
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def take(self, r: Rule, key: str) -> float:
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key=?", (key,)).fetchone()
+            tokens = _refill(row["tokens"], row["updated"], now, r) if row else r.capacity
+            retry_after = 0.0 if tokens >= 1 else (1 - tokens) / r.rate
+            if not retry_after:
+                tokens -= 1
+            conn.execute(
+                "INSERT INTO rate_limits(key,tokens,updated,full_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens=excluded.tokens, updated=excluded.updated, full_at=excluded.full_at",
+                (key, tokens, now, now + (r.capacity - tokens) / r.rate),
+            )
+        return retry_after
+
+    def sweep(self, rules: Dict[str, Rule]) -> int:
+        with self._write() as conn:
+            return conn.execute("DELETE FROM rate_limits WHERE full_at<=?", (time.time(),)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._conns = self._conns, []
+            self._path = None
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+class RateLimiter:
+    def __init__(self):
+        self._memory = MemoryBuckets(settings.RATE_LIMIT_SHARDS)
+        self._shared = SQLiteBuckets()
+        # Shared mode only: key -> [monotonic time until which it is known to be rejected]
+        self._blocked = [_Shard() for _ in range(settings.RATE_LIMIT_SHARDS)]
+        self._rules: Dict[str, Rule] = {}
+        self.rejected: Dict[str, int] = {}
+        self._rejected_lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        return settings.RATE_LIMIT_BACKEND == "sqlite"
+
+    def _check_blocked(self, key: str) -> float:
+        shard = self._blocked[hash(key) % len(self._blocked)]
+        until = shard.buckets.get(key)
+        if until is None:
+            return 0.0
+        remaining = until[0] - time.monotonic()
+        return remaining if remaining > 0 else 0.0
+
+    def _block(self, key: str, seconds: float) -> None:
+        shard = self._blocked[hash(key) % len(self._blocked)]
+        with shard.lock:
+            shard.buckets[key] = [time.monotonic() + seconds]
+
+    def _reject(self, r: Rule, retry_after: float) -> HTTPException:
+        with self._rejected_lock:
+            self.rejected[r.name] = self.rejected.get(r.name, 0) + 1
+        return HTTPException(status_code=429, detail="Trop de requêtes, réessayez plus tard.",
+                             headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def _prepare(self, name: str, value: str) -> Tuple[Optional[Rule], str, float]:
+        if not settings.RATE_LIMIT_ENABLED:
+            return None, "", 0.0
+        r = rule(name)
+        self._rules[name] = r
+        key = f"{name}:{value}"
+        return r, key, self._check_blocked(key) if self.shared else 0.0
+
+    def hit(self, name: str, value: str) -> None:
+        """Spend a token from bucket `name` for `value`; raise 429 when it is empty."""
+        r, key, blocked = self._prepare(name, value)
+        if r is None:
+            return
+        if blocked:
+            raise self._reject(r, blocked)
+        retry_after = self._shared.take(r, key) if self.shared else self._memory.take(r, key)
+        if retry_after:
+            if self.shared:
+                self._block(key, retry_after)
+            raise self._reject(r, retry_after)
+
+    async def ahit(self, name: str, value: str) -> None:
+        """hit() for async routes: the in-memory path stays on the event loop."""
+        if self.shared:
+            r, key, blocked = self._prepare(name, value)
+            if r is not None and blocked:
+                raise self._reject(r, blocked)
+            await run_in_threadpool(self.hit, name, value)
+        else:
+            self.hit(name, value)
+
+    def sweep(self) -> int:
+        rules = dict(self._rules)
+        if not rules:
+            return 0
+        now = time.monotonic()
+        for shard in self._blocked:
+            with shard.lock:
+                for key in [k for k, (until,) in shard.buckets.items() if until <= now]:
+                    del shard.buckets[key]
+        return self._shared.sweep(rules) if self.shared else self._memory.sweep(rules)
+
+    def close(self) -> None:
+        self._shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._rejected_lock:
+            rejected = dict(self.rejected)
+        return {
+            "backend": settings.RATE_LIMIT_BACKEND,
+            "buckets": len(self._memory),
+            "rejected": rejected,
+        }
+
+limiter = RateLimiter()
+
+def client_ip(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def per_ip(name: str) -> Callable:
+    """Route dependency spending one token from `name` for the client's IP."""
+    async def dependency(request: Request) -> None:
+        await limiter.ahit(name, client_ip(request))
+    return dependency
+
+class _Sweeper(BackgroundWorker):
+    name = "rate-limit-sweeper"
+
+    def __init__(self):
+        super().__init__(settings.RATE_LIMIT_SWEEP_SEC)
+
+    def run_once(self) -> bool:
+        dropped = limiter.sweep()
+        if dropped:
+            log.debug("rate limiter: dropped %s idle buckets", dropped)
+        return False
+
+_sweeper = _Sweeper()
+
+def start_sweeper() -> None:
+    _sweeper.start()
+
+def stop_sweeper() -> None:
+    _sweeper.stop()
+    limiter.close()
+
+def ratelimit_stats() -> Dict[str, Any]:
+    return limiter.stats()
@@ -0,0 +1,145 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Literal, Optional
+import csv
+import io
+import json
+import threading
+import zlib
+
+from ..deps import require_admin
+from ..db_sqlite import iter_rows
+from ..settings import settings
+
+router = APIRouter()
+
+Table = Literal["users", "contact_messages", "premium_downloads"]
+
+# Exported columns; secrets (password hashes, verification tokens) stay out.
+COLUMNS: Dict[str, List[str]] = {
+    "users": ["id", "email", "created_at", "is_active", "email_verified"],
+    "contact_messages": ["id", "name", "email", "message", "created_at"],
+    "premium_downloads": ["id", "user_id", "file_id", "created_at"],
+}
+
+CHUNK_BYTES = 64 * 1024
+
+_active = 0
+_active_lock = threading.Lock()
+
+def _rows(table: str, since: str, until: str) -> Iterator[Dict[str, Any]]:
+    # Range on the created_at index, in index order: no sort, no full result in memory.
+    if table == "users":
+        return iter_rows("SELECT id,email,created_at,is_active,email_verified FROM users "
+                         "WHERE created_at>=? AND created_at<? ORDER BY created_at, id", (since, until))
+    if table == "contact_messages":
+        return iter_rows("SELECT id,name,email,message,created_at FROM contact_messages "
+                         "WHERE created_at>=? AND created_at<? ORDER BY created_at, id", (since, until))
+    return iter_rows("SELECT id,user_id,file_id,created_at FROM premium_downloads "
+                     "WHERE created_at>=? AND created_at<? ORDER BY created_at, id", (since, until))
+
+def _csv_cell(value: Any) -> Any:
+    # Spreadsheet apps run cells starting with these as formulas.
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        return "'" + value
+    return value
+
+def _csv(rows: Iterator[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_cell(row[c]) for c in columns])
+        if buf.tell() >= CHUNK_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+def _ndjson(rows: Iterator[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    parts: List[str] = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode("utf-8")
+            parts.clear()
+            size = 0
+    yield "".join(parts).encode("utf-8")
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+class _Slot:
+    """One of the EXPORT_MAX_CONCURRENT export slots; release() is idempotent."""
+
+    def __init__(self):
+        global _active
+        with _active_lock:
+            if _active >= settings.EXPORT_MAX_CONCURRENT:
+                raise HTTPException(status_code=503, detail="Export déjà en cours, réessayez plus tard.",
+                                    headers={"Retry-After": "30"})
+            _active += 1
+        self._held = True
+
+    def release(self) -> None:
+        global _active
+        with _active_lock:
+            if self._held:
+                self._held = False
+                _active -= 1
+
+def _tracked(chunks: Iterator[bytes], slot: _Slot) -> Iterator[bytes]:
+    try:
+        yield from chunks
+    finally:
+        chunks.close()
+        slot.release()
+
+def _done(body: Iterator[bytes], slot: _Slot) -> None:
+    # Runs once the response ends, even if the client left before the body
+    # was started (then _tracked's finally never runs). close() raises if a
+    # threadpool next() is still inside the generator; the slot goes anyway.
+    try:
+        body.close()
+    finally:
+        slot.release()
+
+def _bound(value: Optional[datetime], default: str) -> str:
+    if value is None:
+        return default
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+@router.get("/export/{table}")
+def export(table: Table, format: Literal["csv", "ndjson"] = "csv", gzip: bool = False,
+           since: Optional[datetime] = Query(None, description="created_at >= since"),
+           until: Optional[datetime] = Query(None, description="created_at < until"),
+           admin=Depends(require_admin)):
+    slot = _Slot()
+    try:
+        rows = _rows(table, _bound(since, ""), _bound(until, "9999"))
+        encode = _csv if format == "csv" else _ndjson
+        chunks = encode(rows, COLUMNS[table])
+        media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+        filename = f"{table}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{format}"
+        if gzip:
+            chunks = _gzip(chunks)
+            media_type = "application/gzip"
+            filename += ".gz"
+        body = _tracked(chunks, slot)
+        return StreamingResponse(body, media_type=media_type, background=BackgroundTask(_done, body, slot),
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    except BaseException:
+        slot.release()
+        raise
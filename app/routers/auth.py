@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timezone, timedelta
 import secrets
 
-from ..security import hash_password, verify_password, create_access_token
-from ..db_sqlite import fetch_one, execute
+from ..security import hash_password_async, verify_password_async, create_access_token
+from ..db_async import fetch_one, execute, write
 from ..settings import settings
-from ..emailer import send_email
+from ..emailer import aenqueue_email
+from ..deps import get_current_user, ainvalidate_user
+from ..token_versions import bump, token_versions
+from ..ratelimit import limiter, per_ip
 
 router = APIRouter()
 
@@ -32,28 +35,36 @@ def _verify_link(token: str) -> str:
     base = settings.FRONTEND_BASE_URL.rstrip("/")
     return f"{base}/verify.html?token={token}"
 
-@router.post("/register")
-def register(payload: RegisterIn):
+@router.post("/register", dependencies=[Depends(per_ip("register_ip"))])
+async def register(payload: RegisterIn):
     email = payload.email.lower().strip()
+    await limiter.ahit("register_email", email)
     if len(payload.password) < 8:
         raise HTTPException(status_code=400, detail="Mot de passe trop court (8 caractères minimum).")
 
-    existing = fetch_one("SELECT id, is_active, email_verified FROM users WHERE email=?", (email,))
+    existing = await fetch_one("SELECT id, is_active, email_verified FROM users WHERE email=?", (email,))
     if existing and int(existing.get("email_verified", 0)) == 1:
         raise HTTPException(status_code=409, detail="Utilisateur déjà enregistré.")
 
+    password_hash = await hash_password_async(payload.password)
     token = _make_token()
     expires = (datetime.now(timezone.utc) + timedelta(minutes=settings.EMAIL_VERIFY_EXPIRES_MIN)).isoformat()
 
     if existing:
         # user exists but not verified yet -> refresh token
-        execute("UPDATE users SET password_hash=?, verify_token=?, verify_token_expires_at=?, is_active=0, email_verified=0 WHERE email=?",
-                (hash_password(payload.password), token, expires, email))
+        def reset(conn):
+            conn.execute("UPDATE users SET password_hash=?, verify_token=?, verify_token_expires_at=?, is_active=0, email_verified=0 WHERE email=?",
+                         (password_hash, token, expires, email))
+            # New password: tokens issued with the old one are revoked.
+            bump(conn, existing["id"], revoke=True)
+        await write(reset)
+        await token_versions.arefresh()
     else:
-        execute(
+        await execute(
             "INSERT INTO users(email,password_hash,created_at,is_active,email_verified,verify_token,verify_token_expires_at) VALUES (?,?,?,?,?,?,?)",
-            (email, hash_password(payload.password), _now_iso(), 0, 0, token, expires),
+            (email, password_hash, _now_iso(), 0, 0, token, expires),
         )
+    await ainvalidate_user(email=email)
 
     link = _verify_link(token)
     subject = "Confirmez votre email — EduQuébec"
@@ -66,14 +77,14 @@ def register(payload: RegisterIn):
     <p>Si vous n’êtes pas à l’origine de cette demande, ignorez ce message.</p>
     """
     text = f"Activez votre compte EduQuébec: {link} (expire dans {settings.EMAIL_VERIFY_EXPIRES_MIN} minutes)."
-    send_email(email, subject, html, text=text)
+    await aenqueue_email(email, subject, html, text=text)
 
     return {"ok": True, "message": "Email de confirmation envoyé. Veuillez activer votre compte."}
 
 @router.get("/verify")
-def verify(token: str):
+async def verify(token: str):
     token = token.strip()
-    u = fetch_one("SELECT id, verify_token_expires_at FROM users WHERE verify_token=?", (token,))
+    u = await fetch_one("SELECT id, verify_token_expires_at FROM users WHERE verify_token=?", (token,))
     if not u:
         raise HTTPException(status_code=400, detail="Lien invalide ou expiré.")
     exp = u.get("verify_token_expires_at")
@@ -84,14 +95,16 @@ def verify(token: str):
             exp_dt = None
         if exp_dt and exp_dt < datetime.now(timezone.utc):
             raise HTTPException(status_code=400, detail="Lien expiré. Demandez un nouvel email.")
-    execute("UPDATE users SET is_active=1, email_verified=1, verify_token=NULL, verify_token_expires_at=NULL WHERE id=?",
+    await execute("UPDATE users SET is_active=1, email_verified=1, verify_token=NULL, verify_token_expires_at=NULL WHERE id=?",
             (u["id"],))
+    await ainvalidate_user(user_id=u["id"])
     return {"ok": True, "message": "Compte activé. Vous pouvez vous connecter."}
 
-@router.post("/resend-verification")
-def resend(payload: ResendIn):
+@router.post("/resend-verification", dependencies=[Depends(per_ip("resend_ip"))])
+async def resend(payload: ResendIn):
     email = payload.email.lower().strip()
-    u = fetch_one("SELECT id, email_verified FROM users WHERE email=?", (email,))
+    await limiter.ahit("resend_email", email)
+    u = await fetch_one("SELECT id, email_verified FROM users WHERE email=?", (email,))
     if not u:
         # Do not leak account existence
         return {"ok": True, "message": "Si un compte existe, un email a été envoyé."}
@@ -100,22 +113,41 @@ def resend(payload: ResendIn):
 
     token = _make_token()
     expires = (datetime.now(timezone.utc) + timedelta(minutes=settings.EMAIL_VERIFY_EXPIRES_MIN)).isoformat()
-    execute("UPDATE users SET verify_token=?, verify_token_expires_at=? WHERE id=?", (token, expires, u["id"]))
+    await execute("UPDATE users SET verify_token=?, verify_token_expires_at=? WHERE id=?", (token, expires, u["id"]))
 
     link = _verify_link(token)
     subject = "Nouveau lien de confirmation — EduQuébec"
     html = f"""<p>Bonjour,</p><p>Voici votre nouveau lien d’activation :</p><p><a href="{link}">Activer mon compte</a></p>"""
     text = f"Nouveau lien d’activation EduQuébec: {link}"
-    send_email(email, subject, html, text=text)
+    await aenqueue_email(email, subject, html, text=text)
 
     return {"ok": True, "message": "Email envoyé."}
 
-@router.post("/login")
-def login(payload: LoginIn):
+# Token version and subscription status are read in one statement, so a
+# concurrent webhook cannot slip between them.
+def _issue_token(u: dict) -> dict:
+    token = create_access_token(u["email"], u["id"], u["sub_status"] == "active", u["token_version"])
+    return {"access_token": token, "token_type": "bearer"}
+
+@router.post("/login", dependencies=[Depends(per_ip("login_ip"))])
+async def login(payload: LoginIn):
     email = payload.email.lower().strip()
-    u = fetch_one("SELECT id,email,password_hash,is_active,email_verified FROM users WHERE email=?", (email,))
-    if not u or not verify_password(payload.password, u["password_hash"]):
+    await limiter.ahit("login_email", email)
+    u = await fetch_one(
+        "SELECT u.id,u.email,u.password_hash,u.is_active,u.email_verified,u.token_version,s.status AS sub_status "
+        "FROM users u LEFT JOIN subscriptions s ON s.user_id=u.id WHERE u.email=?", (email,))
+    if not u or not await verify_password_async(payload.password, u["password_hash"]):
         raise HTTPException(status_code=401, detail="Identifiants invalides.")
     if int(u.get("email_verified", 0)) != 1 or int(u.get("is_active", 0)) != 1:
         raise HTTPException(status_code=403, detail="Compte non activé. Vérifiez votre email.")
-    return {"access_token": create_access_token(email), "token_type": "bearer"}
+    return _issue_token(u)
+
+@router.post("/refresh")
+async def refresh(user=Depends(get_current_user)):
+    """Reissue the caller's token with current claims, e.g. right after a payment."""
+    u = await fetch_one(
+        "SELECT u.id,u.email,u.is_active,u.token_version,s.status AS sub_status "
+        "FROM users u LEFT JOIN subscriptions s ON s.user_id=u.id WHERE u.id=?", (user["id"],))
+    if not u or int(u.get("is_active", 0)) != 1:
+        raise HTTPException(status_code=401, detail="Utilisateur introuvable.")
+    return _issue_token(u)
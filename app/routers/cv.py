@@ -1,15 +1,125 @@
-from fastapi import APIRouter, Depends
+import re
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from ..deps import get_current_user
+from ..cv_export import MEDIA_TYPES, render_async
+from ..cv_cache import cv_cache, cache_key, etag_for
+from ..asset_server import etag_matches
+from ..cv_jobs import create_job, get_job, stream_job_zip
+from ..settings import settings
 
 router = APIRouter()
 
+class ExperienceIn(BaseModel):
+    role: str = ""
+    company: str = ""
+    period: str = ""
+    details: List[str] = []
+
+class EducationIn(BaseModel):
+    degree: str = ""
+    school: str = ""
+    period: str = ""
+
 class CVIn(BaseModel):
     full_name: str = ""
     title: str = ""
     summary: str = ""
+    email: str = ""
+    phone: str = ""
+    city: str = ""
+    experiences: List[ExperienceIn] = []
+    education: List[EducationIn] = []
+    skills: List[str] = []
+    languages: List[str] = []
+
+class CVJobIn(BaseModel):
+    format: Literal["pdf", "docx"] = "pdf"
+    items: List[CVIn]
+
+STREAM_CHUNK = 64 * 1024
+
+def _filename(payload: CVIn, fmt: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", payload.full_name.lower()).strip("_")
+    return f"cv_{slug or 'eduquebec'}.{fmt}"
+
+def _chunks(data: bytes):
+    for i in range(0, len(data), STREAM_CHUNK):
+        yield data[i:i + STREAM_CHUNK]
+
+async def _export(request: Request, payload: CVIn, fmt: str) -> Response:
+    cv = payload.model_dump()
+    key = cache_key(cv, fmt)
+    headers = {"ETag": etag_for(key), "Cache-Control": "private, no-cache"}
+    # The ETag is the content address, so a re-export of an unchanged CV is
+    # answered without rendering or reading the cache.
+    inm = request.headers.get("if-none-match")
+    if inm and etag_matches(inm, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    background = None
+    data = cv_cache.get_memory(key)
+    if data is None:
+        data = await run_in_threadpool(cv_cache.get_disk, key, fmt)
+    if data is None:
+        data = await render_async(fmt, cv)
+        background = BackgroundTask(cv_cache.put, key, fmt, data)
+    headers["Content-Disposition"] = f'attachment; filename="{_filename(payload, fmt)}"'
+    headers["Content-Length"] = str(len(data))
+    return StreamingResponse(_chunks(data), media_type=MEDIA_TYPES[fmt], headers=headers, background=background)
 
 @router.post("/generate")
 def generate_cv(payload: CVIn, user=Depends(get_current_user)):
     # Placeholder: this endpoint can later generate a DOCX via templates.
     return {"ok": True, "message": "Génération CV (placeholder).", "data": payload.model_dump()}
+
+@router.post("/export/pdf")
+async def export_pdf(payload: CVIn, request: Request, user=Depends(get_current_user)):
+    return await _export(request, payload, "pdf")
+
+@router.post("/export/docx")
+async def export_docx(payload: CVIn, request: Request, user=Depends(get_current_user)):
+    return await _export(request, payload, "docx")
+
+def _job_out(job) -> dict:
+    finished = job["done"] + job["failed"]
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "format": job["fmt"],
+        "total": job["total"],
+        "done": job["done"],
+        "failed": job["failed"],
+        "progress": (finished / job["total"]) if job["total"] else 1.0,
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "download_url": f"/cv/jobs/{job['id']}/download",
+    }
+
+@router.post("/jobs")
+async def create_export_job(payload: CVJobIn, user=Depends(get_current_user)):
+    if not payload.items or len(payload.items) > settings.CV_JOB_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Entre 1 et {settings.CV_JOB_MAX_ITEMS} CV par lot.")
+    job_id = await create_job(user["id"], payload.format, [cv.model_dump() for cv in payload.items])
+    return _job_out(await get_job(job_id, user["id"]))
+
+@router.get("/jobs/{job_id}")
+async def export_job_status(job_id: str, user=Depends(get_current_user)):
+    job = await get_job(job_id, user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Lot introuvable.")
+    return _job_out(job)
+
+@router.get("/jobs/{job_id}/download")
+async def export_job_download(job_id: str, user=Depends(get_current_user)):
+    if not await get_job(job_id, user["id"]):
+        raise HTTPException(status_code=404, detail="Lot introuvable.")
+    # Streams while the job is still running: each CV is added as it finishes.
+    return StreamingResponse(
+        stream_job_zip(job_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="cv_lot_{job_id[:8]}.zip"'},
+    )
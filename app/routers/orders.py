@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+
+from ..deps import get_current_user
+from ..db_async import fetch_all
+from ..pagination import decode_cursor, page
+
+router = APIRouter()
+
+@router.get("/")
+async def list_orders(cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), user=Depends(get_current_user)):
+    rows = await fetch_all(
+        "SELECT id,product,amount_total,currency,status,created_at FROM orders "
+        "WHERE user_id=? AND id<? ORDER BY id DESC LIMIT ?",
+        (user["id"], decode_cursor(cursor), limit + 1),
+    )
+    return page(rows, limit)
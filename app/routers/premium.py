@@ -1,71 +1,148 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import List, Optional
+import time
 
 from ..deps import require_premium, get_current_user
-from ..storage import is_configured, presign_get_url, get_cfg
-from ..db_sqlite import execute, fetch_one
-from datetime import datetime, timezone
+from ..storage import is_configured, cached_url, presign_get_url, presign_get_urls
+from ..db_async import fetch_one, fetch_all
+from ..pagination import decode_cursor, page
+from ..audit import arecord_download, arecord_downloads
+from ..asset_server import AssetResponse, iter_chunks
+from ..zipstream import StoredEntry, StoredZip
+from ..catalog import PREMIUM_FILES, assets, catalog, s3_key
 
 router = APIRouter()
 
-ASSETS_DIR = Path(__file__).resolve().parent.parent / "assets" / "premium"
-
-# Catalog of premium-protected files
-PREMIUM_FILES = {
-    "tmpl-cv-quebec": {"filename": "modele_cv_quebec.docx", "title": "Modèle de CV (Québec)", "type": "docx"},
-    "plan-tecfee-30j": {"filename": "plan_tecfee_30j.pdf", "title": "Plan TECFÉE — 30 jours", "type": "pdf"},
-    "lettre-css": {"filename": "lettre_css.docx", "title": "Lettre — candidature CSS", "type": "docx"},
-    "checklist-dossier": {"filename": "checklist_dossier.pdf", "title": "Checklist dossier", "type": "pdf"},
-    # TECFÉE PDFs (added by you)
-    "tecfee-compo": {"filename": "COMPO.pdf", "title": "COMPO — Grille / feuille de test", "type": "pdf"},
-    "tecfee-doc-1": {"filename": "DOC-1.pdf", "title": "DOC-1 — Exercices préparatoires TECFÉE (Partie 1)", "type": "pdf"},
-    "tecfee-doc-2": {"filename": "DOC-2.pdf", "title": "DOC-2 — Exercices préparatoires TECFÉE (Partie 2)", "type": "pdf"},
-    "tecfee-doc-3": {"filename": "DOC-3 — Exercices préparatoires TECFÉE (Partie 3)".replace("—","-"), "title": "DOC-3 — Exercices préparatoires TECFÉE (Partie 3)", "type": "pdf"},
-    "tecfee-doc-4": {"filename": "DOC-4.pdf", "title": "DOC-4 — Exercices préparatoires TECFÉE (Partie 4)", "type": "pdf"},
-    "tecfee-doc-5": {"filename": "DOC-5.pdf", "title": "DOC-5 — Exercices préparatoires TECFÉE (Partie 5)", "type": "pdf"},
-    "tecfee-doc-6": {"filename": "DOC-6.pdf", "title": "DOC-6 — Exercices préparatoires TECFÉE (Partie 6)", "type": "pdf"},
-    "tecfee-doc-7": {"filename": "DOC-7.pdf", "title": "DOC-7 — Exercices préparatoires TECFÉE (Partie 7)", "type": "pdf"},
-    "tecfee-doc-8": {"filename": "DOC-8.pdf", "title": "DOC-8 — Exercices préparatoires TECFÉE (Partie 8)", "type": "pdf"},
-}
-
-def _now_iso():
-    return datetime.now(timezone.utc).isoformat()
+BUNDLE_FILENAME = "ressources-premium.zip"
 
 @router.get("/status")
-def status(user=Depends(get_current_user)):
-    sub = fetch_one("SELECT status, updated_at FROM subscriptions WHERE user_id=?", (user["id"],))
+async def status(user=Depends(get_current_user)):
+    sub = await fetch_one("SELECT status, updated_at FROM subscriptions WHERE user_id=?", (user["id"],))
     return {"status": (sub["status"] if sub else "inactive"), "updated_at": (sub["updated_at"] if sub else None)}
 
+@router.get("/history")
+async def history(cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), user=Depends(get_current_user)):
+    # Downloads reach the table within AUDIT_FLUSH_MS.
+    rows = await fetch_all(
+        "SELECT id,file_id,created_at FROM premium_downloads WHERE user_id=? AND id<? ORDER BY id DESC LIMIT ?",
+        (user["id"], decode_cursor(cursor), limit + 1),
+    )
+    result = page(rows, limit)
+    for item in result["items"]:
+        item["title"] = PREMIUM_FILES.get(item["file_id"], {}).get("title")
+    totals = await fetch_one("SELECT downloads, last_download_at FROM download_user_totals WHERE user_id=?", (user["id"],))
+    result["total_downloads"] = totals["downloads"] if totals else 0
+    result["last_download_at"] = totals["last_download_at"] if totals else None
+    return result
+
+@router.get("/popular")
+async def popular(limit: int = Query(5, ge=1, le=50), days: Optional[int] = Query(None, ge=1, le=366),
+                  user=Depends(get_current_user)):
+    """Most downloaded resources, all time or over the last `days` days."""
+    if days is None:
+        rows = await fetch_all("SELECT file_id, downloads FROM download_file_totals ORDER BY downloads DESC, file_id LIMIT ?",
+                         (limit,))
+    else:
+        today = datetime.now(timezone.utc).date()
+        rows = await fetch_all(
+            "SELECT file_id, SUM(downloads) AS downloads FROM download_rollups WHERE day>=? AND day<=? "
+            "GROUP BY file_id ORDER BY downloads DESC, file_id LIMIT ?",
+            ((today - timedelta(days=days - 1)).isoformat(), today.isoformat(), limit),
+        )
+    return {"items": [{**row, "title": PREMIUM_FILES.get(row["file_id"], {}).get("title")} for row in rows]}
+
+@router.get("/resources")
+async def resources(request: Request, user=Depends(require_premium)):
+    """The catalog manifest: size, checksum, page count and availability of each resource."""
+    return catalog.response(request)
+
 @router.get("/signed-url/{file_id}")
-def signed_url(file_id: str, user=Depends(require_premium)):
+async def signed_url(file_id: str, user=Depends(require_premium)):
     meta = PREMIUM_FILES.get(file_id)
     if not meta:
         raise HTTPException(status_code=404, detail="Fichier introuvable.")
     filename = meta["filename"]
 
-    execute("INSERT INTO premium_downloads(user_id,file_id,created_at) VALUES (?,?,?)", (user["id"], file_id, _now_iso()))
+    await arecord_download(user["id"], file_id)
 
     # If object storage configured, presign; else serve from local assets
     if is_configured():
-        cfg = get_cfg()
-        key = f"{cfg.prefix}{filename}" if cfg.prefix else filename
-        url = presign_get_url(key, download_name=filename)
+        key = s3_key(filename)
+        # Signing (and, before warm-up, building the S3 client) stays off the event loop.
+        url = cached_url(key, filename) or await run_in_threadpool(presign_get_url, key, filename)
         return {"url": url}
 
-    path = ASSETS_DIR / filename
-    if not path.exists():
+    if not assets.get(file_id):
         raise HTTPException(status_code=500, detail="Fichier non disponible côté serveur.")
     # frontend will call /download if local
     return {"url": f"/premium/download/{file_id}"}
 
+@router.get("/signed-urls")
+async def signed_urls(file_ids: Optional[List[str]] = Query(None, alias="id"), user=Depends(require_premium)):
+    """URLs for several resources (`?id=...&id=...`, every one by default).
+
+    One authorization, one signing pass for the URLs not already cached and
+    one audit write for all of them, instead of one /signed-url call each.
+    """
+    if file_ids:
+        file_ids = list(dict.fromkeys(file_ids))
+        unknown = [file_id for file_id in file_ids if file_id not in PREMIUM_FILES]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Fichier introuvable : {', '.join(unknown)}.")
+    else:
+        file_ids = list(PREMIUM_FILES) if is_configured() else [f for f in PREMIUM_FILES if assets.get(f)]
+
+    if is_configured():
+        pairs = [(s3_key(PREMIUM_FILES[f]["filename"]), PREMIUM_FILES[f]["filename"]) for f in file_ids]
+        urls = [cached_url(key, filename) for key, filename in pairs]
+        missing = [i for i, url in enumerate(urls) if url is None]
+        if missing:
+            signed = await run_in_threadpool(presign_get_urls, [pairs[i] for i in missing])
+            for i, url in zip(missing, signed):
+                urls[i] = url
+    else:
+        if not all(assets.get(f) for f in file_ids):
+            raise HTTPException(status_code=500, detail="Fichier non disponible côté serveur.")
+        urls = [f"/premium/download/{f}" for f in file_ids]
+
+    await arecord_downloads(user["id"], file_ids)
+    return {"items": [{"file_id": f, "title": PREMIUM_FILES[f]["title"], "url": url} for f, url in zip(file_ids, urls)]}
+
+@router.get("/bundle")
+async def bundle(user=Depends(require_premium)):
+    """Every premium file served locally, in one ZIP streamed from the asset index.
+
+    Entries are stored, not deflated (PDF and DOCX are already compressed),
+    and their CRCs and sizes come from the index, so the archive's length
+    is known before the first byte and nothing is buffered.
+    """
+    files = [asset for asset in map(assets.get, PREMIUM_FILES) if asset]
+    if not files:
+        raise HTTPException(status_code=404, detail="Aucun fichier disponible sur le serveur.")
+    archive = StoredZip([
+        StoredEntry(asset.filename, asset.size, asset.crc32, time.localtime(asset.mtime)[:6],
+                    partial(iter_chunks, asset.identity))
+        for asset in files
+    ])
+    await arecord_downloads(user["id"], [asset.file_id for asset in files])
+    return StreamingResponse(iter(archive), media_type="application/zip", headers={
+        "content-length": str(archive.size),
+        "content-disposition": f'attachment; filename="{BUNDLE_FILENAME}"',
+    })
+
 @router.get("/download/{file_id}")
-def download(file_id: str, user=Depends(require_premium)):
-    meta = PREMIUM_FILES.get(file_id)
-    if not meta:
+async def download(file_id: str, request: Request, user=Depends(require_premium)):
+    if file_id not in PREMIUM_FILES:
         raise HTTPException(status_code=404, detail="Fichier introuvable.")
-    path = ASSETS_DIR / meta["filename"]
-    if not path.exists():
+    asset = assets.get(file_id)
+    if not asset:
         raise HTTPException(status_code=404, detail="Fichier manquant sur le serveur.")
-    execute("INSERT INTO premium_downloads(user_id,file_id,created_at) VALUES (?,?,?)", (user["id"], file_id, _now_iso()))
-    return FileResponse(path, filename=meta["filename"])
+    response = AssetResponse(request, asset)
+    # 304s and resumed ranges are not new downloads.
+    if response.status_code == 200 or (response.range and response.range[0] == 0):
+        await arecord_download(user["id"], file_id)
+    return response
@@ -1,30 +1,28 @@
 from fastapi import APIRouter, Request, HTTPException
-from datetime import datetime, timezone
-import stripe
 
 from ..settings import settings
-from ..db_sqlite import fetch_one, execute
+from ..stripe_events import arecord_event
+from ..metrics import spans
 
 router = APIRouter()
 
+_verify_span = spans.labels("stripe.construct_event")
+
 @router.post("/stripe")
 async def stripe_webhook(request: Request):
     if not settings.STRIPE_WEBHOOK_SECRET:
         raise HTTPException(status_code=500, detail="Stripe webhook non configuré.")
+    import stripe  # ~1 s to import: loaded on first use or by the startup warm-up
+
     payload = await request.body()
     sig = request.headers.get("stripe-signature")
     try:
-        event = stripe.Webhook.construct_event(payload, sig, settings.STRIPE_WEBHOOK_SECRET)
+        with _verify_span.time():
+            event = stripe.Webhook.construct_event(payload, sig, settings.STRIPE_WEBHOOK_SECRET)
     except Exception:
         raise HTTPException(status_code=400, detail="Signature invalide.")
 
-    if event["type"] == "checkout.session.completed":
-        sess = event["data"]["object"]
-        email = (sess.get("metadata") or {}).get("email")
-        if email:
-            user = fetch_one("SELECT id FROM users WHERE email=?", (email.lower().strip(),))
-            if user:
-                now = datetime.now(timezone.utc).isoformat()
-                execute("INSERT INTO subscriptions(user_id,status,provider,provider_ref,updated_at) VALUES (?,?,?,?,?)",
-                        (user["id"], "active", "stripe", sess.get("id"), now))
-    return {"ok": True}
+    # Acknowledge right away; stripe_events applies the event in the background.
+    # Retries and replays of an event id already received are no-ops.
+    duplicate = not await arecord_event(event, payload)
+    return {"ok": True, "duplicate": duplicate}
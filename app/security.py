@@ -1,16 +1,56 @@
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict
+
 import jwt
-from passlib.context import CryptContext
 from .settings import settings
+from .procpool import BoundedProcessPool
+from .metrics import spans
 
-pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=1)
+def _pwd():
+    # Only the hashing workers need passlib; the API process never loads it.
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_password(p: str) -> str:
-    return pwd.hash(p)
+    return _pwd().hash(p)
 
 def verify_password(p: str, hashed: str) -> bool:
-    return pwd.verify(p, hashed)
+    return _pwd().verify(p, hashed)
+
+def create_access_token(email: str, user_id: int, premium: bool, token_version: int) -> str:
+    # uid/prem/tv let deps authorize requests without a database lookup;
+    # see token_versions for how stale claims are detected.
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": email,
+        "uid": user_id,
+        "prem": premium,
+        "tv": token_version,
+        "iat": now,
+        "exp": now + timedelta(minutes=settings.JWT_EXPIRES_MIN),
+    }
+    return jwt.encode(claims, settings.JWT_SECRET, algorithm="HS256")
+
+# --- Async bcrypt service -------------------------------------------------
+# bcrypt holds the GIL for ~200 ms per call, so it runs in a process pool.
+
+_pool = BoundedProcessPool("hashing", settings.HASH_WORKERS, settings.HASH_QUEUE_MAX)
+# Timed here, not in the workers: the span includes queueing for a free one.
+_hash_span = spans.labels("security.hash_password")
+_verify_span = spans.labels("security.verify_password")
+
+async def hash_password_async(p: str) -> str:
+    with _hash_span.time():
+        return await _pool.run(hash_password, p)
+
+async def verify_password_async(p: str, hashed: str) -> bool:
+    with _verify_span.time():
+        return await _pool.run(verify_password, p, hashed)
+
+def hashing_stats() -> Dict[str, Any]:
+    return _pool.stats()
 
-def create_access_token(sub: str) -> str:
-    exp = datetime.now(timezone.utc) + timedelta(minutes=settings.JWT_EXPIRES_MIN)
-    return jwt.encode({"sub": sub, "exp": exp}, settings.JWT_SECRET, algorithm="HS256")
+def shutdown_hashing() -> None:
+    _pool.shutdown()
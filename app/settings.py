@@ -9,12 +9,20 @@ class Settings(BaseSettings):
     S3_BUCKET: str = ""
     S3_PREFIX: str = "premium/"  # folder prefix in bucket
     S3_SIGNED_URL_EXPIRES_SEC: int = 300
+    S3_SIGNED_URL_MIN_REMAINING: float = 0.5  # reuse a cached URL while this share of its lifetime is left
+    S3_SIGNED_URL_CACHE_MAX_ENTRIES: int = 1024
 
     APP_ENV: str = "dev"
     JWT_SECRET: str = "change-me"
     JWT_EXPIRES_MIN: int = 120
+    TOKEN_VERSION_REFRESH_SEC: float = 1.0  # how stale another worker's view of revocations may be
     STRIPE_SECRET_KEY: str = ""
     STRIPE_WEBHOOK_SECRET: str = ""
+    STRIPE_EVENT_BATCH: int = 100  # stripe_events processor
+    STRIPE_EVENT_POLL_SEC: float = 1.0
+    STRIPE_EVENT_MAX_ATTEMPTS: int = 8
+    STRIPE_EVENT_RETRY_BASE_SEC: int = 5
+    STRIPE_EVENT_RETRY_MAX_SEC: int = 1800
     FRONTEND_BASE_URL: str = "http://127.0.0.1:5500"
 
     # Email (SMTP)
@@ -24,9 +32,123 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str = ""
     SMTP_FROM: str = "EduQuébec <no-reply@eduquebec.ca>"
     SMTP_USE_TLS: bool = True
+    SMTP_TIMEOUT_SEC: int = 30
+    SMTP_IDLE_SEC: int = 60  # close the outbox SMTP session after this much idle time
+
+    # Email outbox worker
+    EMAIL_OUTBOX_BATCH: int = 20
+    EMAIL_OUTBOX_POLL_SEC: float = 2.0
+    EMAIL_OUTBOX_LEASE_SEC: int = 300
+    EMAIL_MAX_ATTEMPTS: int = 6
+    EMAIL_RETRY_BASE_SEC: int = 30
+    EMAIL_RETRY_MAX_SEC: int = 3600
 
     EMAIL_VERIFY_EXPIRES_MIN: int = 60
 
+    # SQLite connection pool
+    SQLITE_PATH: str = ""  # default: data.sqlite3 at the project root
+    SQLITE_POOL_SIZE: int = 8  # sync routes run on 40 threads; past this many on the database, they wait, then 503
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # safe with WAL; FULL for extra durability
+    SQLITE_CACHE_SIZE_KB: int = 16384
+    SQLITE_MMAP_SIZE: int = 134217728  # 128 MiB
+    SQLITE_STATEMENT_CACHE: int = 256
+    SQLITE_SLOW_QUERY_MS: int = 100  # log fetch_one/fetch_all/execute calls slower than this
+    SQLITE_FETCH_CHUNK_ROWS: int = 1000  # iter_rows fetchmany size
+
+    # Async database access (db_async): reader threads and a single writer
+    SQLITE_READERS: int = 4  # threads, each with its own read-only connection
+    SQLITE_WRITE_BATCH_MAX: int = 256  # queued writes committed in one transaction
+    SQLITE_WRITE_QUEUE_MAX: int = 10000  # pending writes beyond this are rejected with 503
+
+    # User / entitlement cache
+    USER_CACHE_TTL_SEC: int = 60
+    USER_CACHE_MAX_ENTRIES: int = 10000
+
+    # Cache backend for the user, entitlement and signed-URL caches: "memory"
+    # (per process) or "sqlite" (shared by the uvicorn workers of one host)
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = ""  # default: <database>-cache.sqlite3 next to the database
+    CACHE_POLL_MS: int = 5  # other workers' invalidations reach this worker within about this
+    CACHE_SWEEP_SEC: int = 60  # expired entries and old invalidation events are deleted this often
+
+    # Password hashing process pool
+    HASH_WORKERS: int = 0  # 0 = one per CPU core
+    HASH_QUEUE_MAX: int = 64
+
+    # CV export process pool
+    CV_EXPORT_WORKERS: int = 0  # 0 = one per CPU core
+    CV_EXPORT_QUEUE_MAX: int = 32
+
+    # Rendered CV cache
+    CV_CACHE_DIR: str = ""  # default: cv_cache/ next to the database
+    CV_CACHE_MEMORY_MAX_BYTES: int = 67108864  # 64 MiB
+    CV_CACHE_DISK_MAX_BYTES: int = 536870912  # 512 MiB
+
+    # Bulk CV export jobs
+    CV_JOBS_DIR: str = ""  # default: cv_jobs/ next to the database
+    CV_JOB_MAX_ITEMS: int = 500
+    CV_JOB_MAX_RUNNING: int = 4  # jobs running at once in this process
+    CV_JOB_PER_USER: int = 1  # jobs running at once per user, across workers
+    CV_JOB_RENDER_CONCURRENCY: int = 4  # documents rendering at once in this process
+    CV_JOB_LEASE_SEC: int = 60
+    CV_JOB_POLL_SEC: float = 2.0
+    CV_JOB_STREAM_POLL_SEC: float = 0.5
+    CV_JOB_RETENTION_HOURS: int = 24  # finished jobs and their files are then deleted by maintenance
+
+    # premium_downloads group-commit writer
+    AUDIT_FLUSH_MS: int = 200
+    AUDIT_BATCH_ROWS: int = 500
+    AUDIT_BUFFER_ROWS: int = 10000
+    AUDIT_BLOCK_MS: int = 50  # backpressure wait before a row is dropped
+
+    # Local premium asset serving
+    ASSET_MMAP_MAX_BYTES: int = 1048576  # files up to this size are served from a memory map
+
+    # Premium catalog manifest (/premium/resources), rebuilt in the background
+    CATALOG_POLL_SEC: float = 5.0  # asset files are stat'ed this often; a change rebuilds the manifest
+    CATALOG_S3_CHECK_SEC: int = 600  # every catalog object is HEADed in S3 this often
+
+    # Maintenance scheduler: one worker at a time holds the lease and runs due jobs
+    MAINTENANCE_ENABLED: bool = True
+    MAINTENANCE_TICK_SEC: float = 60.0
+    MAINTENANCE_LEASE_SEC: int = 180  # another worker takes over this long after the leader dies
+    MAINTENANCE_BATCH_ROWS: int = 500  # rows per short write transaction
+    MAINTENANCE_BATCH_PAUSE_MS: int = 20  # between batches, so request writes get the lock
+    MAINTENANCE_MAX_BATCHES: int = 100  # per job run; the rest waits for the next run
+    MAINTENANCE_UNVERIFIED_DAYS: int = 7  # unverified accounts older than this are deleted
+    MAINTENANCE_DOWNLOAD_RETENTION_DAYS: int = 365  # older premium_downloads rows are archived; 0 = never
+    MAINTENANCE_ARCHIVE_PATH: str = ""  # default: <database>-archive.sqlite3 next to the database
+    MAINTENANCE_VACUUM_PAGES: int = 2000  # free pages returned to the OS per incremental vacuum
+    MAINTENANCE_PURGE_SEC: int = 3600  # job intervals
+    MAINTENANCE_ARCHIVE_SEC: int = 86400
+    MAINTENANCE_OPTIMIZE_SEC: int = 21600
+    MAINTENANCE_CHECKPOINT_SEC: int = 300
+    MAINTENANCE_VACUUM_SEC: int = 3600
+
+    # Startup: stripe and boto3 are imported on first use, or by a background
+    # warm-up thread once the worker is serving
+    STARTUP_WARMUP: bool = True
+
+    # Admin
+    ADMIN_EMAILS: str = ""  # comma-separated; these accounts can use /admin
+    EXPORT_MAX_CONCURRENT: int = 2  # streamed exports at once in this process (each holds a DB connection)
+
+    # Rate limits: "<requests>/<seconds>" token buckets
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "sqlite" shares buckets across uvicorn workers
+    RATE_LIMIT_SQLITE_PATH: str = ""  # default: <database>-ratelimit.sqlite3 next to the database
+    RATE_LIMIT_SHARDS: int = 64
+    RATE_LIMIT_SWEEP_SEC: int = 60
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # key on X-Forwarded-For; only behind a trusted proxy
+    RATE_LIMIT_LOGIN_IP: str = "20/60"
+    RATE_LIMIT_LOGIN_EMAIL: str = "5/60"
+    RATE_LIMIT_REGISTER_IP: str = "10/3600"
+    RATE_LIMIT_REGISTER_EMAIL: str = "3/3600"
+    RATE_LIMIT_RESEND_IP: str = "10/3600"
+    RATE_LIMIT_RESEND_EMAIL: str = "3/3600"
+    RATE_LIMIT_CONTACT_IP: str = "5/600"
+
     class Config:
         env_file = ".env"
         extra = "ignore"
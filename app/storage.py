@@ -1,11 +1,14 @@
 from __future__ import annotations
+import threading
+import time
 from dataclasses import dataclass
-from typing import Optional
-import boto3
-from botocore.config import Config
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 from .settings import settings
+from .cache import make_cache
+from .metrics import spans
 
-@dataclass
+@dataclass(frozen=True)
 class StorageCfg:
     endpoint_url: str
     access_key: str
@@ -15,6 +18,7 @@ class StorageCfg:
     prefix: str
     expires_sec: int
 
+@lru_cache(maxsize=1)
 def get_cfg() -> StorageCfg:
     return StorageCfg(
         endpoint_url=settings.S3_ENDPOINT_URL,
@@ -30,21 +34,90 @@ def is_configured() -> bool:
     cfg = get_cfg()
     return bool(cfg.endpoint_url and cfg.access_key and cfg.secret_key and cfg.bucket)
 
+_s3 = None
+_s3_lock = threading.Lock()
+
 def _client():
-    cfg = get_cfg()
-    return boto3.client(
-        "s3",
-        endpoint_url=cfg.endpoint_url,
-        aws_access_key_id=cfg.access_key,
-        aws_secret_access_key=cfg.secret_key,
-        region_name=cfg.region,
-        config=Config(signature_version="s3v4"),
-    )
+    # boto3 clients are thread-safe once built, but building one (which loads
+    # the botocore service model) is slow and not thread-safe: do it once.
+    # boto3 itself is imported here, not at startup: it costs ~200 ms.
+    global _s3
+    if _s3 is None:
+        with _s3_lock:
+            if _s3 is None:
+                import boto3
+                from botocore.config import Config
+
+                cfg = get_cfg()
+                _s3 = boto3.client(
+                    "s3",
+                    endpoint_url=cfg.endpoint_url,
+                    aws_access_key_id=cfg.access_key,
+                    aws_secret_access_key=cfg.secret_key,
+                    region_name=cfg.region,
+                    config=Config(signature_version="s3v4"),
+                )
+    return _s3
+
+def warm_up() -> None:
+    """Build the S3 client ahead of the first signed URL, if S3 is configured."""
+    if is_configured():
+        _client()
+
+# A signed URL is reused while at least S3_SIGNED_URL_MIN_REMAINING of its
+# lifetime is left, so clients always get a comfortable validity window.
+_urls = make_cache(
+    "signed_urls",
+    settings.S3_SIGNED_URL_CACHE_MAX_ENTRIES,
+    settings.S3_SIGNED_URL_EXPIRES_SEC * (1 - settings.S3_SIGNED_URL_MIN_REMAINING),
+)
+_sign_lock = threading.Lock()
+_sign_span = spans.labels("storage.presign_get_url")
+_signed = 0
+_sign_sec = 0.0
+
+def cached_url(key: str, download_name: Optional[str] = None) -> Optional[str]:
+    """A still-fresh signed URL for `key`, if one was issued; never signs."""
+    return _urls.get((key, download_name))
 
 def presign_get_url(key: str, download_name: Optional[str] = None) -> str:
+    global _signed, _sign_sec
+    cache_key = (key, download_name)
+    url = _urls.get(cache_key)
+    if url is not None:
+        return url
     cfg = get_cfg()
-    s3 = _client()
     params = {"Bucket": cfg.bucket, "Key": key}
     if download_name:
         params["ResponseContentDisposition"] = f'attachment; filename="{download_name}"'
-    return s3.generate_presigned_url("get_object", Params=params, ExpiresIn=cfg.expires_sec)
+    start = time.perf_counter()
+    url = _client().generate_presigned_url("get_object", Params=params, ExpiresIn=cfg.expires_sec)
+    elapsed = time.perf_counter() - start
+    _sign_span.observe(elapsed)
+    with _sign_lock:
+        _signed += 1
+        _sign_sec += elapsed
+    _urls.set(cache_key, url)
+    return url
+
+def presign_get_urls(items: List[Tuple[str, Optional[str]]]) -> List[str]:
+    """presign_get_url() for many (key, download_name) pairs, in one call off the event loop."""
+    return [presign_get_url(key, download_name) for key, download_name in items]
+
+def head_object(key: str) -> Optional[int]:
+    """Size of `key` in the bucket, or None if it does not exist."""
+    from botocore.exceptions import ClientError
+
+    try:
+        return _client().head_object(Bucket=get_cfg().bucket, Key=key)["ContentLength"]
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+def storage_stats() -> Dict[str, Any]:
+    return {
+        "url_cache": _urls.stats(),
+        "signed": _signed,
+        "avg_sign_ms": (_sign_sec / _signed * 1000) if _signed else 0.0,
+    }
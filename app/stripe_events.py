@@ -0,0 +1,167 @@
+import json
+import logging
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Set
+
+from .settings import settings
+from .db_sqlite import fetch_one, transaction
+from . import db_async
+from .deps import invalidate_premium
+from .workers import BackgroundWorker
+from .token_versions import bump, token_versions
+
+log = logging.getLogger(__name__)
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def arecord_event(event: Dict[str, Any], payload: bytes) -> bool:
+    """Store a verified event through the db_async writer; False if this event id was already received."""
+    now = _now().isoformat()
+    inserted = await db_async.write(lambda conn: conn.execute(
+        "INSERT OR IGNORE INTO stripe_events(id,type,created,payload,status,attempts,next_attempt_at,received_at) "
+        "VALUES (?,?,?,?,?,?,?,?)",
+        (event["id"], event["type"], int(event.get("created") or 0), payload.decode("utf-8"),
+         "pending", 0, now, now),
+    ).rowcount == 1)
+    if inserted:
+        _processor.wake()
+    return inserted
+
+# --- Event handlers ---------------------------------------------------------
+# Each handler runs inside the batch transaction, on the same connection
+# that marks the event processed, so an event takes effect exactly once.
+# Handlers return the ids of users whose entitlements changed.
+
+def _checkout_completed(conn: sqlite3.Connection, event: Dict[str, Any]) -> Set[int]:
+    sess = event["data"]["object"]
+    email = (sess.get("metadata") or {}).get("email")
+    if not email:
+        return set()
+    user = conn.execute("SELECT id FROM users WHERE email=?", (email.lower().strip(),)).fetchone()
+    if not user:
+        return set()
+    now = _now().isoformat()
+    conn.execute(
+        "INSERT INTO subscriptions(user_id,status,provider,provider_ref,updated_at) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET status=excluded.status, provider=excluded.provider, "
+        "provider_ref=excluded.provider_ref, updated_at=excluded.updated_at",
+        (user["id"], "active", "stripe", sess.get("id"), now),
+    )
+    if sess.get("id"):
+        conn.execute(
+            "INSERT OR IGNORE INTO orders(user_id,provider,provider_ref,product,amount_total,currency,status,created_at) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (user["id"], "stripe", sess["id"], "premium", sess.get("amount_total"), sess.get("currency"), "paid", now),
+        )
+    return {user["id"]}
+
+HANDLERS: Dict[str, Callable[[sqlite3.Connection, Dict[str, Any]], Set[int]]] = {
+    "checkout.session.completed": _checkout_completed,
+}
+
+def _backoff_sec(attempts: int) -> float:
+    delay = min(settings.STRIPE_EVENT_RETRY_BASE_SEC * (2 ** (attempts - 1)), settings.STRIPE_EVENT_RETRY_MAX_SEC)
+    return delay * random.uniform(0.8, 1.2)
+
+class StripeEventProcessor(BackgroundWorker):
+    """Applies stored events in (created, arrival) order, one batch per transaction.
+
+    The batch runs under BEGIN IMMEDIATE, so concurrent uvicorn workers
+    never apply the same event twice. A failing event is rolled back to its
+    savepoint and retried with backoff; after STRIPE_EVENT_MAX_ATTEMPTS it
+    is marked 'dead' for manual replay.
+    """
+
+    name = "stripe-events"
+
+    def __init__(self):
+        super().__init__(settings.STRIPE_EVENT_POLL_SEC)
+        self.processed = 0
+        self.retried = 0
+        self.dead = 0
+
+    def run_once(self) -> bool:
+        now = _now()
+        changed: Set[int] = set()
+        with transaction() as conn:
+            rows = conn.execute(
+                "SELECT id,type,payload,attempts FROM stripe_events "
+                "WHERE status='pending' AND next_attempt_at<=? ORDER BY created, rowid LIMIT ?",
+                (now.isoformat(), settings.STRIPE_EVENT_BATCH),
+            ).fetchall()
+            for row in rows:
+                conn.execute("SAVEPOINT event")
+                try:
+                    handler = HANDLERS.get(row["type"])
+                    users = handler(conn, json.loads(row["payload"])) if handler else set()
+                    conn.execute("UPDATE stripe_events SET status='processed', attempts=attempts+1, "
+                                 "processed_at=?, last_error=NULL WHERE id=?", (now.isoformat(), row["id"]))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO event")
+                    self._fail(conn, row, e)
+                else:
+                    changed |= users
+                    self.processed += 1
+                conn.execute("RELEASE event")
+            # Tokens issued before this batch carry a stale premium claim.
+            for user_id in changed:
+                bump(conn, user_id)
+        # Only after commit, so a concurrent request cannot re-cache the old status.
+        for user_id in changed:
+            invalidate_premium(user_id)
+        if changed:
+            token_versions.refresh()
+        return len(rows) == settings.STRIPE_EVENT_BATCH
+
+    def _fail(self, conn: sqlite3.Connection, row: sqlite3.Row, err: Exception) -> None:
+        attempts = row["attempts"] + 1
+        if attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+            self.dead += 1
+            log.error("stripe event %s dead after %s attempts: %r", row["id"], attempts, err)
+            conn.execute("UPDATE stripe_events SET status='dead', attempts=?, last_error=? WHERE id=?",
+                         (attempts, repr(err)[:500], row["id"]))
+            return
+        self.retried += 1
+        log.warning("stripe event %s failed (attempt %s): %r", row["id"], attempts, err)
+        retry_at = (_now() + timedelta(seconds=_backoff_sec(attempts))).isoformat()
+        conn.execute("UPDATE stripe_events SET attempts=?, next_attempt_at=?, last_error=? WHERE id=?",
+                     (attempts, retry_at, repr(err)[:500], row["id"]))
+
+_processor = StripeEventProcessor()
+
+def start_processor() -> None:
+    _processor.start()
+
+def stop_processor() -> None:
+    _processor.stop()
+
+def drain() -> None:
+    """Apply every due event now, in the calling thread (tests, replay tool)."""
+    while _processor.run_once():
+        pass
+
+def replay(event_ids: List[str]) -> int:
+    """Queue events again, whatever their status; handlers are idempotent."""
+    now = _now().isoformat()
+    with transaction() as conn:
+        cur = conn.executemany(
+            "UPDATE stripe_events SET status='pending', attempts=0, next_attempt_at=?, last_error=NULL WHERE id=?",
+            [(now, event_id) for event_id in event_ids],
+        )
+        count = cur.rowcount
+    _processor.wake()
+    return count
+
+def event_stats() -> Dict[str, Any]:
+    pending = fetch_one("SELECT COUNT(*) AS n FROM stripe_events WHERE status='pending'")
+    dead = fetch_one("SELECT COUNT(*) AS n FROM stripe_events WHERE status='dead'")
+    return {
+        "pending": pending["n"],
+        "dead_total": dead["n"],
+        "processed": _processor.processed,
+        "retried": _processor.retried,
+        "dead_lettered": _processor.dead,
+    }
@@ -0,0 +1,118 @@
+"""Per-user token versions, so self-contained JWTs can still be revoked.
+
+Tokens carry the user's `token_version` at issue time. Every change that
+makes a token's claims stale bumps it, and appends to `token_events`:
+
+- an entitlement change (subscription activated, cancelled...) raises
+  `token_version` only: older tokens stay valid, but their premium claim
+  is no longer trusted and is checked against the database instead;
+- a credential change also raises `token_min_version`: older tokens are
+  rejected.
+
+Each process keeps the versions of recently bumped users in memory and
+reads new `token_events` rows at most every TOKEN_VERSION_REFRESH_SEC.
+Rows older than the token lifetime are pruned, and so are the in-memory
+versions they set: any token issued before them has expired, and a
+forgotten user reads as version 0, which every newer token satisfies.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from .settings import settings
+from .db_sqlite import fetch_all
+from . import db_async
+
+def _lifetime_sec() -> float:
+    return (settings.JWT_EXPIRES_MIN + 5) * 60
+
+def bump(conn: sqlite3.Connection, user_id: int, revoke: bool = False) -> None:
+    """Invalidate the claims of `user_id`'s current tokens; `revoke` rejects them outright.
+
+    Runs in the caller's transaction; call `token_versions.refresh()` after commit.
+    """
+    row = conn.execute(
+        "UPDATE users SET token_version=token_version+1, "
+        "token_min_version=CASE WHEN ? THEN token_version+1 ELSE token_min_version END "
+        "WHERE id=? RETURNING token_version, token_min_version",
+        (int(revoke), user_id),
+    ).fetchone()
+    if row is None:
+        return
+    now = datetime.now(timezone.utc)
+    conn.execute("INSERT INTO token_events(user_id,token_version,min_version,created_at) VALUES (?,?,?,?)",
+                 (user_id, row["token_version"], row["token_min_version"], now.isoformat()))
+    cutoff = now - timedelta(seconds=_lifetime_sec())
+    conn.execute("DELETE FROM token_events WHERE created_at<?", (cutoff.isoformat(),))
+
+_EVENTS_SINCE = "SELECT seq,user_id,token_version,min_version,created_at FROM token_events WHERE seq>? ORDER BY seq"
+
+class TokenVersions:
+    def __init__(self):
+        # user_id -> (token_version, min_version, event time), oldest event first
+        self._versions: "OrderedDict[int, Tuple[int, int, float]]" = OrderedDict()
+        self._seq = 0
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _due(self) -> bool:
+        return time.monotonic() - self._checked >= settings.TOKEN_VERSION_REFRESH_SEC
+
+    def _apply(self, rows: List[Dict[str, Any]]) -> None:
+        # Called with the lock held. Rows may overlap a concurrent refresh's.
+        for row in rows:
+            if row["seq"] > self._seq:
+                at = datetime.fromisoformat(row["created_at"]).timestamp()
+                self._versions[row["user_id"]] = (row["token_version"], row["min_version"], at)
+                self._versions.move_to_end(row["user_id"])
+                self._seq = row["seq"]
+        cutoff = time.time() - _lifetime_sec()
+        while self._versions and next(iter(self._versions.values()))[2] < cutoff:
+            self._versions.popitem(last=False)
+        self._checked = time.monotonic()
+
+    def _lookup(self, user_id: int) -> Tuple[int, int]:
+        version, min_version, _ = self._versions.get(user_id, (0, 0, 0.0))
+        return version, min_version
+
+    def get(self, user_id: int) -> Tuple[int, int]:
+        if self._due():
+            self.refresh(wait=False)
+        return self._lookup(user_id)
+
+    async def aget(self, user_id: int) -> Tuple[int, int]:
+        """get() for async callers: the refresh query runs on a db_async reader."""
+        if self._due() and not self._refreshing:
+            self._refreshing = True
+            try:
+                await self.arefresh()
+            finally:
+                self._refreshing = False
+        return self._lookup(user_id)
+
+    def refresh(self, wait: bool = True) -> None:
+        """Apply token_events rows added since the last refresh.
+
+        With wait=False, a refresh already running in another thread is
+        enough: requests do not queue behind it.
+        """
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            self._apply(fetch_all(_EVENTS_SINCE, (self._seq,)))
+        finally:
+            self._lock.release()
+
+    async def arefresh(self) -> None:
+        rows = await db_async.fetch_all(_EVENTS_SINCE, (self._seq,))
+        with self._lock:
+            self._apply(rows)
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+token_versions = TokenVersions()
@@ -0,0 +1,36 @@
+"""Background warm-up of the SDKs that are kept out of startup.
+
+stripe and boto3 take over a second to import, most of a worker's cold
+start. Routes import them on first use; this thread imports them as soon
+as the worker is up, so the first checkout, webhook or signed URL rarely
+pays for it. reportlab and python-docx are only ever loaded in the CV
+export workers.
+"""
+import importlib
+import logging
+import threading
+import time
+
+from .settings import settings
+from . import storage
+
+log = logging.getLogger(__name__)
+
+# Must not be imported by `import app.main` or the startup hooks
+# (scripts/check_startup_imports.py).
+HEAVY_MODULES = ("stripe", "boto3", "botocore", "passlib", "reportlab", "docx")
+
+def _warm_up() -> None:
+    start = time.perf_counter()
+    try:
+        if settings.STRIPE_SECRET_KEY or settings.STRIPE_WEBHOOK_SECRET:
+            importlib.import_module("stripe")
+        storage.warm_up()
+    except Exception:
+        log.exception("warm-up failed; modules will be loaded on first use")
+        return
+    log.info("warm-up done in %.0f ms", (time.perf_counter() - start) * 1000)
+
+def start_warmup() -> None:
+    if settings.STARTUP_WARMUP:
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
@@ -0,0 +1,60 @@
+import logging
+import threading
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+class BackgroundWorker:
+    """Daemon thread that calls `run_once()` until stopped.
+
+    `run_once()` returns True when it did work (the loop runs again right
+    away) and False when idle (the loop sleeps `interval` seconds or until
+    `wake()` is called).
+    """
+
+    name = "worker"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.on_stop()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                busy = self.run_once()
+            except Exception:
+                log.exception("%s: iteration failed", self.name)
+                busy = False
+            if not busy:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def run_once(self) -> bool:
+        raise NotImplementedError
+
+    def on_stop(self) -> None:
+        pass
@@ -0,0 +1,123 @@
+import io
+import struct
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable buffer: zipfile falls back to data descriptors."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class ZipStream:
+    """Build a ZIP incrementally and hand out its bytes as they are produced.
+
+    Entries are stored uncompressed by default: PDF and DOCX are already
+    compressed, so deflating them again only burns CPU.
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_STORED):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression)
+        self.compression = compression
+
+    def add(self, name: str, data: bytes) -> bytes:
+        self._zip.writestr(self._info(name), data)
+        return self._sink.drain()
+
+    def add_chunks(self, name: str, size: int, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        info = self._info(name)
+        info.file_size = size
+        with self._zip.open(info, "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        tail = self._sink.drain()
+        if tail:
+            yield tail
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+    def _info(self, name: str) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self.compression
+        return info
+
+@dataclass
+class StoredEntry:
+    name: str
+    size: int
+    crc32: int
+    date_time: Tuple[int, int, int, int, int, int]
+    chunks: Callable[[], Iterable[bytes]]
+
+def _dos_time(date_time: Tuple[int, int, int, int, int, int]) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return hour << 11 | minute << 5 | second // 2, max(0, year - 1980) << 9 | month << 5 | day
+
+class StoredZip:
+    """A ZIP of stored entries whose size and CRC are known before streaming.
+
+    Unlike ZipStream, each local header carries the real CRC and sizes, so
+    there are no data descriptors and the archive's exact length is known up
+    front (a Content-Length, a progress bar). Without ZIP64 an entry, and
+    the whole archive, must stay under 4 GiB.
+    """
+
+    def __init__(self, entries: Sequence[StoredEntry]):
+        self.entries = list(entries)
+        self._names = [self._encode(e.name) for e in self.entries]
+        self.size = sum(30 + len(name) + e.size + 46 + len(name) for e, (name, _) in zip(self.entries, self._names)) + 22
+        if self.size > 0xFFFFFFFF or len(self.entries) > zipfile.ZIP_FILECOUNT_LIMIT:
+            raise ValueError("archive too large without ZIP64")
+
+    @staticmethod
+    def _encode(name: str) -> Tuple[bytes, int]:
+        try:
+            return name.encode("ascii"), 0
+        except UnicodeEncodeError:
+            return name.encode("utf-8"), 0x800
+
+    def __iter__(self) -> Iterator[bytes]:
+        offset = 0
+        central: List[bytes] = []
+        for entry, (name, flags) in zip(self.entries, self._names):
+            dostime, dosdate = _dos_time(entry.date_time)
+            yield struct.pack(zipfile.structFileHeader, zipfile.stringFileHeader, 20, 0, flags, zipfile.ZIP_STORED,
+                              dostime, dosdate, entry.crc32, entry.size, entry.size, len(name), 0) + name
+            written = 0
+            for chunk in entry.chunks():
+                written += len(chunk)
+                yield chunk
+            if written != entry.size:
+                raise RuntimeError(f"{entry.name}: {written} bytes, expected {entry.size}")
+            central.append(struct.pack(zipfile.structCentralDir, zipfile.stringCentralDir, 20, 3, 20, 0, flags,
+                                       zipfile.ZIP_STORED, dostime, dosdate, entry.crc32, entry.size, entry.size,
+                                       len(name), 0, 0, 0, 0, 0o644 << 16, offset) + name)
+            offset += 30 + len(name) + entry.size
+        directory = b"".join(central)
+        yield directory + struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0, len(central),
+                                      len(central), len(directory), offset, 0)
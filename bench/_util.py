@@ -0,0 +1,38 @@
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict, List, Sequence
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Throughput and latency percentiles (ms) for one scenario."""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+    }
+
+def checkout_event(n: int, email: str) -> bytes:
+    event: Dict[str, Any] = {
+        "id": f"evt_bench_{n}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {"object": {"id": f"cs_bench_{n}", "object": "checkout.session", "metadata": {"email": email}}},
+    }
+    return json.dumps(event).encode("utf-8")
+
+def stripe_signature(payload: bytes, secret: str) -> str:
+    """Stripe-Signature header value, as Stripe computes it."""
+    t = int(time.time())
+    sig = hmac.new(secret.encode("utf-8"), f"{t}.".encode("utf-8") + payload, hashlib.sha256).hexdigest()
+    return f"t={t},v1={sig}"
@@ -0,0 +1,443 @@
+"""API throughput and latency, compared against a committed baseline.
+
+    python -m bench.api [--scenario NAME ...] [--scale 1.0] [--concurrency N]
+                        [--uvicorn [--workers 4]] [--out FILE]
+                        [--baseline FILE] [--threshold 0.3] [--update-baseline]
+
+By default the app runs in-process behind an ASGI transport; --uvicorn
+starts `uvicorn app.main:app --workers N` on a free local port instead.
+Both modes use a scratch database, a stubbed SMTP server and a local
+Stripe webhook secret: nothing leaves the machine.
+
+Rate limiting is off except in login_rejected, which measures the cost
+of a throttled request.
+
+Each scenario reports requests/s and p50/p95/p99 latency. Results are
+written as JSON and compared with the baseline for the same mode: a
+scenario regresses when its throughput drops, or its p95 grows, by more
+than the threshold (per-scenario overrides go in the baseline's
+"thresholds"). Exits 1 on regression or on failed requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from bench._util import checkout_event, stripe_signature, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES = {"inprocess": ROOT / "bench" / "baseline.json", "uvicorn": ROOT / "bench" / "baseline-uvicorn.json"}
+WEBHOOK_SECRET = "whsec_bench"
+PASSWORD = "bench-password"
+PREMIUM_USERS = 8
+
+class _NullSMTP:
+    """Accepts every message; stands in for the outbox's SMTP session."""
+
+    def noop(self):
+        return (250, b"OK")
+
+    def send_message(self, msg):
+        return {}
+
+    def quit(self):
+        pass
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    mode: str
+    tokens: List[str] = field(default_factory=list)
+    file_ids: List[str] = field(default_factory=list)
+
+    def auth(self, i: int) -> Dict[str, str]:
+        return {"authorization": f"Bearer {self.tokens[i % len(self.tokens)]}"}
+
+Request = Callable[[int], Awaitable[Tuple[bool, int]]]
+
+async def _load(n: int, concurrency: int, request: Request) -> Dict[str, Any]:
+    """Run request(0..n-1) with at most `concurrency` in flight."""
+    slots = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    received = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors, received
+        async with slots:
+            start = time.perf_counter()
+            ok, size = await request(i)
+            latencies.append(time.perf_counter() - start)
+        errors += not ok
+        received += size
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed)
+    result["errors"] = errors
+    if received:
+        result["mb_per_sec"] = round(received / elapsed / 1e6, 1)
+    return result
+
+# --- Scenarios ----------------------------------------------------------------
+
+async def auth_flow(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    """register -> verify -> login; one sample per completed flow."""
+    from app.db_sqlite import fetch_one
+
+    run = uuid.uuid4().hex[:8]
+
+    async def flow(i: int) -> Tuple[bool, int]:
+        email = f"flow{i}-{run}@bench.example.com"
+        r = await ctx.client.post("/auth/register", json={"email": email, "password": PASSWORD})
+        if r.status_code != 200:
+            return False, 0
+        row = fetch_one("SELECT verify_token FROM users WHERE email=?", (email,))
+        r = await ctx.client.get("/auth/verify", params={"token": row["verify_token"]})
+        if r.status_code != 200:
+            return False, 0
+        r = await ctx.client.post("/auth/login", json={"email": email, "password": PASSWORD})
+        return r.status_code == 200, 0
+
+    return await _load(n, concurrency, flow)
+
+async def premium_status(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    async def request(i: int) -> Tuple[bool, int]:
+        r = await ctx.client.get("/premium/status", headers=ctx.auth(i))
+        return r.status_code == 200, 0
+
+    return await _load(n, concurrency, request)
+
+async def resources(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    async def request(i: int) -> Tuple[bool, int]:
+        r = await ctx.client.get("/premium/resources", headers=ctx.auth(i))
+        return r.status_code == 200 and len(r.json()["items"]) > 0, 0
+
+    return await _load(n, concurrency, request)
+
+async def signed_url_local(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    async def request(i: int) -> Tuple[bool, int]:
+        file_id = ctx.file_ids[i % len(ctx.file_ids)]
+        r = await ctx.client.get(f"/premium/signed-url/{file_id}", headers=ctx.auth(i))
+        return r.status_code == 200 and r.json()["url"].startswith("/premium/download/"), 0
+
+    return await _load(n, concurrency, request)
+
+@contextmanager
+def _fake_s3() -> Iterator[None]:
+    """Presigning against a fake endpoint: signing is local, no request is made."""
+    from app import storage
+    from app.settings import settings
+
+    stand_in = {
+        "S3_ENDPOINT_URL": "http://s3.bench.invalid",
+        "S3_ACCESS_KEY_ID": "bench",
+        "S3_SECRET_ACCESS_KEY": "bench-secret",
+        "S3_BUCKET": "bench",
+    }
+    saved = {name: getattr(settings, name) for name in stand_in}
+    for name, value in stand_in.items():
+        setattr(settings, name, value)
+    storage.get_cfg.cache_clear()
+    storage._s3 = None
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(settings, name, value)
+        storage.get_cfg.cache_clear()
+        storage._s3 = None
+
+async def signed_url_s3(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    async def request(i: int) -> Tuple[bool, int]:
+        file_id = ctx.file_ids[i % len(ctx.file_ids)]
+        r = await ctx.client.get(f"/premium/signed-url/{file_id}", headers=ctx.auth(i))
+        return r.status_code == 200 and r.json()["url"].startswith("http://s3.bench.invalid"), 0
+
+    with _fake_s3():
+        return await _load(n, concurrency, request)
+
+async def signed_urls_s3(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    """The whole catalog in one /signed-urls call; compare with 13 signed_url_s3 requests."""
+    async def request(i: int) -> Tuple[bool, int]:
+        r = await ctx.client.get("/premium/signed-urls", headers=ctx.auth(i))
+        return r.status_code == 200 and all(item["url"].startswith("http://s3.bench.invalid")
+                                            for item in r.json()["items"]), 0
+
+    with _fake_s3():
+        return await _load(n, concurrency, request)
+
+async def download(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    """Full downloads of the real premium assets, round-robin."""
+    async def request(i: int) -> Tuple[bool, int]:
+        file_id = ctx.file_ids[i % len(ctx.file_ids)]
+        r = await ctx.client.get(f"/premium/download/{file_id}", headers=ctx.auth(i))
+        return r.status_code == 200, len(r.content)
+
+    return await _load(n, concurrency, request)
+
+async def bundle(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    """/premium/bundle: every local asset in one streamed ZIP."""
+    async def request(i: int) -> Tuple[bool, int]:
+        r = await ctx.client.get("/premium/bundle", headers=ctx.auth(i))
+        return r.status_code == 200 and len(r.content) == int(r.headers["content-length"]), len(r.content)
+
+    return await _load(n, concurrency, request)
+
+async def contact_burst(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    async def request(i: int) -> Tuple[bool, int]:
+        r = await ctx.client.post("/contact", json={
+            "name": f"Bench {i}", "email": f"contact{i}@bench.example.com", "message": "Bonjour, une question sur le TECFÉE.",
+        })
+        return r.status_code == 200, 0
+
+    return await _load(n, concurrency, request)
+
+async def login_rejected(ctx: Context, n: int, concurrency: int) -> Dict[str, Any]:
+    """/auth/login past its per-email limit: what a throttled client costs us."""
+    from app.settings import settings
+
+    email = f"throttled-{uuid.uuid4().hex[:8]}@bench.example.com"
+    body = {"email": email, "password": "wrong-password"}
+    settings.RATE_LIMIT_ENABLED = True
+    try:
+        while (await ctx.client.post("/auth/login", json=body)).status_code != 429:
+            pass
+
+        async def request(i: int) -> Tuple[bool, int]:
+            r = await ctx.client.post("/auth/login", json=body)
+            return r.status_code == 429, 0
+
+        return await _load(n, concurrency, request)
+    finally:
+        settings.RATE_LIMIT_ENABLED = False
+
+async def webhook_storm(ctx: Context, n: int, concurrency: int, duplicates: int = 4) -> Dict[str, Any]:
+    """Signed checkout events, each delivered `duplicates` times in a shuffled order."""
+    run = uuid.uuid4().int % 10**9
+    events = max(1, n // duplicates)
+    payloads = [checkout_event(run + i, f"premium{i % PREMIUM_USERS}@bench.example.com") for i in range(events)]
+    order = [p for p in payloads for _ in range(duplicates)]
+    order = order[::2] + order[1::2]  # spread duplicates apart
+
+    async def request(i: int) -> Tuple[bool, int]:
+        payload = order[i]
+        r = await ctx.client.post("/webhooks/stripe", content=payload, headers={
+            "stripe-signature": stripe_signature(payload, WEBHOOK_SECRET),
+            "content-type": "application/json",
+        })
+        return r.status_code == 200, 0
+
+    return await _load(len(order), concurrency, request)
+
+# name -> (scenario, requests at --scale 1, default concurrency, in-process only)
+SCENARIOS: Dict[str, Tuple[Callable[..., Awaitable[Dict[str, Any]]], int, int, bool]] = {
+    "auth_flow": (auth_flow, 40, 8, False),
+    "premium_status": (premium_status, 2000, 32, False),
+    "resources": (resources, 2000, 32, False),
+    "signed_url_local": (signed_url_local, 2000, 32, False),
+    "signed_url_s3": (signed_url_s3, 2000, 32, True),
+    "signed_urls_s3": (signed_urls_s3, 400, 32, True),
+    "download": (download, 300, 16, False),
+    "bundle": (bundle, 40, 4, False),
+    "contact_burst": (contact_burst, 2000, 64, False),
+    "webhook_storm": (webhook_storm, 2000, 64, False),
+    "login_rejected": (login_rejected, 2000, 32, True),
+}
+
+# --- Targets ------------------------------------------------------------------
+
+def _environment(tmp: Path) -> Dict[str, str]:
+    return {
+        "SQLITE_PATH": str(tmp / "bench.sqlite3"),
+        "CV_CACHE_DIR": str(tmp / "cv_cache"),
+        "CV_JOBS_DIR": str(tmp / "cv_jobs"),
+        "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "STRIPE_EVENT_POLL_SEC": "0.2",
+        "S3_ENDPOINT_URL": "",
+        "RATE_LIMIT_ENABLED": "false",  # one client IP; login_rejected turns it back on
+        # Empty SMTP_HOST: uvicorn workers fall back to printing (to /dev/null);
+        # in-process runs swap in _NullSMTP below.
+        "SMTP_HOST": "",
+    }
+
+def _seed_users() -> None:
+    from datetime import datetime, timezone
+    from app.db_sqlite import transaction
+    from app.security import hash_password
+
+    now = datetime.now(timezone.utc).isoformat()
+    password_hash = hash_password(PASSWORD)
+    with transaction() as conn:
+        for i in range(PREMIUM_USERS):
+            cur = conn.execute(
+                "INSERT INTO users(email,password_hash,created_at,is_active,email_verified) VALUES (?,?,?,1,1)",
+                (f"premium{i}@bench.example.com", password_hash, now),
+            )
+            conn.execute("INSERT INTO subscriptions(user_id,status,provider,updated_at) VALUES (?,?,?,?)",
+                         (cur.lastrowid, "active", "bench", now))
+
+async def _prepare(ctx: Context) -> None:
+    from app.catalog import ASSETS_DIR, PREMIUM_FILES
+
+    await asyncio.to_thread(_seed_users)
+    for i in range(PREMIUM_USERS):
+        r = await ctx.client.post("/auth/login", json={"email": f"premium{i}@bench.example.com", "password": PASSWORD})
+        r.raise_for_status()
+        ctx.tokens.append(r.json()["access_token"])
+    ctx.file_ids = [fid for fid, meta in PREMIUM_FILES.items() if (ASSETS_DIR / meta["filename"]).is_file()]
+
+async def _run_scenarios(ctx: Context, names: List[str], scale: float,
+                         concurrency: Optional[int]) -> Dict[str, Dict[str, Any]]:
+    await _prepare(ctx)
+    results = {}
+    for name in names:
+        scenario, n, default_concurrency, inprocess_only = SCENARIOS[name]
+        if inprocess_only and ctx.mode != "inprocess":
+            print(f"{name:18} skipped (in-process only)")
+            continue
+        result = await scenario(ctx, max(1, int(n * scale)), concurrency or default_concurrency)
+        results[name] = result
+        print(f"{name:18} {result['rps']:9.1f} req/s  p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}"
+              f"  p99 {result['p99_ms']:7.2f} ms  errors {result['errors']}")
+    return results
+
+async def run_inprocess(names: List[str], scale: float, concurrency: Optional[int]) -> Dict[str, Dict[str, Any]]:
+    from app import emailer
+    from app.main import app
+    from app.settings import settings
+
+    settings.SMTP_HOST = "smtp.bench.invalid"
+    emailer._open_smtp = _NullSMTP
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await _run_scenarios(Context(client, "inprocess"), names, scale, concurrency)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def run_uvicorn(names: List[str], scale: float, concurrency: Optional[int], workers: int,
+                      env: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env={**os.environ, **env}, stdout=subprocess.DEVNULL,
+    )
+    try:
+        limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise SystemExit("uvicorn did not start")
+                await asyncio.sleep(0.2)
+            return await _run_scenarios(Context(client, "uvicorn"), names, scale, concurrency)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+# --- Baseline comparison ------------------------------------------------------
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, slack_ms: float) -> List[str]:
+    """Regressions of `results` against `baseline`, as human-readable lines."""
+    problems = []
+    overrides = baseline.get("thresholds", {})
+    for name, cur in results["scenarios"].items():
+        if cur["errors"]:
+            problems.append(f"{name}: {cur['errors']} failed requests")
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        limit = overrides.get(name, threshold)
+        if cur["rps"] < base["rps"] * (1 - limit):
+            problems.append(f"{name}: {cur['rps']} req/s, baseline {base['rps']} (-{limit:.0%} allowed)")
+        # Sub-millisecond percentiles are noisy; the slack keeps them from flapping.
+        if cur["p95_ms"] > base["p95_ms"] * (1 + limit) + slack_ms:
+            problems.append(f"{name}: p95 {cur['p95_ms']} ms, baseline {base['p95_ms']} ms (+{limit:.0%} allowed)")
+    return problems
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append", help="default: all")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every scenario's request count")
+    parser.add_argument("--concurrency", type=int, help="override every scenario's concurrency")
+    parser.add_argument("--uvicorn", action="store_true", help="benchmark a multi-worker uvicorn server")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", type=Path, default=ROOT / "bench" / "results.json")
+    parser.add_argument("--baseline", type=Path, help="default: bench/baseline.json (baseline-uvicorn.json with --uvicorn)")
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed relative regression (default 0.3)")
+    parser.add_argument("--latency-slack-ms", type=float, default=2.0, help="absolute p95 slack on top of --threshold")
+    parser.add_argument("--update-baseline", action="store_true", help="write these results as the new baseline")
+    args = parser.parse_args()
+
+    mode = "uvicorn" if args.uvicorn else "inprocess"
+    names = args.scenario or list(SCENARIOS)
+    tmp = Path(tempfile.mkdtemp(prefix="bench-api-"))
+    env = _environment(tmp)
+    os.environ.update(env)  # before the app (and its settings) are imported
+    try:
+        if args.uvicorn:
+            scenarios = asyncio.run(run_uvicorn(names, args.scale, args.concurrency, args.workers, env))
+        else:
+            scenarios = asyncio.run(run_inprocess(names, args.scale, args.concurrency))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    results = {
+        "mode": mode,
+        "workers": args.workers if args.uvicorn else 1,
+        "scale": args.scale,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpus",
+        "scenarios": scenarios,
+    }
+    args.out.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    print(f"results written to {args.out}")
+
+    baseline_path = args.baseline or BASELINES[mode]
+    if args.update_baseline:
+        previous = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        results["thresholds"] = previous.get("thresholds", {})
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline updated: {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; run with --update-baseline to create one")
+        return
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline.get("mode") != mode or baseline.get("scale") != args.scale:
+        print(f"baseline is for mode={baseline.get('mode')} scale={baseline.get('scale')}; not comparing")
+        return
+    problems = compare(results, baseline, args.threshold, args.latency_slack_ms)
+    for line in problems:
+        print("REGRESSION", line)
+    if problems:
+        sys.exit(1)
+    print(f"no regression against {baseline_path} (threshold {args.threshold:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Cache latency within one worker and across workers, for both backends.
+
+    python -m bench.cache [--ops 20000] [--workers 4] [--rounds 200] [--out FILE]
+
+Runs on a scratch cache file with CACHE_BACKEND=sqlite, in this process
+and in helper processes started like uvicorn workers (spawned, so nothing
+is shared but the file). Reports p50/p99 in microseconds for:
+
+- get, local hit: the in-process TTLCache, then a SharedCache's local copy;
+- get, shared hit: a key another process set, read from the file;
+- get, miss;
+- set and incr from one process, then incr from --workers processes on one
+  counter at once (the final count is checked);
+- invalidation: another process deletes a key this one holds locally;
+  the time until get() here stops returning it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from bench._util import percentile
+
+def _configure(cache_path: str) -> None:
+    os.environ["CACHE_BACKEND"] = "sqlite"
+    os.environ["CACHE_SQLITE_PATH"] = cache_path
+    os.environ["CACHE_POLL_MS"] = os.environ.get("CACHE_POLL_MS", "2")
+
+def _timed(fn: Callable[[int], Any], n: int) -> List[float]:
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "ops": len(values),
+        "p50_us": round(percentile(values, 0.50) * 1e6, 1),
+        "p99_us": round(percentile(values, 0.99) * 1e6, 1),
+    }
+
+# --- Helper processes -----------------------------------------------------------
+
+def _setter(cache_path: str, ops: int, queue) -> None:
+    _configure(cache_path)
+    from app.cache import SharedCache
+    cache = SharedCache("bench", ops, 300)
+    queue.put(("set", _timed(lambda i: cache.set(("user", i), {"id": i, "status": "active"}), ops)))
+
+def _incrementer(cache_path: str, ops: int, start_at: float, queue) -> None:
+    _configure(cache_path)
+    from app.cache import SharedCache
+    cache = SharedCache("bench", 16, 300)
+    cache.incr("warm-up")
+    while time.time() < start_at:
+        time.sleep(0.001)
+    queue.put(("incr", _timed(lambda i: cache.incr("counter"), ops)))
+
+def _invalidator(cache_path: str, conn) -> None:
+    _configure(cache_path)
+    from app.cache import SharedCache
+    cache = SharedCache("bench", 16, 300)
+    while True:
+        key = conn.recv()
+        if key is None:
+            return
+        cache.set(key, "value")
+        conn.send("set")
+        conn.recv()  # the other side holds it locally now
+        sent = time.time()
+        cache.delete(key)
+        conn.send(sent)
+
+# --- Scenarios -----------------------------------------------------------------
+
+def run(ops: int, workers: int, rounds: int, cache_path: str) -> Dict[str, Any]:
+    _configure(cache_path)
+    from app.cache import SharedCache, TTLCache, start_cache, stop_cache, shared_cache_stats
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    results: Dict[str, Any] = {}
+
+    memory = TTLCache(ops, 300)
+    for i in range(ops):
+        memory.set(("user", i), {"id": i})
+    results["memory get (hit)"] = _summary(_timed(lambda i: memory.get(("user", i)), ops))
+
+    cache = SharedCache("bench", ops, 300)
+    start_cache()
+    try:
+        setter = ctx.Process(target=_setter, args=(cache_path, ops, queue))
+        setter.start()
+        _, set_latencies = queue.get()
+        setter.join()
+        results["shared set"] = _summary(set_latencies)
+        results["shared get (hit, set by another process)"] = _summary(_timed(lambda i: cache.get(("user", i)), ops))
+        results["shared get (local copy)"] = _summary(_timed(lambda i: cache.get(("user", i)), ops))
+        results["shared get (miss)"] = _summary(_timed(lambda i: cache.get(("absent", i)), ops))
+        results["shared incr (1 process)"] = _summary(_timed(lambda i: cache.incr("solo"), ops))
+
+        per_worker = max(1, ops // workers)
+        start_at = time.time() + 2.0
+        procs = [ctx.Process(target=_incrementer, args=(cache_path, per_worker, start_at, queue))
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        incr_latencies: List[float] = []
+        for _ in procs:
+            incr_latencies.extend(queue.get()[1])
+        for p in procs:
+            p.join()
+        counter = cache.get("counter")
+        results[f"shared incr ({workers} processes, one key)"] = {
+            **_summary(incr_latencies), "final": counter, "expected": per_worker * workers,
+        }
+
+        parent, child = ctx.Pipe()
+        invalidator = ctx.Process(target=_invalidator, args=(cache_path, child))
+        invalidator.start()
+        delays = []
+        for i in range(rounds):
+            key = f"inv-{i}"
+            parent.send(key)
+            parent.recv()
+            # Once the listener has applied the set's own event, a read leaves a local copy.
+            while cache.local.get(SharedCache._key(key)) is None:
+                cache.get(key)
+                time.sleep(0.001)
+            parent.send("go")
+            sent = parent.recv()
+            while cache.get(key) is not None:
+                time.sleep(0.0001)
+            delays.append(time.time() - sent)
+        parent.send(None)
+        invalidator.join()
+        results["invalidation seen by another process"] = _summary(delays)
+        results["listener"] = shared_cache_stats()
+    finally:
+        stop_cache()
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(args.ops, args.workers, args.rounds, os.path.join(tmp, "cache.sqlite3"))
+    listener = results.pop("listener")
+    print(f"{'operation':<46}{'ops':>8}{'p50 µs':>10}{'p99 µs':>10}")
+    for name, r in results.items():
+        print(f"{name:<46}{r['ops']:>8}{r['p50_us']:>10}{r['p99_us']:>10}")
+    print(f"\nlistener poll {os.environ['CACHE_POLL_MS']} ms, {listener['invalidations_received']} invalidations received")
+    incr = next(r for name, r in results.items() if "processes, one key" in name)
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if incr["final"] != incr["expected"]:
+        print(f"incr lost updates: {incr['final']} != {incr['expected']}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
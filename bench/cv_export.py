@@ -0,0 +1,87 @@
+"""CV export throughput, in documents per second per core.
+
+    python -m bench.cv_export [--seconds 3] [--workers N] [--format pdf|docx]
+
+Measures template compilation once, then steady-state rendering in this
+process (one core) and across a pool of worker processes.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.cv_export import load_templates, render
+
+SAMPLE_CV = {
+    "full_name": "Amina Diallo",
+    "title": "Enseignante de français langue seconde",
+    "summary": "Enseignante certifiée avec 8 ans d'expérience au primaire et au secondaire.\n"
+               "Prépare le TECFÉE et une demande d'autorisation d'enseigner au Québec.",
+    "email": "amina.diallo@example.com",
+    "phone": "+1 514 555 0199",
+    "city": "Montréal, QC",
+    "experiences": [
+        {"role": "Enseignante de français", "company": "Lycée Jean-Mermoz", "period": "2018 — 2024",
+         "details": ["Classes de 30 élèves, 6e à 3e", "Coordination du club de lecture", "Conception d'évaluations"]},
+        {"role": "Suppléante", "company": "CSS de Montréal", "period": "2024 — aujourd'hui",
+         "details": ["Remplacements au primaire", "Soutien aux élèves allophones"]},
+    ],
+    "education": [
+        {"degree": "Master MEEF Lettres", "school": "Université Cheikh Anta Diop", "period": "2016 — 2018"},
+        {"degree": "Licence de lettres modernes", "school": "Université Cheikh Anta Diop", "period": "2013 — 2016"},
+    ],
+    "skills": ["Différenciation pédagogique", "Gestion de classe", "Évaluation formative", "TNI / Google Classroom"],
+    "languages": ["Français (langue maternelle)", "Anglais (B2)", "Wolof"],
+}
+
+def _single(fmt: str, seconds: float) -> float:
+    render(fmt, SAMPLE_CV)  # warm-up
+    n, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        render(fmt, SAMPLE_CV)
+        n += 1
+    return n / (time.perf_counter() - start)
+
+def _pool(fmt: str, seconds: float, workers: int) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=load_templates) as pool:
+        list(pool.map(render, [fmt] * workers, [SAMPLE_CV] * workers))  # start and warm workers
+        n, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            batch = workers * 4
+            list(pool.map(render, [fmt] * batch, [SAMPLE_CV] * batch))
+            n += batch
+        return n / (time.perf_counter() - start)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--format", choices=["pdf", "docx"], action="append")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    load_templates()
+    results = {"compile_ms": (time.perf_counter() - start) * 1000, "workers": args.workers, "formats": {}}
+    for fmt in args.format or ["pdf", "docx"]:
+        single = _single(fmt, args.seconds)
+        pooled = _pool(fmt, args.seconds, args.workers)
+        results["formats"][fmt] = {
+            "docs_per_sec_1_core": round(single, 1),
+            "docs_per_sec_pool": round(pooled, 1),
+            "docs_per_sec_per_core": round(pooled / args.workers, 1),
+            "bytes": len(render(fmt, SAMPLE_CV)),
+        }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"template compile: {results['compile_ms']:.1f} ms, pool workers: {args.workers}")
+    for fmt, r in results["formats"].items():
+        print(f"{fmt:5} 1 core: {r['docs_per_sec_1_core']:8.1f} docs/s   pool: {r['docs_per_sec_pool']:8.1f} docs/s"
+              f"   per core: {r['docs_per_sec_per_core']:8.1f} docs/s   ({r['bytes']} bytes)")
+
+if __name__ == "__main__":
+    main()
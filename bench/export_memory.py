@@ -0,0 +1,63 @@
+"""Peak Python memory of a streamed admin export, by table size.
+
+    python -m bench.export_memory [--rows 10000 100000 300000] [--format csv|ndjson] [--gzip]
+
+Fills `contact_messages` in a scratch database, then consumes
+`/admin/export/contact_messages` in process and reports the tracemalloc
+peak for each size. The peak should not grow with the row count.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+def _fill(n: int) -> None:
+    from app.db_sqlite import transaction
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with transaction() as conn:
+        have = conn.execute("SELECT COUNT(*) n FROM contact_messages").fetchone()["n"]
+        conn.executemany(
+            "INSERT INTO contact_messages(name,email,message,created_at) VALUES (?,?,?,?)",
+            ((f"Client {i}", f"client{i}@example.com", "Bonjour, j'ai une question sur le TECFÉE. " * 4,
+              (start + timedelta(seconds=i)).isoformat()) for i in range(have, n)),
+        )
+
+async def _export(fmt: str, gzip: bool) -> int:
+    from app.routers.admin import export
+    response = export("contact_messages", format=fmt, gzip=gzip, since=None, until=None, admin=None)
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    return size
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SQLITE_PATH"] = os.path.join(tmp, "export.sqlite3")
+        from app.db_sqlite import init_db
+        init_db()
+        import app.routers.admin  # noqa: F401  (import outside the measurement)
+        results = []
+        for n in sorted(args.rows):
+            _fill(n)
+            tracemalloc.start()
+            start = time.perf_counter()
+            size = asyncio.run(_export(args.format, args.gzip))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({"rows": n, "bytes": size, "seconds": round(elapsed, 2),
+                            "rows_per_sec": round(n / elapsed), "peak_kib": round(peak / 1024)})
+            print(json.dumps(results[-1]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Flood POST /webhooks/stripe with signed, duplicated events.
+
+    python -m bench.webhook_flood [--events 200] [--duplicates 5] [--concurrency 50]
+
+Runs the app in-process against a scratch database. Every event is sent
+--duplicates times in random order, the way Stripe retries and replays
+look under load. Reports request throughput and latency, then waits for
+the background processor and checks that each event took effect exactly
+once. Exits 1 if it did not.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_bench")
+
+import httpx
+
+from app import db_sqlite
+from bench._util import checkout_event, stripe_signature, summarize
+
+async def run(events: int, duplicates: int, concurrency: int) -> int:
+    from app.main import app
+    from app.settings import settings
+    from app.stripe_events import event_stats
+
+    async with app.router.lifespan_context(app):
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        with db_sqlite.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO users(email,password_hash,created_at,is_active,email_verified) VALUES (?,?,?,1,1)",
+                [(f"user{i}@bench.local", "x", now) for i in range(events)],
+            )
+        payloads = [checkout_event(i, f"user{i}@bench.local") for i in range(events)]
+        sends = [p for p in payloads for _ in range(duplicates)]
+        random.shuffle(sends)
+
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+        statuses = {}
+        duplicate_acks = 0
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def send(payload: bytes) -> None:
+                nonlocal duplicate_acks
+                headers = {"stripe-signature": stripe_signature(payload, settings.STRIPE_WEBHOOK_SECRET),
+                           "content-type": "application/json"}
+                async with slots:
+                    start = time.perf_counter()
+                    r = await client.post("/webhooks/stripe", content=payload, headers=headers)
+                    latencies.append(time.perf_counter() - start)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                if r.status_code == 200 and r.json().get("duplicate"):
+                    duplicate_acks += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(send(p) for p in sends))
+            elapsed = time.perf_counter() - start
+
+        drain_start = time.perf_counter()
+        while event_stats()["pending"] and time.perf_counter() - drain_start < 60:
+            await asyncio.sleep(0.05)
+        drain_sec = time.perf_counter() - drain_start
+
+        stored = db_sqlite.fetch_one("SELECT COUNT(*) AS n FROM stripe_events")["n"]
+        subs = db_sqlite.fetch_one("SELECT COUNT(*) AS n FROM subscriptions WHERE status='active'")["n"]
+        stats = summarize(latencies, elapsed)
+
+    print(f"sent {len(sends)} requests ({events} events x {duplicates}) with concurrency {concurrency}")
+    print(f"  {stats['rps']} req/s  p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms")
+    print(f"  statuses {statuses}, duplicate acks {duplicate_acks}")
+    print(f"  processor drained in {drain_sec * 1000:.0f} ms")
+    print(f"  stored events {stored}/{events}, active subscriptions {subs}/{events}")
+    ok = (stored == events and subs == events and statuses.get(200) == len(sends)
+          and duplicate_acks == len(sends) - events)
+    print("OK: every event applied exactly once" if ok else "FAIL: duplicates or losses detected")
+    return 0 if ok else 1
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_sqlite.DB_PATH = Path(tmp) / "bench.sqlite3"
+        os.environ.setdefault("CV_CACHE_DIR", str(Path(tmp) / "cv_cache"))
+        os.environ.setdefault("CV_JOBS_DIR", str(Path(tmp) / "cv_jobs"))
+        sys.exit(asyncio.run(run(args.events, args.duplicates, args.concurrency)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Fail if any SQL query issued by the app does a full table scan.
+
+    python -m scripts.check_query_plans
+
+Collects every literal SQL string passed to fetch_one/fetch_all/execute/executemany/iter_rows
+(including conn.execute(...) inside db_async.write callbacks) in the app's modules,
+migrates a scratch database to the current schema, adds the tables of the side files
+(shared cache, rate limit buckets) and runs EXPLAIN QUERY PLAN on each query.
+SQL built at runtime (f-strings, variables) is reported as skipped.
+"""
+import ast
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+# The generic helpers (db_sqlite, db_async) and the schema itself are left out.
+EXCLUDED = {"db_sqlite.py", "db_async.py", "migrations.py"}
+SOURCES = [p for p in sorted((ROOT / "app").rglob("*.py")) if p.name not in EXCLUDED]
+DB_CALLS = {"fetch_one", "fetch_all", "execute", "executemany", "iter_rows"}
+# Tables that stay a handful of rows by design: scanning them is fine.
+SMALL_TABLES = {"maintenance_runs", "leases"}
+
+def _literal(node: ast.AST, constants: Dict[str, str]):
+    # Adjacent string literals are already joined by the parser; module-level
+    # constants (QUERY = "SELECT ...") are looked up.
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    return None
+
+def _constants(tree: ast.Module) -> Dict[str, str]:
+    return {target.id: node.value.value for node in tree.body if isinstance(node, ast.Assign)
+            and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+            for target in node.targets if isinstance(target, ast.Name)}
+
+def _planned(sql: str) -> bool:
+    # PRAGMAs, ANALYZE, transaction control, queries on SQLite's own tables
+    # and INSERT ... VALUES (which reads no table, and may target another
+    # file, like the maintenance archive) have no plan worth checking.
+    words = sql.split()
+    if not words or "sqlite_" in sql:
+        return False
+    verb = words[0].upper()
+    if verb == "INSERT":
+        return "SELECT" in sql.upper()
+    return verb in {"SELECT", "UPDATE", "DELETE", "WITH"}
+
+def collect_queries() -> Iterator[Tuple[str, int, str]]:
+    for path in SOURCES:
+        tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+        constants = _constants(tree)
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not node.args:
+                continue
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else getattr(func, "attr", None)
+            if name not in DB_CALLS:
+                continue
+            sql = _literal(node.args[0], constants)
+            if sql is None:
+                print(f"warning: {path.relative_to(ROOT)}:{node.lineno}: non-literal SQL skipped", file=sys.stderr)
+                continue
+            if not _planned(sql):
+                continue
+            yield str(path.relative_to(ROOT)), node.lineno, sql
+
+def full_scans(conn: sqlite3.Connection, sql: str) -> List[str]:
+    params = (None,) * sql.count("?")
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    # Walking an index in ORDER BY order stops after LIMIT rows (top-N): fine,
+    # unless a temp b-tree means every row is read and sorted first.
+    bounded = " LIMIT " in f" {' '.join(sql.upper().split())} " and not any("TEMP B-TREE" in d for d in plan)
+    return [d for d in plan if d.startswith("SCAN ") and "CONSTANT ROW" not in d
+            and d.split()[1] not in SMALL_TABLES
+            and not (bounded and " USING " in d and "INDEX" in d)]
+
+def main() -> int:
+    from app import db_sqlite
+    from app.cache import _SCHEMA as CACHE_SCHEMA
+    from app.migrations import migrate
+    from app.ratelimit import _SCHEMA as RATELIMIT_SCHEMA
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_sqlite.DB_PATH = Path(tmp) / "plans.sqlite3"
+        version = migrate()
+        db_sqlite.close_pool()
+        conn = sqlite3.connect(db_sqlite.DB_PATH)
+        for statement in (*CACHE_SCHEMA, *RATELIMIT_SCHEMA):
+            conn.execute(statement)
+        failures = 0
+        count = 0
+        for where, line, sql in collect_queries():
+            count += 1
+            scans = full_scans(conn, sql)
+            if scans:
+                failures += 1
+                print(f"FULL SCAN {where}:{line}: {' '.join(sql.split())}")
+                for detail in scans:
+                    print(f"    {detail}")
+        conn.close()
+    print(f"{count} queries checked against schema v{version}, {failures} with full table scans")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
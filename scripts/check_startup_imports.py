@@ -0,0 +1,41 @@
+"""Fail if starting the API imports a heavy SDK.
+
+    python -m scripts.check_startup_imports
+
+Imports app.main and runs the startup and shutdown hooks (warm-up off, with
+the database, caches and job files in a scratch directory), then checks
+that none of warmup.HEAVY_MODULES was loaded. Use `python -m scripts.profile_startup` to find what pulls one in.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Everything the app writes at startup goes to the scratch directory.
+        os.environ["SQLITE_PATH"] = os.path.join(tmp, "startup.sqlite3")
+        os.environ["CV_CACHE_DIR"] = os.path.join(tmp, "cv_cache")
+        os.environ["CV_JOBS_DIR"] = os.path.join(tmp, "cv_jobs")
+        os.environ["CACHE_SQLITE_PATH"] = os.path.join(tmp, "cache.sqlite3")
+        os.environ["RATE_LIMIT_SQLITE_PATH"] = os.path.join(tmp, "ratelimit.sqlite3")
+        os.environ["MAINTENANCE_ARCHIVE_PATH"] = os.path.join(tmp, "archive.sqlite3")
+        os.environ["STARTUP_WARMUP"] = "false"
+        from app.main import app
+        from app.warmup import HEAVY_MODULES
+
+        async def lifecycle() -> None:
+            await app.router.startup()
+            await app.router.shutdown()
+
+        asyncio.run(lifecycle())
+    loaded = sorted(name for name in sys.modules if name.partition(".")[0] in HEAVY_MODULES)
+    roots = sorted({name.partition(".")[0] for name in loaded})
+    if roots:
+        print(f"heavy modules imported at startup: {', '.join(roots)} ({len(loaded)} modules)")
+        return 1
+    print(f"startup imports none of: {', '.join(HEAVY_MODULES)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Run SQLite maintenance jobs now, outside the API's scheduler.
+
+    python -m scripts.maintenance --list                   # last run of each job
+    python -m scripts.maintenance                          # every job
+    python -m scripts.maintenance optimize wal_checkpoint  # specific jobs
+    python -m scripts.maintenance --enable-incremental-vacuum
+
+Jobs are batched and idempotent, so running them while the API is up is
+safe. --enable-incremental-vacuum switches a database created before
+auto_vacuum=INCREMENTAL was the default, with one full VACUUM: it rewrites
+the whole file and blocks writers meanwhile, so run it in a quiet period.
+"""
+import argparse
+import sys
+
+from app import db_sqlite
+from app.db_sqlite import init_db
+from app.maintenance import JOBS, maintenance_stats, run_job
+
+def main() -> int:
+    names = [job.name for job in JOBS]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("jobs", nargs="*", metavar="JOB", help=", ".join(names))
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    args = parser.parse_args()
+    unknown = set(args.jobs) - set(names)
+    if unknown:
+        parser.error(f"unknown job(s): {', '.join(sorted(unknown))}")
+    init_db()
+
+    if args.list:
+        for name, run in sorted(maintenance_stats()["jobs"].items()):
+            print(f"{name:24} {run['last_run_at']}  {run['status']:5} {run['rows']:>8} rows  {run['duration_ms']:8.1f} ms"
+                  + (f"  {run['error']}" if run["error"] else ""))
+        return 0
+
+    conn = db_sqlite.connect(db_sqlite.DB_PATH)
+    try:
+        if args.enable_incremental_vacuum:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                print("auto_vacuum is already INCREMENTAL")
+            else:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                print(f"auto_vacuum: {conn.execute('PRAGMA auto_vacuum').fetchone()[0]} (2 = INCREMENTAL)")
+            return 0
+        failed = 0
+        for job in JOBS:
+            if args.jobs and job.name not in args.jobs:
+                continue
+            result = run_job(conn, job)
+            failed += result["status"] != "ok"
+            print(f"{job.name:24} {result['status']:5} {result['rows']:>8} rows  {result['duration_ms']:8.1f} ms")
+        return 1 if failed else 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
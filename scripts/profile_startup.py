@@ -0,0 +1,99 @@
+"""Where a cold API worker spends its startup time.
+
+    python -m scripts.profile_startup [--top 15] [--runs 3]
+
+Reports `python -X importtime -c "import app.main"` grouped by top-level
+package and by module, then the time from launching `uvicorn app.main:app`
+to the first 200 from /health (fresh scratch database, no warm-up
+requests). Each measurement runs in a new process; the best of --runs is
+kept.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def import_times(env: Dict[str, str]) -> List[Tuple[str, int, int]]:
+    """(module, self µs, cumulative µs) for every module imported by app.main."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                          cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def first_response(env: Dict[str, str], timeout: float = 60.0) -> float:
+    """Seconds from spawning uvicorn to the first successful GET /health."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            if server.poll() is not None or time.perf_counter() - start > timeout:
+                raise SystemExit("uvicorn did not start")
+            time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "CV_CACHE_DIR": os.path.join(tmp, "cv-cache"), "CV_JOBS_DIR": os.path.join(tmp, "cv-jobs")}
+        runs = [import_times(env) for _ in range(args.runs)]
+        rows = min(runs, key=lambda r: sum(self_us for _, self_us, _ in r))
+        total = sum(self_us for _, self_us, _ in rows)
+
+        packages: Dict[str, int] = defaultdict(int)
+        for name, self_us, _ in rows:
+            packages[name.partition(".")[0]] += self_us
+        print(f"import app.main: {total / 1000:.0f} ms, {len(rows)} modules\n")
+        print(f"{'package':<32}{'ms':>9}{'share':>8}")
+        for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"{name:<32}{us / 1000:>9.1f}{us / total:>8.0%}")
+        print(f"\n{'module (self time)':<48}{'self ms':>9}{'cum ms':>9}")
+        for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[1])[:args.top]:
+            print(f"{name:<48}{self_us / 1000:>9.1f}{cumulative_us / 1000:>9.1f}")
+
+        times = []
+        for i in range(args.runs):
+            run_env = {**env, "SQLITE_PATH": os.path.join(tmp, f"startup-{i}.sqlite3")}
+            times.append(first_response(run_env))
+        print(f"\nuvicorn launch to first /health 200: {min(times) * 1000:.0f} ms "
+              f"(best of {args.runs}; {', '.join(f'{t * 1000:.0f}' for t in times)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Inspect and replay stored Stripe webhook events.
+
+    python -m scripts.replay_stripe_events --list [--status dead]
+    python -m scripts.replay_stripe_events --status dead          # requeue every dead event
+    python -m scripts.replay_stripe_events evt_123 evt_456        # requeue specific events
+    python -m scripts.replay_stripe_events --since 2026-01-01 --type checkout.session.completed
+
+Requeued events are applied by the running API's processor; pass --apply to
+process them right away from this command instead. Handlers are idempotent,
+so replaying an already processed event is safe.
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+from typing import List
+
+from app.db_sqlite import fetch_all, init_db
+from app.stripe_events import drain, replay
+
+def _select(args) -> List[dict]:
+    where: List[str] = []
+    params: List = []
+    if args.event_ids:
+        where.append(f"id IN ({','.join('?' * len(args.event_ids))})")
+        params += args.event_ids
+    if args.status:
+        where.append("status=?")
+        params.append(args.status)
+    if args.type:
+        where.append("type=?")
+        params.append(args.type)
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        where.append("created>=?")
+        params.append(int(since.timestamp()))
+    sql = "SELECT id,type,created,status,attempts,last_error FROM stripe_events"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return fetch_all(sql + " ORDER BY created, rowid", tuple(params))
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("event_ids", nargs="*")
+    parser.add_argument("--status", choices=["pending", "processed", "dead"])
+    parser.add_argument("--type")
+    parser.add_argument("--since", help="ISO date/time; matches the Stripe event 'created' time")
+    parser.add_argument("--list", action="store_true", help="only list matching events")
+    parser.add_argument("--apply", action="store_true", help="process requeued events in this process")
+    args = parser.parse_args()
+
+    init_db()
+    rows = _select(args)
+    for r in rows:
+        created = datetime.fromtimestamp(r["created"], timezone.utc).isoformat()
+        error = f"  {r['last_error']}" if r["last_error"] else ""
+        print(f"{r['id']}  {r['type']}  {created}  {r['status']}  attempts={r['attempts']}{error}")
+    if args.list:
+        return 0
+    if not (args.event_ids or args.status or args.type or args.since):
+        print("refusing to replay every event: pass event ids or a filter", file=sys.stderr)
+        return 2
+    count = replay([r["id"] for r in rows])
+    print(f"{count} event(s) requeued")
+    if args.apply:
+        drain()
+        print("applied")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
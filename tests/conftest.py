@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Before anything imports app.settings: every file the app writes goes to a
+# scratch directory.
+_TMP = tempfile.mkdtemp(prefix="eduquebec-tests-")
+os.environ.update({
+    "SQLITE_PATH": os.path.join(_TMP, "test.sqlite3"),
+    "CV_CACHE_DIR": os.path.join(_TMP, "cv_cache"),
+    "CV_JOBS_DIR": os.path.join(_TMP, "cv_jobs"),
+    "CACHE_SQLITE_PATH": os.path.join(_TMP, "cache.sqlite3"),
+    "RATE_LIMIT_SQLITE_PATH": os.path.join(_TMP, "ratelimit.sqlite3"),
+    "MAINTENANCE_ARCHIVE_PATH": os.path.join(_TMP, "archive.sqlite3"),
+    "STARTUP_WARMUP": "false",
+})
+
+@pytest.fixture(scope="session", autouse=True)
+def _database():
+    from app.db_sqlite import close_pool, init_db
+    from app.db_async import stop_db_async
+    init_db()
+    yield
+    stop_db_async()
+    close_pool()
+    shutil.rmtree(_TMP, ignore_errors=True)
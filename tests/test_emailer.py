@@ -0,0 +1,134 @@
+import asyncio
+import smtplib
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import pytest
+
+from app import emailer
+from app.db_sqlite import execute, fetch_all, fetch_one
+from app.settings import settings
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP; `fail` is raised by the next send_message calls."""
+
+    opened: List["FakeSMTP"] = []
+
+    def __init__(self):
+        self.sent: List[str] = []
+        self.fail: List[Exception] = []
+        self.noop_error: Optional[Exception] = None
+        self.closed = False
+        FakeSMTP.opened.append(self)
+
+    def noop(self):
+        if self.noop_error is not None:
+            raise self.noop_error
+        return (250, b"OK")
+
+    def send_message(self, msg):
+        if self.fail:
+            raise self.fail.pop(0)
+        self.sent.append(msg["To"])
+
+    def quit(self):
+        self.closed = True
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.opened = []
+    monkeypatch.setattr(settings, "SMTP_HOST", "smtp.test")
+    monkeypatch.setattr(settings, "EMAIL_RETRY_BASE_SEC", 30)
+    monkeypatch.setattr(settings, "EMAIL_RETRY_MAX_SEC", 3600)
+    monkeypatch.setattr(settings, "EMAIL_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(emailer, "_open_smtp", FakeSMTP)
+    monkeypatch.setattr(emailer.random, "uniform", lambda a, b: 1.0)  # no jitter
+    execute("DELETE FROM email_outbox")
+    sender = emailer.OutboxSender()
+    yield sender
+    sender.on_stop()
+
+def _enqueue(*recipients: str) -> List[int]:
+    return [asyncio.run(emailer.aenqueue_email(to, "Sujet", "<p>html</p>", text="texte")) for to in recipients]
+
+def _row(outbox_id: int):
+    return fetch_one("SELECT status,attempts,next_attempt_at,last_error FROM email_outbox WHERE id=?", (outbox_id,))
+
+def _make_due(outbox_id: int) -> None:
+    past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    execute("UPDATE email_outbox SET next_attempt_at=? WHERE id=?", (past, outbox_id))
+
+def test_batch_is_sent_over_one_reused_connection(smtp):
+    ids = _enqueue("a@example.com", "b@example.com", "c@example.com")
+    assert smtp.run_once() is True
+    _enqueue("d@example.com")
+    smtp.run_once()
+    assert len(FakeSMTP.opened) == 1
+    assert FakeSMTP.opened[0].sent == ["a@example.com", "b@example.com", "c@example.com", "d@example.com"]
+    assert all(_row(i)["status"] == "sent" and _row(i)["attempts"] == 1 for i in ids)
+    assert smtp.run_once() is False  # nothing left
+
+def test_dropped_session_is_reopened(smtp):
+    _enqueue("a@example.com")
+    smtp.run_once()
+    FakeSMTP.opened[0].noop_error = smtplib.SMTPServerDisconnected("gone")
+    _enqueue("b@example.com")
+    smtp.run_once()
+    assert len(FakeSMTP.opened) == 2
+    assert FakeSMTP.opened[0].closed
+    assert FakeSMTP.opened[1].sent == ["b@example.com"]
+
+def test_temporary_failure_is_retried_with_backoff(smtp):
+    (outbox_id,) = _enqueue("a@example.com")
+    smtp.run_once()  # opens the session
+    execute("UPDATE email_outbox SET status='pending' WHERE id=?", (outbox_id,))
+    _make_due(outbox_id)
+    FakeSMTP.opened[0].fail = [smtplib.SMTPDataError(451, b"try later"), smtplib.SMTPDataError(451, b"try later")]
+
+    smtp.run_once()
+    row = _row(outbox_id)
+    assert row["status"] == "pending" and row["attempts"] == 2
+    delay = datetime.fromisoformat(row["next_attempt_at"]) - datetime.now(timezone.utc)
+    assert timedelta(seconds=55) < delay <= timedelta(seconds=60)  # 30 s doubled for the second attempt
+    assert "451" in row["last_error"]
+    assert smtp.run_once() is False  # not due yet
+    assert len(FakeSMTP.opened) == 1  # an SMTP error reply keeps the session
+
+def test_backoff_doubles_up_to_the_cap(smtp):
+    assert [emailer._backoff_sec(n) for n in (1, 2, 3, 8)] == [30, 60, 120, 3600]
+
+def test_dead_lettered_after_max_attempts(smtp):
+    (outbox_id,) = _enqueue("a@example.com")
+    smtp._connection().fail = [smtplib.SMTPDataError(451, b"try later")] * settings.EMAIL_MAX_ATTEMPTS
+    for attempt in range(1, settings.EMAIL_MAX_ATTEMPTS + 1):
+        _make_due(outbox_id)
+        smtp.run_once()
+        assert _row(outbox_id)["attempts"] == attempt
+    assert _row(outbox_id)["status"] == "dead"
+    assert smtp.dead == 1 and smtp.retried == settings.EMAIL_MAX_ATTEMPTS - 1
+    _make_due(outbox_id)
+    assert smtp.run_once() is False  # never picked up again
+
+def test_refused_recipient_is_dead_lettered_at_once(smtp):
+    (outbox_id,) = _enqueue("nobody@example.com")
+    smtp._connection().fail = [smtplib.SMTPRecipientsRefused({"nobody@example.com": (550, b"no such user")})]
+    smtp.run_once()
+    row = _row(outbox_id)
+    assert row["status"] == "dead" and row["attempts"] == 1
+
+def test_expired_lease_is_claimed_again(smtp):
+    (outbox_id,) = _enqueue("a@example.com")
+    # A worker that died mid-batch left the row 'sending' with a lease now past.
+    execute("UPDATE email_outbox SET status='sending' WHERE id=?", (outbox_id,))
+    _make_due(outbox_id)
+    smtp.run_once()
+    assert _row(outbox_id)["status"] == "sent"
+
+def test_claimed_rows_are_leased(smtp):
+    _enqueue("a@example.com", "b@example.com")
+    batch = emailer._claim_batch(10)
+    assert len(batch) == 2
+    rows = fetch_all("SELECT status,next_attempt_at FROM email_outbox")
+    assert {r["status"] for r in rows} == {"sending"}
+    assert all(datetime.fromisoformat(r["next_attempt_at"]) > datetime.now(timezone.utc) for r in rows)
+    assert emailer._claim_batch(10) == []  # not claimable while the lease runs
@@ -0,0 +1,65 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from app import storage
+from app.settings import settings
+
+BUCKET = "eduquebec-test"
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in {
+        "S3_ENDPOINT_URL": "https://s3.us-east-1.amazonaws.com",
+        "S3_ACCESS_KEY_ID": "test",
+        "S3_SECRET_ACCESS_KEY": "test",
+        "S3_REGION": "us-east-1",
+        "S3_BUCKET": BUCKET,
+        "S3_PREFIX": "premium/",
+        "S3_SIGNED_URL_EXPIRES_SEC": 300,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    storage.get_cfg.cache_clear()
+    storage._urls.clear()
+    monkeypatch.setattr(storage, "_s3", None)
+    with moto.mock_aws():
+        client = storage._client()
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key="premium/DOC-1.pdf", Body=b"%PDF-1.4 test")
+        yield client
+    storage.get_cfg.cache_clear()
+    storage._urls.clear()
+
+def test_is_configured(s3):
+    assert storage.is_configured()
+
+def test_presigned_url_names_the_object_and_download(s3):
+    url = storage.presign_get_url("premium/DOC-1.pdf", "DOC-1.pdf")
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    assert parsed.path.endswith("/premium/DOC-1.pdf")
+    assert query["X-Amz-Expires"] == ["300"]
+    assert query["response-content-disposition"] == ['attachment; filename="DOC-1.pdf"']
+
+def test_signed_urls_are_reused_per_key_and_name(s3):
+    assert storage.cached_url("premium/DOC-1.pdf", "DOC-1.pdf") is None
+    signed = storage._signed
+    first = storage.presign_get_url("premium/DOC-1.pdf", "DOC-1.pdf")
+    assert storage.presign_get_url("premium/DOC-1.pdf", "DOC-1.pdf") == first
+    assert storage.cached_url("premium/DOC-1.pdf", "DOC-1.pdf") == first
+    assert storage._signed == signed + 1
+    other = storage.presign_get_url("premium/DOC-1.pdf", "autre.pdf")
+    assert other != first
+    assert storage._signed == signed + 2
+
+def test_batch_signing_keeps_the_order(s3):
+    items = [("premium/DOC-1.pdf", "DOC-1.pdf"), ("premium/DOC-2.pdf", None)]
+    urls = storage.presign_get_urls(items)
+    assert [urlparse(u).path.rsplit("/", 1)[1] for u in urls] == ["DOC-1.pdf", "DOC-2.pdf"]
+    assert urls[0] == storage.cached_url(*items[0])
+
+def test_head_object(s3):
+    assert storage.head_object("premium/DOC-1.pdf") == len(b"%PDF-1.4 test")
+    assert storage.head_object("premium/absent.pdf") is None